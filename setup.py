@@ -23,6 +23,10 @@ extras_require = {
         "twine",
         "wheel",
     ],
+    "compression": [
+        "lz4",
+        "zstandard",
+    ],
     "dialogflow": [
         "google-cloud-dialogflow",
     ],
@@ -31,6 +35,8 @@ extras_require = {
     ],
     "face-detection-dnn": [
         "matplotlib",
+        "onnx",
+        "onnxruntime",
         "pandas",
         "pyyaml",
         "torch",
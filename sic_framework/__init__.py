@@ -1,6 +1,45 @@
-from .core import sic_logging, utils
-from .core.actuator_python2 import SICActuator
-from .core.component_manager_python2 import SICComponentManager
-from .core.message_python2 import *
-from .core.sensor_python2 import SICSensor
-from .core.service_python2 import SICService
+import sys
+
+if sys.version_info < (3, 7):
+    # python 2 (e.g. on nao and pepper) does not support a module __getattr__, import everything
+    from .core import sic_logging, utils
+    from .core.actuator_python2 import SICActuator
+    from .core.component_manager_python2 import SICComponentManager
+    from .core.message_python2 import *
+    from .core.sensor_python2 import SICSensor
+    from .core.service_python2 import SICService
+    from .core.sic_redis import (
+        QOS_BOUNDED_FIFO,
+        QOS_DROP_NEWEST,
+        QOS_DROP_OLDEST,
+        QOS_LATEST_ONLY,
+        QOS_RELIABLE,
+        TRANSPORT_PUBSUB,
+        TRANSPORT_STREAM,
+        QoS,
+    )
+else:
+    from .core.utils import lazy_attributes
+
+    # Import the modules on first use, so importing a single module of the framework (e.g. a connector) does not
+    # import all others. See benchmarks/import_time.py.
+    __getattr__, __dir__ = lazy_attributes(
+        __name__,
+        {
+            "sic_logging": ".core.sic_logging",
+            "utils": ".core.utils",
+            "SICActuator": ".core.actuator_python2",
+            "SICComponentManager": ".core.component_manager_python2",
+            "SICSensor": ".core.sensor_python2",
+            "SICService": ".core.service_python2",
+            "QOS_BOUNDED_FIFO": ".core.sic_redis",
+            "QOS_DROP_NEWEST": ".core.sic_redis",
+            "QOS_DROP_OLDEST": ".core.sic_redis",
+            "QOS_LATEST_ONLY": ".core.sic_redis",
+            "QOS_RELIABLE": ".core.sic_redis",
+            "TRANSPORT_PUBSUB": ".core.sic_redis",
+            "TRANSPORT_STREAM": ".core.sic_redis",
+            "QoS": ".core.sic_redis",
+        },
+        star_module=".core.message_python2",
+    )
@@ -0,0 +1,83 @@
+"""
+Compare the lossless array codecs (see core/array_codecs.py) on a 640x480 16 bit depth map in millimeters and an
+8 bit grayscale image: the compressed size and the time to encode and decode. Codecs of which the library is not
+installed are skipped. Does not need redis.
+
+    python -m sic_framework.benchmarks.array_codecs --repeat 50
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from sic_framework.core import array_codecs
+
+
+def synthetic_depth_map(height=480, width=640):
+    """
+    A smooth scene (a sloped floor and a sphere) with sensor noise and invalid (zero) pixels, in millimeters.
+    """
+    rng = np.random.RandomState(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    depth = 4000 - 5 * y
+    sphere = (x - width / 2.0) ** 2 + (y - height / 2.0) ** 2 < 120**2
+    depth[sphere] = 1500 - 0.01 * ((x[sphere] - width / 2.0) ** 2)
+    depth += rng.normal(0, 4, depth.shape)
+    depth[rng.rand(height, width) < 0.02] = 0
+
+    return depth.clip(0, 65535).astype(np.uint16)
+
+
+def synthetic_grayscale(height=480, width=640):
+    """
+    A gradient with some texture and noise, roughly the entropy of a camera image.
+    """
+    rng = np.random.RandomState(1)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = 128 + 60 * np.sin(x / 40.0) * np.cos(y / 30.0) + rng.normal(0, 3, x.shape)
+    return image.clip(0, 255).astype(np.uint8)
+
+
+def measure(codec, array, repeat):
+    """
+    :return: (size in bytes, encode time in ms, decode time in ms)
+    """
+    start = time.time()
+    for _ in range(repeat):
+        buffer = codec.encode(array)
+    encode_ms = (time.time() - start) / repeat * 1000
+
+    start = time.time()
+    for _ in range(repeat):
+        decoded = codec.decode(buffer, array.dtype, array.shape)
+    decode_ms = (time.time() - start) / repeat * 1000
+
+    assert np.array_equal(decoded, array), "{} is not lossless".format(codec.name)
+    return len(buffer), encode_ms, decode_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("available codecs: {}".format(", ".join(array_codecs.get_available_codecs())))
+
+    for label, array in [
+        ("depth 640x480 uint16", synthetic_depth_map()),
+        ("grayscale 640x480 uint8", synthetic_grayscale()),
+    ]:
+        print("{} ({} bytes raw)".format(label, array.nbytes))
+        for name in array_codecs.get_available_codecs():
+            codec = array_codecs.get_codec(name)
+            if not codec.accepts(array):
+                continue
+
+            size, encode_ms, decode_ms = measure(codec, array, args.repeat)
+            print(
+                "    {:>5}: {:8d} bytes ({:5.1f}%), encode {:6.2f}ms, decode {:6.2f}ms".format(
+                    name, size, 100.0 * size / array.nbytes, encode_ms, decode_ms
+                )
+            )
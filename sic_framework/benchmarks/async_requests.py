@@ -0,0 +1,113 @@
+"""
+Compare sending requests to a slow component one by one with a blocking SICConnector, with sending them all at once
+with AsyncSICConnector and asyncio.gather, while iterating over the output of a sensor in the same event loop.
+
+The components run in a component manager thread in this process, and are reached through redis as any remote
+component. Requires a running redis server (see conf/redis/redis.conf).
+
+    python -m sic_framework.benchmarks.async_requests --requests 8 --delay 0.25
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from sic_framework.benchmarks.service_latency import (
+    BenchmarkFrameConf,
+    BenchmarkFrames,
+    BenchmarkFrameSensor,
+)
+from sic_framework.core.actuator_python2 import SICActuator
+from sic_framework.core.component_manager_python2 import SICComponentManager
+from sic_framework.core.connector import SICConnector
+from sic_framework.core.connector_asyncio import AsyncSICConnector
+from sic_framework.core.message_python2 import SICMessage, SICRequest
+from sic_framework.core.sic_redis import QOS_LATEST_ONLY, QoS
+
+
+class BenchmarkSleepRequest(SICRequest):
+    def __init__(self, delay):
+        super(BenchmarkSleepRequest, self).__init__()
+        self.delay = delay
+
+
+class BenchmarkSleepActuator(SICActuator):
+    # like a component waiting for a remote API
+    REQUEST_CONCURRENCY = 16
+
+    @staticmethod
+    def get_inputs():
+        return [BenchmarkSleepRequest]
+
+    @staticmethod
+    def get_output():
+        return SICMessage
+
+    def execute(self, request):
+        time.sleep(request.delay)
+        return SICMessage()
+
+
+class BenchmarkSleep(SICConnector):
+    component_class = BenchmarkSleepActuator
+
+
+async def run_async(n_requests, delay):
+    sleeper, frames = await asyncio.gather(
+        AsyncSICConnector.start(BenchmarkSleep),
+        AsyncSICConnector.start(BenchmarkFrames, conf=BenchmarkFrameConf(fps=30)),
+    )
+
+    n_frames = [0]
+
+    async def count_frames():
+        async for _ in frames.messages(qos=QoS(QOS_LATEST_ONLY)):
+            n_frames[0] += 1
+
+    counter = asyncio.ensure_future(count_frames())
+
+    start = time.time()
+    await asyncio.gather(
+        *[sleeper.request(BenchmarkSleepRequest(delay)) for _ in range(n_requests)]
+    )
+    elapsed = time.time() - start
+
+    counter.cancel()
+    await sleeper.stop()
+    await frames.stop()
+    return elapsed, n_frames[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.25)
+    args = parser.parse_args()
+
+    threading.Thread(
+        target=SICComponentManager,
+        args=([BenchmarkSleepActuator, BenchmarkFrameSensor],),
+        daemon=True,
+    ).start()
+    time.sleep(1)
+
+    sleeper = BenchmarkSleep()
+    start = time.time()
+    for _ in range(args.requests):
+        sleeper.request(BenchmarkSleepRequest(args.delay))
+    print(
+        "{} blocking requests of {}s: {:.3f}s".format(
+            args.requests, args.delay, time.time() - start
+        )
+    )
+
+    elapsed, n_frames = asyncio.run(run_async(args.requests, args.delay))
+    print(
+        "{} asyncio.gather requests of {}s: {:.3f}s ({} frames received meanwhile)".format(
+            args.requests, args.delay, elapsed, n_frames
+        )
+    )
+
+    os._exit(0)
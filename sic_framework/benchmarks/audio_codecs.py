@@ -0,0 +1,99 @@
+"""
+Measure the bandwidth and CPU time per second of audio of the lossless PCM codecs (see array_codecs.PCM16Codec)
+against raw PCM, for 250ms chunks like the desktop microphone sends. Uses a WAV file (16-bit mono) if given, or
+synthetic speech: voiced bursts with pauses over a noise floor. Does not need redis.
+
+    python -m sic_framework.benchmarks.audio_codecs --sample-rate 16000
+    python -m sic_framework.benchmarks.audio_codecs --wav recording.wav
+"""
+
+import argparse
+import time
+import wave
+
+import numpy as np
+
+from sic_framework.core import array_codecs
+from sic_framework.core.message_python2 import AudioMessage, SICMessage
+
+
+def synthetic_speech(sample_rate, seconds):
+    """
+    Harmonics of a wandering pitch, in syllable-like bursts separated by pauses, with background noise.
+    """
+    rng = np.random.RandomState(0)
+    t = np.arange(int(sample_rate * seconds)) / float(sample_rate)
+
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None) * (
+        np.sin(2 * np.pi * 0.2 * t) > -0.3
+    )
+
+    audio = 6000 * envelope * voiced + rng.normal(0, 20, t.shape)
+    return audio.clip(-32768, 32767).astype("<i2").tobytes()
+
+
+def read_wav(path):
+    audio = wave.open(path)
+    assert (
+        audio.getsampwidth() == 2 and audio.getnchannels() == 1
+    ), "Expected 16-bit mono audio"
+    return audio.readframes(audio.getnframes()), audio.getframerate()
+
+
+def measure(chunks, sample_rate, codecs):
+    """
+    Serialize and deserialize every chunk as an AudioMessage, and access its waveform.
+    :return: (bytes per second of audio, CPU milliseconds per second of audio to encode, and to decode)
+    """
+    n_bytes = 0
+    encode_time = 0
+    decode_time = 0
+    for i, chunk in enumerate(chunks):
+        message = AudioMessage(chunk, sample_rate, sequence_number=i)
+
+        start = time.process_time()
+        data = message.serialize(codecs=codecs)
+        encode_time += time.process_time() - start
+
+        start = time.process_time()
+        received = SICMessage.deserialize(data)
+        assert received.waveform == chunk
+        decode_time += time.process_time() - start
+
+        n_bytes += len(data)
+
+    seconds = sum(len(c) for c in chunks) / 2.0 / sample_rate
+    return n_bytes / seconds, encode_time / seconds * 1000, decode_time / seconds * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wav", help="a 16-bit mono WAV file to use instead")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--seconds", type=float, default=30)
+    args = parser.parse_args()
+
+    if args.wav:
+        audio, sample_rate = read_wav(args.wav)
+    else:
+        sample_rate = args.sample_rate
+        audio = synthetic_speech(sample_rate, args.seconds)
+
+    chunk_size = sample_rate // 4 * 2
+    chunks = [audio[i : i + chunk_size] for i in range(0, len(audio), chunk_size)]
+
+    print("{} Hz, {} chunks of 250ms".format(sample_rate, len(chunks)))
+    for name in ["raw"] + [
+        c for c in array_codecs.get_available_codecs() if c.startswith("pcm16")
+    ]:
+        bytes_per_second, encode_ms, decode_ms = measure(
+            chunks, sample_rate, [] if name == "raw" else [name]
+        )
+        print(
+            "    {:>10}: {:6.1f} KB/s, CPU per second of audio: encode {:5.2f}ms, decode {:5.2f}ms".format(
+                name, bytes_per_second / 1000, encode_ms, decode_ms
+            )
+        )
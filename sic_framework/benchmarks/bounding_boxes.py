@@ -0,0 +1,122 @@
+"""
+Measure the encode and decode time and the size of a BoundingBoxesMessage per number of boxes, stored as a structured
+array (see BoundingBoxesMessage) against the previous list of BoundingBox objects, which were pickled one by one.
+Decoding includes reading the coordinates of every box, once from the array and once through the bboxes list of
+BoundingBox objects. Does not need redis.
+
+    python -m sic_framework.benchmarks.bounding_boxes --boxes 10 50 200 1000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from sic_framework.core.message_python2 import BoundingBoxesMessage, SICMessage
+
+
+class ListBoundingBox(object):
+    """
+    BoundingBox as it was, with a __dict__.
+    """
+
+    def __init__(self, x, y, w, h, identifier=None, confidence=None):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.identifier = identifier
+        self.confidence = confidence
+
+
+class ListBoundingBoxesMessage(SICMessage):
+    """
+    BoundingBoxesMessage as it was, a list of bounding boxes.
+    """
+
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+
+
+def detections(n_boxes):
+    rng = np.random.RandomState(0)
+    xywh = rng.randint(0, 400, (n_boxes, 4))
+    confidences = rng.rand(n_boxes)
+    keypoints = rng.rand(n_boxes, 5, 3) * 400
+    return xywh, confidences, keypoints
+
+
+def measure(create, read, repeat):
+    """
+    :return: (size in bytes, encode time in us, decode time in us)
+    """
+    message = create()
+    start = time.time()
+    for i in range(repeat):
+        # assigning a field clears the cached serialized message
+        message._timestamp = float(i)
+        data = message.serialize()
+    encode_us = (time.time() - start) / repeat * 1e6
+
+    start = time.time()
+    for _ in range(repeat):
+        read(SICMessage.deserialize(data))
+    decode_us = (time.time() - start) / repeat * 1e6
+
+    return len(data), encode_us, decode_us
+
+
+def read_list(message):
+    return sum(bbox.x + bbox.y for bbox in message.bboxes)
+
+
+def read_array(message):
+    return float((message.boxes["x"] + message.boxes["y"]).sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boxes", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for n_boxes in args.boxes:
+        xywh, confidences, keypoints = detections(n_boxes)
+        cases = [
+            (
+                "list",
+                lambda: ListBoundingBoxesMessage(
+                    [
+                        ListBoundingBox(x, y, w, h, confidence=c)
+                        for (x, y, w, h), c in zip(xywh.tolist(), confidences.tolist())
+                    ]
+                ),
+                read_list,
+            ),
+            (
+                "array",
+                lambda: BoundingBoxesMessage.from_array(xywh, confidences),
+                read_array,
+            ),
+            (
+                "array, bboxes",
+                lambda: BoundingBoxesMessage.from_array(xywh, confidences),
+                read_list,
+            ),
+            (
+                "array, keypoints",
+                lambda: BoundingBoxesMessage.from_array(
+                    xywh, confidences, keypoints=keypoints
+                ),
+                read_array,
+            ),
+        ]
+
+        print("{} boxes".format(n_boxes))
+        for label, create, read in cases:
+            size, encode_us, decode_us = measure(create, read, args.repeat)
+            print(
+                "    {:>16}: {:7d} bytes, encode {:8.1f}us, decode and read {:8.1f}us".format(
+                    label, size, encode_us, decode_us
+                )
+            )
@@ -0,0 +1,123 @@
+"""
+Measure how much detection time DetectionCache saves on a camera watching a mostly static scene: a synthetic 640x480
+scene with sensor noise, in which a "person" (a bright rectangle) moves now and then. Runs a face detector on every
+frame, and with the cache, and reports the hit rate, the time per frame and how often the cache returned different
+faces than detecting would have. Uses the Haar cascade of the face detection service, or YOLOv7-face of the DNN face
+detection service if a model is given.
+
+    python -m sic_framework.benchmarks.detection_cache --frames 300 --motion 0.2 [--model yolov7-face.pt]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from sic_framework.core.detection_cache import DetectionCache
+
+CASCADE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "services",
+    "face_detection",
+    "haarcascade_frontalface_default.xml",
+)
+
+
+def make_frames(n_frames, motion, noise, seed=0):
+    """
+    :param motion: the fraction of frames in which the person moves
+    :param noise: the standard deviation of the sensor noise, in gray levels
+    """
+    rng = np.random.RandomState(seed)
+    background = cv2.GaussianBlur(
+        rng.randint(0, 256, (480, 640, 3)).astype(np.uint8), (31, 31), 0
+    )
+    x, y = 200, 120
+
+    frames = []
+    for _ in range(n_frames):
+        if rng.rand() < motion:
+            x = int(np.clip(x + rng.randint(-40, 41), 0, 640 - 160))
+            y = int(np.clip(y + rng.randint(-20, 21), 0, 480 - 200))
+
+        frame = background.copy()
+        cv2.rectangle(frame, (x, y), (x + 160, y + 200), (220, 180, 160), -1)
+        frame = frame.astype(np.int16) + rng.normal(0, noise, frame.shape).astype(
+            np.int16
+        )
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+
+def haar_detector():
+    cascade = cv2.CascadeClassifier(CASCADE_PATH)
+
+    def detect(image):
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        faces = cascade.detectMultiScale(
+            gray, scaleFactor=1.2, minNeighbors=5, minSize=(30, 30)
+        )
+        return np.asarray(faces).reshape(-1, 4)
+
+    return detect
+
+
+def dnn_detector(model_path):
+    from sic_framework.services.face_detection_dnn.face_detection_dnn import (
+        DNNFaceDetectionConf,
+    )
+    from sic_framework.services.face_detection_dnn.inference import YoloFaceDetector
+
+    detector = YoloFaceDetector(model_path)
+    params = DNNFaceDetectionConf()
+
+    def detect(image):
+        return detector.detect([image], params)[0].boxes
+
+    return detect
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument(
+        "--motion", type=float, default=0.2, help="fraction of frames with motion"
+    )
+    parser.add_argument("--noise", type=float, default=3.0)
+    parser.add_argument("--threshold", type=float, default=10.0)
+    parser.add_argument("--max-age", type=int, default=10)
+    parser.add_argument(
+        "--model", help="YOLOv7-face checkpoint, detect with the Haar cascade if not set"
+    )
+    args = parser.parse_args()
+
+    detect = dnn_detector(args.model) if args.model else haar_detector()
+    frames = make_frames(args.frames, args.motion, args.noise)
+
+    start = time.time()
+    expected = [detect(frame) for frame in frames]
+    uncached = time.time() - start
+
+    cache = DetectionCache(threshold=args.threshold, max_age=args.max_age)
+    start = time.time()
+    results = [cache.detect("camera", frame, detect) for frame in frames]
+    cached = time.time() - start
+
+    stale = sum(not np.array_equal(a, b) for a, b in zip(expected, results))
+    stats = cache.get_stats()
+    print(
+        "without cache: {:6.2f} ms per frame".format(uncached / args.frames * 1000)
+    )
+    print(
+        "with cache:    {:6.2f} ms per frame, {:.0%} of frames reused, "
+        "estimated {:.2f}s saved, {} frames with different faces".format(
+            cached / args.frames * 1000,
+            stats["hit_rate"],
+            stats["saved_seconds"],
+            stale,
+        )
+    )
@@ -0,0 +1,70 @@
+"""
+Compare the latency of the backends the DNN face detection can run YOLOv7-face with (see
+face_detection_dnn.inference): eager PyTorch, TorchScript and ONNX Runtime, optionally with int8 quantization, per
+input size. Runs on the CPU, does not need redis.
+
+    python -m sic_framework.benchmarks.face_detection_backends --model yolov7-face.pt --sizes 320 480 640
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from sic_framework.services.face_detection_dnn.inference import load_backends
+
+
+def measure(backend, images, repeat):
+    """
+    :return: the median latency in ms
+    """
+    # warm up, the first call is slower
+    backend(images)
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.time()
+        backend(images)
+        latencies.append(time.time() - start)
+    return np.median(latencies) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True, help="Path to the checkpoint")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[320, 480, 640])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--quantize", action="store_true", help="also run the int8 ONNX model"
+    )
+    parser.add_argument("--threads", type=int, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    print(
+        "batch size {}, {} torch threads".format(
+            args.batch_size, torch.get_num_threads()
+        )
+    )
+    for size in args.sizes:
+        # the TorchScript and ONNX backends are converted for one input size
+        backends = load_backends(
+            args.model, "auto", quantize=args.quantize, input_shape=(size, size)
+        )
+        images = torch.rand(args.batch_size, 3, size, size)
+        print(
+            "{}x{}: {}".format(
+                size,
+                size,
+                ", ".join(
+                    "{} {:.1f}ms".format(
+                        backend.name, measure(backend, images, args.repeat)
+                    )
+                    for backend in backends
+                ),
+            )
+        )
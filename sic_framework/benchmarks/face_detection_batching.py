@@ -0,0 +1,107 @@
+"""
+Measure the throughput and latency of the DNN face detection for several simulated cameras at once, with different
+maximum batch sizes (see face_detection_dnn.inference.BatchedInference). Every camera is a thread that sends its
+next frame as soon as it got the detections of the previous one, like the callback thread of a connected camera
+channel does. Runs the model in this process, does not need redis.
+
+    python -m sic_framework.benchmarks.face_detection_batching --model yolov7-face.pt --streams 4 --batch-sizes 1 2 4
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from sic_framework.services.face_detection_dnn.face_detection_dnn import (
+    DNNFaceDetectionConf,
+)
+from sic_framework.services.face_detection_dnn.inference import (
+    BatchedInference,
+    YoloFaceDetector,
+)
+
+
+def camera(inference, image, n_frames, latencies):
+    for _ in range(n_frames):
+        start = time.time()
+        inference.submit(image).result()
+        latencies.append(time.time() - start)
+
+
+def measure(detector, conf, images, n_frames, max_batch_size):
+    """
+    :return: (total frames per second, mean latency per frame in ms, mean batch size)
+    """
+    batch_sizes = []
+
+    def process_batch(batch):
+        batch_sizes.append(len(batch))
+        return detector.detect(batch, conf)
+
+    inference = BatchedInference(
+        process_batch, max_batch_size=max_batch_size, max_delay=conf.max_batch_delay
+    )
+
+    # warm up
+    inference.submit(images[0]).result()
+    del batch_sizes[:]
+
+    latencies = []
+    threads = [
+        threading.Thread(target=camera, args=(inference, image, n_frames, latencies))
+        for image in images
+    ]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    inference.close()
+    return (
+        len(latencies) / elapsed,
+        np.mean(latencies) * 1000,
+        np.mean(batch_sizes),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True, help="Path to the model file")
+    parser.add_argument("--streams", type=int, default=4, help="simulated cameras")
+    parser.add_argument("--frames", type=int, default=20, help="frames per camera")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--delay", type=float, default=0.01, help="max_batch_delay")
+    parser.add_argument("--conf-threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    detector = YoloFaceDetector(args.model)
+    conf = DNNFaceDetectionConf(
+        conf_threshold=args.conf_threshold, max_batch_delay=args.delay
+    )
+
+    rng = np.random.RandomState(0)
+    images = [
+        rng.randint(0, 256, (args.height, args.width, 3)).astype(np.uint8)
+        for _ in range(args.streams)
+    ]
+
+    print(
+        "{} streams of {}x{} on {}".format(
+            args.streams, args.width, args.height, detector.device
+        )
+    )
+    for max_batch_size in args.batch_sizes:
+        fps, latency_ms, mean_batch = measure(
+            detector, conf, images, args.frames, max_batch_size
+        )
+        print(
+            "    max batch {:2d}: {:6.1f} fps in total, latency {:7.1f}ms, mean batch {:.1f}".format(
+                max_batch_size, fps, latency_ms, mean_batch
+            )
+        )
@@ -0,0 +1,94 @@
+"""
+Measure the time to import the framework, a device and the services, each in a fresh interpreter with
+`python -X importtime`, and check it against a budget to catch regressions (e.g. a heavy dependency that is imported
+at module level again). Exits with status 1 if a module takes longer than its budget. Python 3.7+.
+
+    python -m sic_framework.benchmarks.import_time --top 10
+
+Modules of which a dependency is not installed are skipped.
+"""
+
+import argparse
+import subprocess
+import sys
+
+# import time budgets in milliseconds, a few times the time on a laptop to allow for slower machines
+BUDGETS_MS = {
+    "sic_framework": 50,
+    "sic_framework.core.connector": 750,
+    "sic_framework.devices": 100,
+    "sic_framework.devices.desktop": 1500,
+    "sic_framework.services.face_detection_dnn": 1000,
+    "sic_framework.services.face_recognition_dnn": 1000,
+}
+
+
+def measure_import(module):
+    """
+    Import the module in a new interpreter.
+    :param module: the name of the module
+    :return: (cumulative import time of the module in ms, list of (self time in ms, name) of all imports), or None
+             if the module could not be imported
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        print(
+            "{}: could not be imported ({})".format(
+                module, stderr.strip().splitlines()[-1]
+            )
+        )
+        return None
+
+    imports = []
+    total_ms = None
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        imports.append((int(self_us) / 1000.0, name.strip()))
+        if name.strip() == module:
+            total_ms = int(cumulative_us) / 1000.0
+
+    return total_ms, imports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "modules", nargs="*", default=list(BUDGETS_MS), help="modules to import"
+    )
+    parser.add_argument(
+        "--top", type=int, default=0, help="show the N slowest imports per module"
+    )
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        result = measure_import(module)
+        if result is None:
+            continue
+        total_ms, imports = result
+
+        budget = BUDGETS_MS.get(module)
+        print(
+            "{}: {:.1f}ms{}".format(
+                module,
+                total_ms,
+                " (budget {}ms)".format(budget) if budget is not None else "",
+            )
+        )
+        for self_ms, name in sorted(imports, reverse=True)[: args.top]:
+            print("    {:8.1f}ms {}".format(self_ms, name))
+
+        if budget is not None and total_ms > budget:
+            over_budget.append(module)
+
+    if over_budget:
+        print("Over budget: {}".format(", ".join(over_budget)))
+        sys.exit(1)
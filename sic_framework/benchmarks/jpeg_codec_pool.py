@@ -0,0 +1,64 @@
+"""
+Measure how many received CompressedImageMessages per second can be decoded with the JPEG codec pool disabled and
+with 1, 2 and 4 workers, and how fast messages are handled by a consumer that never accesses the image. Does not
+require redis.
+
+    python -m sic_framework.benchmarks.jpeg_codec_pool --n 200 --width 1280 --height 960
+"""
+
+import argparse
+import time
+
+from sic_framework.benchmarks.message_serialization import make_frame
+from sic_framework.core import message_python2
+from sic_framework.core.message_python2 import CompressedImageMessage, SICMessage
+
+
+def frames_per_second(data, access_image):
+    start = time.perf_counter()
+
+    # deserialize all frames as they would arrive, then consume them in order
+    messages = [SICMessage.deserialize(d) for d in data]
+    for message in messages:
+        if access_image:
+            message.image
+        else:
+            message._timestamp
+
+    return len(data) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=960)
+    args = parser.parse_args()
+
+    frame = make_frame(args.width, args.height)
+    data = [CompressedImageMessage(frame).serialize() for _ in range(args.n)]
+
+    print("{}x{}, {} frames".format(args.width, args.height, args.n))
+
+    message_python2.set_codec_workers(0)
+    print(
+        "{:<24} {:8.1f} fps".format(
+            "metadata only", frames_per_second(data, access_image=False)
+        )
+    )
+    print(
+        "{:<24} {:8.1f} fps".format(
+            "decode on access", frames_per_second(data, access_image=True)
+        )
+    )
+
+    for n_workers in [1, 2, 4]:
+        message_python2.set_codec_workers(n_workers)
+        print(
+            "{:<24} {:8.1f} fps".format(
+                "pool ({} workers)".format(n_workers),
+                frames_per_second(data, access_image=True),
+            )
+        )
+
+    message_python2.set_codec_workers(0)
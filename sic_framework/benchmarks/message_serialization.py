@@ -0,0 +1,123 @@
+"""
+Compare the encode/decode latency and size of the framed SICMessage wire format with the legacy pickle format, for
+camera frames and audio chunks, and of serializing a message for several channels, as SICRedis.send_message does
+when it is published to several channels. Does not require redis. That the message is encoded only once is tested
+in tests/test_sic_redis.py.
+
+    python -m sic_framework.benchmarks.message_serialization --n 50
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from sic_framework.core.message_python2 import (
+    AudioMessage,
+    CompressedImageMessage,
+    SICMessage,
+    UncompressedImageMessage,
+)
+
+
+def make_frame(width, height):
+    # a smooth image, random noise is not representative for JPEG compression
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([x + 0 * y, 0 * x + y, (x + y) / 2], axis=-1)
+    return frame.astype(np.uint8)
+
+
+def make_audio(sample_rate, seconds=0.25):
+    t = np.arange(int(sample_rate * seconds)) / float(sample_rate)
+    return (np.sin(2 * np.pi * 440 * t) * 10000).astype("<i2").tobytes()
+
+
+def timed(function, n):
+    """
+    :return: mean time per call in milliseconds and the last result
+    """
+    total = 0
+    result = None
+    for _ in range(n):
+        start = time.perf_counter()
+        result = function()
+        total += time.perf_counter() - start
+    return total / n * 1000, result
+
+
+def benchmark(name, make_message, n):
+    for format_name in ["pickle", "framed"]:
+        # exclude creating the message from the timing, as the pickle format mutates the message
+        messages = [make_message() for _ in range(n)]
+        if format_name == "pickle":
+            encode_ms, data = timed(lambda: messages.pop()._serialize_pickle(), n)
+        else:
+            encode_ms, data = timed(lambda: messages.pop().serialize(), n)
+
+        # fields are decoded lazily, so decode them all to compare with the (eager) pickle format
+        decode_ms, _ = timed(lambda: SICMessage.deserialize(data)._decode_fields(), n)
+
+        print(
+            "{:<36} {:<7} encode: {:7.3f}ms  decode: {:7.3f}ms  size: {:>9} bytes".format(
+                name, format_name, encode_ms, decode_ms, len(data)
+            )
+        )
+
+
+def fan_out(frame, n_channels):
+    """
+    Serialize one message once per channel, as SICRedis.send_message does when publishing it to several channels,
+    and count the JPEG encodes.
+    """
+    n_encodes = [0]
+    np2jpeg = SICMessage.np2jpeg
+
+    def counting_np2jpeg(inp):
+        n_encodes[0] += 1
+        return np2jpeg(inp)
+
+    SICMessage.np2jpeg = staticmethod(counting_np2jpeg)
+    try:
+        message = CompressedImageMessage(frame)
+        start = time.perf_counter()
+        for _ in range(n_channels):
+            message.serialize()
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        SICMessage.np2jpeg = staticmethod(np2jpeg)
+
+    print(
+        "Fan-out to {} channels: {:.3f}ms, {} JPEG encode(s)".format(
+            n_channels, elapsed, n_encodes[0]
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50)
+    args = parser.parse_args()
+
+    for width, height in [(640, 480), (1280, 960)]:
+        frame = make_frame(width, height)
+        benchmark(
+            "CompressedImageMessage {}x{}".format(width, height),
+            lambda: CompressedImageMessage(frame),
+            args.n,
+        )
+        benchmark(
+            "UncompressedImageMessage {}x{}".format(width, height),
+            lambda: UncompressedImageMessage(frame),
+            args.n,
+        )
+
+    for sample_rate in [16000, 44100]:
+        waveform = make_audio(sample_rate)
+        benchmark(
+            "AudioMessage 250ms {}Hz".format(sample_rate),
+            lambda: AudioMessage(waveform, sample_rate=sample_rate),
+            args.n,
+        )
+
+    fan_out(make_frame(640, 480), n_channels=4)
@@ -0,0 +1,94 @@
+"""
+Measure the frame rate the NAOqi camera sensor can achieve per resolution, on the robot itself: getting an image
+from ALVideoDevice, turning it into a CompressedImageMessage and serializing it (JPEG compressing it). Compares the
+previous path that copied every image three times ("copy"), the zero-copy RGB path ("rgb") and, if the installed
+TurboJPEG supports it, JPEG compressing the native YUV422 images ("yuv"). See NaoqiFrameEncoder.
+
+    python -m sic_framework.benchmarks.naoqi_camera --resolutions 1 2 3 --frames 100
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+import numpy as np
+import qi
+from PIL import Image
+
+from sic_framework.core.message_python2 import CompressedImageMessage
+from sic_framework.devices.common_naoqi.naoqi_camera import (
+    RGB_COLORSPACE,
+    YUV422_COLORSPACE,
+    NaoqiFrameEncoder,
+)
+
+RESOLUTIONS = {0: "160x120", 1: "320x240", 2: "640x480", 3: "1280x960"}
+
+
+def encode_with_copies(nao_image):
+    """
+    The conversion the camera sensor used before NaoqiFrameEncoder.
+    """
+    image_string = str(bytearray(nao_image[6]))
+    image = Image.frombytes("RGB", (nao_image[0], nao_image[1]), image_string)
+    return CompressedImageMessage(np.asarray(image))
+
+
+def measure(video_service, cam_id, res_id, mode, n_frames):
+    """
+    :return: (frames per second, ms per frame spent in getImageRemote)
+    """
+    colorspace = YUV422_COLORSPACE if mode == "yuv" else RGB_COLORSPACE
+    client = video_service.subscribeCamera(
+        "Benchmark_{}".format(random.randint(0, 100000)), cam_id, res_id, colorspace, 30
+    )
+    encoder = NaoqiFrameEncoder(from_yuv=mode == "yuv")
+    encode = encode_with_copies if mode == "copy" else encoder.encode
+
+    try:
+        get_time = 0
+        start = time.time()
+        for _ in range(n_frames):
+            t = time.time()
+            nao_image = video_service.getImageRemote(client)
+            get_time += time.time() - t
+
+            encode(nao_image).serialize()
+
+        elapsed = time.time() - start
+    finally:
+        video_service.unsubscribe(client)
+
+    return n_frames / elapsed, get_time / n_frames * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--cam-id", type=int, default=0)
+    parser.add_argument(
+        "--resolutions", type=int, nargs="+", default=[1, 2, 3], help="NAOqi res_ids"
+    )
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+
+    session = qi.Session()
+    session.connect("tcp://{}:9559".format(args.ip))
+    video_service = session.service("ALVideoDevice")
+
+    modes = ["copy", "rgb"]
+    if NaoqiFrameEncoder.supports_yuv():
+        modes.append("yuv")
+    else:
+        print("TurboJPEG can not compress YUV images, skipping the yuv path")
+
+    for res_id in args.resolutions:
+        for mode in modes:
+            fps, get_ms = measure(video_service, args.cam_id, res_id, mode, args.frames)
+            print(
+                "{:>9} {:>4}: {:5.1f} fps (getImageRemote {:.1f}ms per frame)".format(
+                    RESOLUTIONS.get(res_id, res_id), mode, fps, get_ms
+                )
+            )
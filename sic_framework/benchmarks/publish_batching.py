@@ -0,0 +1,100 @@
+"""
+Compare publishing small messages one by one with publishing them in batches (SICRedis.set_channel_batching). Sends
+log-line sized messages as fast as possible, and at a fixed rate like joint angles streamed at 100 Hz. Reports how
+long send_message blocks the sender and the latency until the message is received.
+
+The receiver runs in this process, but in-process delivery is disabled so all messages go through redis. The gain is
+larger when redis is on another machine, e.g. a laptop streaming from a robot over wifi. Requires a running redis
+server (see conf/redis/redis.conf).
+
+    python -m sic_framework.benchmarks.publish_batching --messages 2000 --rate 100
+"""
+
+import argparse
+import threading
+import time
+
+from sic_framework.core import sic_redis
+from sic_framework.core.message_python2 import SICMessage
+from sic_framework.core.sic_redis import SICRedis
+
+
+class BenchmarkJointAngles(SICMessage):
+    def __init__(self, sent, angles):
+        self.sent = sent
+        self.angles = angles
+
+
+def measure(sender, receiver, channel, n_messages, rate):
+    latencies = []
+    done = threading.Event()
+
+    def on_message(message):
+        latencies.append(time.time() - message.sent)
+        if len(latencies) == n_messages:
+            done.set()
+
+    receiver.register_message_handler(channel, on_message)
+    time.sleep(0.5)
+
+    send_time = 0
+    start = time.time()
+    for i in range(n_messages):
+        if rate:
+            delay = start + i / float(rate) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        t = time.time()
+        sender.send_message(channel, BenchmarkJointAngles(t, [0.1] * 26))
+        send_time += time.time() - t
+
+    done.wait(30)
+    total_time = time.time() - start
+    latencies.sort()
+    return (
+        total_time,
+        send_time / n_messages,
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)],
+        len(latencies),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument(
+        "--rate", type=float, default=100, help="messages per second of the rate test"
+    )
+    args = parser.parse_args()
+
+    sic_redis.IN_PROCESS_DELIVERY = False
+    sender = SICRedis(parent_name="benchmark_sender")
+    receiver = SICRedis(parent_name="benchmark_receiver")
+
+    for rate in [0, args.rate]:
+        for batched in [False, True]:
+            channel = "benchmark:batching:{}:{}".format(rate, batched)
+            if batched:
+                sender.set_channel_batching(channel)
+
+            total_time, send_ms, median_ms, p99_ms, n_received = measure(
+                sender, receiver, channel, args.messages, rate
+            )
+            print(
+                "{:>10} {:>14}: {:.3f}s, send_message {:.3f}ms, latency median {:.2f}ms p99 {:.2f}ms, "
+                "received {}/{}".format(
+                    "batched" if batched else "one by one",
+                    "{:g} Hz".format(rate) if rate else "max rate",
+                    total_time,
+                    send_ms * 1000,
+                    median_ms * 1000,
+                    p99_ms * 1000,
+                    n_received,
+                    args.messages,
+                )
+            )
+
+    sender.close()
+    receiver.close()
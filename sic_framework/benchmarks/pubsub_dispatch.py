@@ -0,0 +1,105 @@
+"""
+Compare the shared SICRedis pubsub dispatcher with the previous approach of one pubsub connection and one polling
+thread per registered handler. Reports the process CPU time while idle and while receiving messages, the number of
+threads and the number of redis client connections.
+
+Requires a running redis server (see conf/redis/redis.conf).
+
+    python -m sic_framework.benchmarks.pubsub_dispatch --channels 50
+"""
+
+import argparse
+import threading
+import time
+
+from sic_framework.core.message_python2 import SICMessage
+from sic_framework.core.sic_redis import SICRedis
+
+
+def count_connections(sic_redis):
+    return sic_redis._redis.info("clients")["connected_clients"]
+
+
+def register_legacy(sic_redis, channels, callback):
+    """
+    The previous way of registering handlers: a pubsub connection and a polling thread per channel.
+    """
+    threads = []
+    for channel in channels:
+        pubsub = sic_redis._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(
+            **{channel: lambda msg: callback(SICRedis.parse_pubsub_message(msg))}
+        )
+        threads.append(pubsub.run_in_thread(sleep_time=0.1, daemon=True))
+    return threads
+
+
+def measure(name, sic_redis, channels, idle_seconds, n_messages):
+    received = [0]
+    done = threading.Event()
+
+    def on_message(message):
+        received[0] += 1
+        if received[0] == n_messages * len(channels):
+            done.set()
+
+    baseline_connections = count_connections(sic_redis)
+
+    if name == "legacy":
+        legacy_threads = register_legacy(sic_redis, channels, on_message)
+    else:
+        for channel in channels:
+            sic_redis.register_message_handler(channel, on_message)
+
+    time.sleep(0.5)
+
+    connections = count_connections(sic_redis) - baseline_connections
+    n_threads = threading.active_count()
+
+    start = time.process_time()
+    time.sleep(idle_seconds)
+    idle_cpu = time.process_time() - start
+
+    message = SICMessage()
+    start_wall, start = time.time(), time.process_time()
+    for _ in range(n_messages):
+        for channel in channels:
+            sic_redis.send_message(channel, message)
+    done.wait(timeout=30)
+    busy_cpu = time.process_time() - start
+    busy_wall = time.time() - start_wall
+
+    print(
+        "{:<8} connections: {:>4}  threads: {:>4}  idle cpu: {:6.3f}s/{}s  "
+        "{} messages: {:6.3f}s cpu {:6.3f}s wall".format(
+            name,
+            connections,
+            n_threads,
+            idle_cpu,
+            idle_seconds,
+            received[0],
+            busy_cpu,
+            busy_wall,
+        )
+    )
+
+    if name == "legacy":
+        for t in legacy_threads:
+            t.stop()
+        for t in legacy_threads:
+            t.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--idle", type=float, default=5.0)
+    parser.add_argument("--messages", type=int, default=100)
+    args = parser.parse_args()
+
+    channels = ["benchmark:dispatch:{}".format(i) for i in range(args.channels)]
+
+    for name in ["legacy", "shared"]:
+        r = SICRedis(parent_name="benchmark_{}".format(name))
+        measure(name, r, channels, args.idle, args.messages)
+        r.close()
@@ -0,0 +1,76 @@
+"""
+Measure the time to start the redis clients of a device with many components, and the number of sockets they keep
+open. Each simulated component creates a SICRedis, a logger, a request handler and sends a log message, as a
+SICComponent does when it is started by a device such as Nao(...) or Desktop(). Each simulated connector creates a
+SICRedis and sends a request.
+
+Requires a running redis server (see conf/redis/redis.conf). Counts sockets on Linux only.
+
+    python -m sic_framework.benchmarks.redis_startup --components 14 --connectors 14
+"""
+
+import argparse
+import os
+import time
+
+from sic_framework.core import sic_logging
+from sic_framework.core.message_python2 import SICMessage, SICRequest
+from sic_framework.core.sic_redis import SICRedis
+
+
+def count_sockets():
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return None
+
+    n_sockets = 0
+    for fd in fds:
+        try:
+            if os.readlink(os.path.join("/proc/self/fd", fd)).startswith("socket:"):
+                n_sockets += 1
+        except OSError:
+            pass
+    return n_sockets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--components", type=int, default=14)
+    parser.add_argument("--connectors", type=int, default=14)
+    args = parser.parse_args()
+
+    sockets_before = count_sockets()
+    start = time.time()
+
+    components = []
+    for i in range(args.components):
+        r = SICRedis(parent_name="benchmark_component_{}".format(i))
+        logger = sic_logging.get_sic_logger(r, "benchmark_component_{}".format(i), 20)
+        r.register_request_handler(
+            "benchmark:reqreply:{}".format(i), lambda request: SICMessage()
+        )
+        logger.info("started")
+        components.append(r)
+    components_time = time.time() - start
+
+    connectors = []
+    for i in range(args.connectors):
+        r = SICRedis()
+        r.request("benchmark:reqreply:{}".format(i % args.components), SICRequest())
+        connectors.append(r)
+    total_time = time.time() - start
+
+    sockets = count_sockets()
+    print(
+        "{} components: {:.3f}s, with {} connectors: {:.3f}s, open sockets: {}".format(
+            args.components,
+            components_time,
+            args.connectors,
+            total_time,
+            sockets - sockets_before if sockets is not None else "unknown",
+        )
+    )
+
+    for r in connectors + components:
+        r.close()
@@ -0,0 +1,52 @@
+"""
+Measure the round trip time of blocking SICRedis requests, and the time to send messages without waiting for a reply.
+
+Requires a running redis server (see conf/redis/redis.conf). Both clients run in this process, so messages are handed
+over in-process. Set SIC_IN_PROCESS=0 to measure the round trip through redis.
+
+    python -m sic_framework.benchmarks.request_latency --n 1000
+"""
+
+import argparse
+import time
+
+from sic_framework.core.message_python2 import SICMessage, SICRequest
+from sic_framework.core.sic_redis import SICRedis
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1000)
+    args = parser.parse_args()
+
+    server = SICRedis(parent_name="benchmark_server")
+    client = SICRedis(parent_name="benchmark_client")
+
+    server.register_request_handler("benchmark:request", lambda request: SICMessage())
+    time.sleep(0.5)
+
+    # warm up, the first request subscribes to the reply inbox
+    client.request("benchmark:request", SICRequest())
+
+    latencies = []
+    for _ in range(args.n):
+        start = time.time()
+        client.request("benchmark:request", SICRequest())
+        latencies.append(time.time() - start)
+
+    latencies.sort()
+    print(
+        "{} requests took {:.3f}s (p50: {:.2f}ms p99: {:.2f}ms)".format(
+            args.n,
+            sum(latencies),
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+        )
+    )
+
+    start = time.time()
+    for _ in range(args.n):
+        client.send_message("benchmark:message", SICMessage())
+    print("{} send_message took {:.3f}s".format(args.n, time.time() - start))
+
+    client.close()
+    server.close()
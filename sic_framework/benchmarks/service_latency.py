@@ -0,0 +1,168 @@
+"""
+Measure the end-to-end delay from a camera sensor, through a SICService, to the output received by the application:
+the time between the timestamp of a frame at its origin and the arrival of the service output. Reports percentiles of
+the delay and the CPU time of the component process while idle.
+
+The components run in a separate component manager process by default, so messages are sent through redis. Use
+--in-process to run them in a component manager thread in this process, as a Desktop does.
+
+Requires a running redis server (see conf/redis/redis.conf).
+
+    python -m sic_framework.benchmarks.service_latency --frames 300 --fps 30
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from sic_framework.benchmarks.message_serialization import make_frame
+from sic_framework.core.component_manager_python2 import SICComponentManager
+from sic_framework.core.connector import SICConnector
+from sic_framework.core.message_python2 import (
+    CompressedImageMessage,
+    SICConfMessage,
+    SICMessage,
+    SICRequest,
+)
+from sic_framework.core.sensor_python2 import SICSensor
+from sic_framework.core.service_python2 import SICService
+
+
+class BenchmarkFrameConf(SICConfMessage):
+    def __init__(self, fps=30, width=640, height=480):
+        SICConfMessage.__init__(self)
+        self.fps = fps
+        self.width = width
+        self.height = height
+
+
+class BenchmarkFrameSensor(SICSensor):
+    def __init__(self, *args, **kwargs):
+        super(BenchmarkFrameSensor, self).__init__(*args, **kwargs)
+        self.frame = make_frame(self.params.width, self.params.height)
+
+    @staticmethod
+    def get_conf():
+        return BenchmarkFrameConf()
+
+    @staticmethod
+    def get_inputs():
+        return []
+
+    @staticmethod
+    def get_output():
+        return CompressedImageMessage
+
+    def execute(self):
+        time.sleep(1.0 / self.params.fps)
+        return CompressedImageMessage(self.frame)
+
+
+class BenchmarkCPUTimeRequest(SICRequest):
+    pass
+
+
+class BenchmarkCPUTimeMessage(SICMessage):
+    def __init__(self, cpu_time):
+        self.cpu_time = cpu_time
+
+
+class BenchmarkPassthroughService(SICService):
+    @staticmethod
+    def get_inputs():
+        return [CompressedImageMessage]
+
+    @staticmethod
+    def get_output():
+        return CompressedImageMessage
+
+    def on_request(self, request):
+        return BenchmarkCPUTimeMessage(time.process_time())
+
+    def execute(self, inputs):
+        # decode the image, as any service using it would
+        return CompressedImageMessage(inputs.get(CompressedImageMessage).image)
+
+
+class BenchmarkFrames(SICConnector):
+    component_class = BenchmarkFrameSensor
+
+
+class BenchmarkPassthrough(SICConnector):
+    component_class = BenchmarkPassthroughService
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--idle", type=float, default=5.0)
+    parser.add_argument("--in-process", action="store_true")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    component_list = [BenchmarkFrameSensor, BenchmarkPassthroughService]
+
+    if args.serve:
+        SICComponentManager(component_list)
+        sys.exit()
+
+    manager_process = None
+    if args.in_process:
+        threading.Thread(
+            target=SICComponentManager, args=(component_list,), daemon=True
+        ).start()
+    else:
+        manager_process = subprocess.Popen(
+            [sys.executable, "-m", "sic_framework.benchmarks.service_latency", "--serve"],
+            env=dict(os.environ),
+        )
+    time.sleep(2)
+
+    # measure the CPU use of the service while it has no input
+    service = BenchmarkPassthrough()
+    start = service.request(BenchmarkCPUTimeRequest()).cpu_time
+    time.sleep(args.idle)
+    idle_cpu = service.request(BenchmarkCPUTimeRequest()).cpu_time - start
+
+    delays = []
+    done = threading.Event()
+
+    def on_output(message):
+        delays.append(time.time() - message._timestamp)
+        if len(delays) == args.frames:
+            done.set()
+
+    frames = BenchmarkFrames(conf=BenchmarkFrameConf(fps=args.fps))
+    service.connect(frames)
+    service.register_callback(on_output)
+    done.wait(timeout=args.frames / float(args.fps) * 3 + 10)
+
+    delays = sorted(delays[: args.frames])
+    print(
+        "{} frames at {} fps ({}): p50: {:.2f}ms  p90: {:.2f}ms  p99: {:.2f}ms  max: {:.2f}ms".format(
+            len(delays),
+            args.fps,
+            "in-process" if args.in_process else "through redis",
+            percentile(delays, 50) * 1000,
+            percentile(delays, 90) * 1000,
+            percentile(delays, 99) * 1000,
+            delays[-1] * 1000,
+        )
+    )
+    print(
+        "component process cpu while idle: {:.3f}s/{}s".format(idle_cpu, args.idle)
+    )
+
+    service.stop()
+    frames.stop()
+    if manager_process is not None:
+        manager_process.terminate()
+    os._exit(0)
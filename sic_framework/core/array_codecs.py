@@ -0,0 +1,298 @@
+"""
+Lossless codecs to compress the numpy array and binary (bytes) fields of a SICMessage with, such as depth maps,
+grayscale images and audio. A message class lists the codecs to use per field in SICMessage._field_codecs, e.g.:
+
+    class DepthMessage(SICMessage):
+        _field_codecs = {"depth": ("png", "zstd", "zlib")}
+
+Binary fields are passed to the codecs as a one dimensional uint8 array.
+
+Which codecs are available depends on the installed libraries, zlib is always available. Subscribers register the
+codecs they support (see SICRedis._register_host), and the sender uses the first codec of the field that it and all
+subscribers of the channel support, or sends the array uncompressed. Arrays sent through shared memory or to
+subscribers in the same process are never compressed.
+
+Custom codecs can be added with register_codec.
+"""
+
+import io
+import zlib
+
+import numpy as np
+import six
+
+from . import utils
+
+
+def _array_bytes(array):
+    """
+    The raw memory of a numpy array, without copying it if the array is contiguous (python 3).
+    """
+    array = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+    if six.PY3:
+        return memoryview(array)
+    return array.tostring()
+
+
+class ArrayCodec(object):
+    """
+    A lossless codec for numpy arrays. Subclasses set the name, which identifies the codec on all devices, and
+    implement encode and decode.
+    """
+
+    name = None
+
+    def is_available(self):
+        """
+        Whether the libraries the codec needs are installed. Should not import them, as it is checked by every process
+        that subscribes to a channel, see get_available_codecs.
+        """
+        return True
+
+    def accepts(self, array):
+        """
+        Whether the codec can encode the array.
+        """
+        return True
+
+    def encode(self, array):
+        """
+        :param array: the numpy array to encode
+        :return: the encoded bytes
+        """
+        raise NotImplementedError()
+
+    def decode(self, buffer, dtype, shape):
+        """
+        :param buffer: the encoded bytes
+        :param dtype: the numpy dtype of the array
+        :param shape: the shape of the array
+        :return: the decoded numpy array
+        """
+        raise NotImplementedError()
+
+
+class ZlibCodec(ArrayCodec):
+    """
+    zlib (deflate) from the python standard library, available on all devices.
+    """
+
+    name = "zlib"
+    LEVEL = 1
+
+    def encode(self, array):
+        return zlib.compress(_array_bytes(array), self.LEVEL)
+
+    def decode(self, buffer, dtype, shape):
+        return np.frombuffer(zlib.decompress(buffer), dtype=dtype).reshape(shape)
+
+
+class LZ4Codec(ArrayCodec):
+    """
+    LZ4 frames, very fast but with a lower compression ratio. Requires the lz4 package.
+    """
+
+    name = "lz4"
+
+    def is_available(self):
+        return utils.is_installed("lz4")
+
+    def encode(self, array):
+        import lz4.frame
+
+        return lz4.frame.compress(_array_bytes(array))
+
+    def decode(self, buffer, dtype, shape):
+        import lz4.frame
+
+        return np.frombuffer(lz4.frame.decompress(buffer), dtype=dtype).reshape(
+            shape
+        )
+
+
+class ZstdCodec(ArrayCodec):
+    """
+    Zstandard, a better compression ratio than LZ4 at a somewhat higher cost. Requires the zstandard package.
+    """
+
+    name = "zstd"
+    LEVEL = 3
+
+    def is_available(self):
+        return utils.is_installed("zstandard")
+
+    def encode(self, array):
+        import zstandard
+
+        # compressors are not thread safe, and cheap to create
+        return zstandard.ZstdCompressor(level=self.LEVEL).compress(
+            _array_bytes(array)
+        )
+
+    def decode(self, buffer, dtype, shape):
+        import zstandard
+
+        data = zstandard.ZstdDecompressor().decompress(buffer)
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+
+class PNGCodec(ArrayCodec):
+    """
+    PNG for single channel 8 or 16 bit images, such as grayscale images and depth maps in millimeters. Filters each
+    row against the previous one before compressing, which suits smooth images. Requires Pillow or OpenCV.
+    """
+
+    name = "png"
+    LEVEL = 1
+
+    def is_available(self):
+        return utils.is_installed("PIL") or utils.is_installed("cv2")
+
+    def accepts(self, array):
+        return (
+            array.dtype in (np.uint8, np.uint16)
+            and array.size > 0
+            and (array.ndim == 2 or (array.ndim == 3 and array.shape[2] == 1))
+        )
+
+    def encode(self, array):
+        array = np.ascontiguousarray(array.reshape(array.shape[:2]))
+
+        try:
+            from PIL import Image
+        except ImportError:
+            import cv2
+
+            _, buffer = cv2.imencode(
+                ".png", array, [cv2.IMWRITE_PNG_COMPRESSION, self.LEVEL]
+            )
+            return buffer.tostring() if six.PY2 else buffer.tobytes()
+
+        output = io.BytesIO()
+        Image.fromarray(array).save(output, format="PNG", compress_level=self.LEVEL)
+        return output.getvalue()
+
+    def decode(self, buffer, dtype, shape):
+        try:
+            from PIL import Image
+        except ImportError:
+            import cv2
+
+            array = cv2.imdecode(
+                np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_UNCHANGED
+            )
+        else:
+            array = np.array(Image.open(io.BytesIO(bytes(buffer))))
+
+        # older versions of Pillow read 16 bit images as 32 bit integers
+        return array.astype(dtype, copy=False).reshape(shape)
+
+
+class PCM16Codec(ArrayCodec):
+    """
+    16-bit signed little endian PCM audio, as an int16 array or its raw bytes, compressed in the style of FLAC. Each
+    sample is predicted from the previous ones with a fixed polynomial predictor (the order that fits the chunk best,
+    up to MAX_ORDER), and the prediction errors, which are small for audio, are compressed with another codec.
+    Interleaved multi-channel audio works, but compresses less well.
+    """
+
+    MAX_ORDER = 2
+
+    def __init__(self, name, compressor):
+        """
+        :param name: the name of the codec
+        :param compressor: the ArrayCodec to compress the prediction errors with
+        """
+        self.name = name
+        self.compressor = compressor
+
+    def is_available(self):
+        return self.compressor.is_available()
+
+    def accepts(self, array):
+        return array.ndim == 1 and (
+            array.dtype == np.int16 or (array.dtype == np.uint8 and array.size % 2 == 0)
+        )
+
+    def encode(self, array):
+        samples = np.ascontiguousarray(array).view("<i2")
+
+        # the residuals of order n are the differences between consecutive residuals of order n - 1. int16 arithmetic
+        # wraps around, which the decoder undoes exactly.
+        residuals = samples
+        best_order, best_residuals, best_cost = 0, samples, None
+        for order in range(self.MAX_ORDER + 1):
+            if order > 0:
+                residuals = np.concatenate((residuals[:1], np.diff(residuals)))
+            cost = np.abs(residuals.astype(np.int32)).sum()
+            if best_cost is None or cost < best_cost:
+                best_order, best_residuals, best_cost = order, residuals, cost
+
+        # zigzag encode (0, -1, 1, -2, ... to 0, 1, 2, 3, ...) and store all low bytes before the high bytes, which are
+        # mostly zero
+        zigzag = (best_residuals.view("<u2") << 1) ^ (best_residuals >> 15).view("<u2")
+        planes = zigzag.view(np.uint8).reshape(-1, 2).T.reshape(-1)
+
+        return six.int2byte(best_order) + bytes(self.compressor.encode(planes))
+
+    def decode(self, buffer, dtype, shape):
+        order = bytearray(buffer[:1])[0]
+        n_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+        planes = self.compressor.decode(buffer[1:], np.uint8, (n_bytes,))
+        zigzag = np.ascontiguousarray(planes.reshape(2, -1).T).view("<u2").reshape(-1)
+        samples = ((zigzag >> 1) ^ (0 - (zigzag & 1))).view("<i2")
+
+        for _ in range(order):
+            samples = np.cumsum(samples, dtype=np.int16)
+
+        return samples.view(dtype).reshape(shape)
+
+
+_codecs = dict()
+_available_codecs = None
+
+
+def register_codec(codec):
+    """
+    Add a codec, to be used by the fields that list its name in SICMessage._field_codecs.
+    :param codec: an ArrayCodec instance
+    """
+    global _available_codecs
+
+    _codecs[codec.name] = codec
+    _available_codecs = None
+
+
+def get_codec(name):
+    """
+    :return: the codec with this name, or None if it is unknown or its libraries are not installed on this device
+    """
+    if name not in get_available_codecs():
+        return None
+    return _codecs[name]
+
+
+def get_available_codecs():
+    """
+    The names of the codecs this device can encode and decode. Checked once, without importing their libraries.
+    :rtype: list[str]
+    """
+    global _available_codecs
+
+    if _available_codecs is None:
+        _available_codecs = sorted(
+            name for name, codec in _codecs.items() if codec.is_available()
+        )
+    return _available_codecs
+
+
+for _codec in (
+    ZlibCodec(),
+    LZ4Codec(),
+    ZstdCodec(),
+    PNGCodec(),
+    PCM16Codec("pcm16-zlib", ZlibCodec()),
+    PCM16Codec("pcm16-zstd", ZstdCodec()),
+):
+    register_codec(_codec)
@@ -4,6 +4,8 @@ import time
 from signal import SIGINT, SIGTERM, signal
 from sys import exit
 
+import six
+
 import sic_framework.core.sic_logging
 from sic_framework.core.utils import (
     MAGIC_STARTED_COMPONENT_MANAGER_TEXT,
@@ -70,7 +72,12 @@ class SICComponentManager(object):
 
         # The _handle_request function is calls execute directly, as we must reply when execution done to allow the user
         # to wait for this. New messages will be buffered by redis. The component manager listens to
-        self.redis.register_request_handler(self.ip, self._handle_request)
+        self.redis.register_request_handler(
+            self.ip,
+            self._handle_request,
+            # handle stop requests while a component is starting
+            is_priority=lambda request: is_sic_instance(request, SICStopRequest),
+        )
 
         # TODO FIXME
         # self._sync_time()
@@ -90,12 +97,14 @@ class SICComponentManager(object):
         """
         Listen for requests until this component manager is signaled to stop running.
         """
-        # wait for the signal to stop, loop is necessary for ctrl-c to work on python2
+        # wait for the signal to stop, loop is necessary for ctrl-c to work on python2. On python3 waiting is
+        # interrupted by ctrl-c as well.
         try:
-            while True:
-                self.stop_event.wait(timeout=0.1)
-                if self.stop_event.is_set():
-                    break
+            if six.PY3:
+                self.stop_event.wait()
+            else:
+                while not self.stop_event.is_set():
+                    self.stop_event.wait(timeout=0.1)
         except KeyboardInterrupt:
             pass
 
@@ -18,18 +18,20 @@ from .message_python2 import (
     SICStopRequest,
     SICSuccessMessage,
 )
-from .sic_redis import SICRedis
+from .sic_redis import TRANSPORT_PUBSUB, SICRedis
 
 
 class ConnectRequest(SICControlRequest):
-    def __init__(self, channel):
+    def __init__(self, channel, qos=None):
         """
         A request for this component to start listening to the output of another component. The provided channel should
         be the output channel of the component that serves as input to this component.
         :param channel: the channel
+        :param qos: the QoS to handle the messages on this channel with, by default the INPUT_QOS of the component
         """
         super(ConnectRequest, self).__init__()
         self.channel = channel  # str
+        self.qos = qos  # QoS
 
 
 class SICComponent:
@@ -43,6 +45,17 @@ class SICComponent:
     # For example, when the robot has to stand up or model parameters need to load to GPU this might be set higher
     COMPONENT_STARTUP_TIMEOUT = 2
 
+    # How input messages are queued while on_message is busy, see sic_redis.QoS. By default, all messages are queued.
+    INPUT_QOS = None
+
+    # The transport of the output channel, see SICRedis.set_channel_transport. By default, redis pubsub.
+    OUTPUT_TRANSPORT = None
+
+    # The number of requests on_request handles at the same time, and the number of requests that can wait for that
+    # (by default unlimited). Control requests, such as pings, are always handled right away.
+    REQUEST_CONCURRENCY = 1
+    REQUEST_QUEUE_DEPTH = None
+
     def __init__(
         self, ready_event=None, stop_event=None, log_level=sic_logging.INFO, conf=None
     ):
@@ -59,6 +72,9 @@ class SICComponent:
 
         # Redis initialization
         self._redis = SICRedis(parent_name=self.get_component_name())
+        self._redis.set_channel_transport(
+            self._output_channel, self.OUTPUT_TRANSPORT or TRANSPORT_PUBSUB
+        )
 
         # Initialize logging and enable redis to log any exeptions as well
         self.logger = self._get_logger(log_level)
@@ -92,9 +108,14 @@ class SICComponent:
         Start the service. Should be called by overriding functions to communicate the service
         has started successfully.
         """
-        # register a request handler to handle control requests, e.g. ConnectRequest
+        # register a request handler to handle control requests, e.g. ConnectRequest, on a lane of their own so
+        # they are not held up by requests for on_request
         self._redis.register_request_handler(
-            self.get_request_reply_channel(self._ip), self._handle_request
+            self.get_request_reply_channel(self._ip),
+            self._handle_request,
+            max_concurrency=self.REQUEST_CONCURRENCY,
+            queue_depth=self.REQUEST_QUEUE_DEPTH,
+            is_priority=self._is_control_request,
         )
 
         # communicate the service is set up and listening to its inputs
@@ -117,7 +138,17 @@ class SICComponent:
             )
             return
         self._input_channels.append(channel)
-        self._redis.register_message_handler(channel, self._handle_message)
+
+        # requests from older versions do not have a qos
+        qos = getattr(connection_request, "qos", None)
+        if qos is None:
+            qos = self.INPUT_QOS
+
+        self._redis.register_message_handler(channel, self._handle_message, qos=qos)
+
+    @staticmethod
+    def _is_control_request(request):
+        return is_sic_instance(request, SICControlRequest)
 
     def _handle_message(self, message):
         return self.on_message(message)
@@ -10,7 +10,13 @@ from sic_framework.core.utils import is_sic_instance
 
 from . import utils
 from .component_manager_python2 import SICNotStartedMessage, SICStartComponentRequest
-from .message_python2 import SICMessage, SICPingRequest, SICRequest, SICStopRequest
+from .message_python2 import (
+    SICBusyMessage,
+    SICMessage,
+    SICPingRequest,
+    SICRequest,
+    SICStopRequest,
+)
 from .sic_logging import SIC_LOG_SUBSCRIBER
 from .sic_redis import SICRedis
 
@@ -19,6 +25,10 @@ class ComponentNotStartedError(Exception):
     pass
 
 
+class ComponentBusyError(Exception):
+    pass
+
+
 class SICConnector(object):
     __metaclass__ = ABCMeta
 
@@ -140,13 +150,17 @@ class SICConnector(object):
                 None,
             )
 
-    def register_callback(self, callback):
+    def register_callback(self, callback, qos=None):
         """
         Subscribe a callback to be called when there is new data available.
         :param callback: the function to execute.
+        :param qos: how messages are queued while the callback is busy, see sic_redis.QoS. By default, all
+                    messages are queued.
         """
 
-        ct = self._redis.register_message_handler(self.output_channel, callback)
+        ct = self._redis.register_message_handler(
+            self.output_channel, callback, qos=qos
+        )
 
         self._callback_threads.append(ct)
 
@@ -161,11 +175,13 @@ class SICConnector(object):
         # possible solution: do redis.time, and use a custom get time functions that is aware of the offset
         return time.time()
 
-    def connect(self, component):
+    def connect(self, component, qos=None):
         """
         Connect the output of a component to the input of this component.
         :param component: The component connector providing the input to this component
         :type component: SICConnector
+        :param qos: how the component queues these inputs while it is busy, see sic_redis.QoS. By default, the
+                    INPUT_QOS of the component.
         :return:
         """
 
@@ -175,7 +191,7 @@ class SICConnector(object):
             type(component)
         )
 
-        request = ConnectRequest(component.output_channel)
+        request = ConnectRequest(component.output_channel, qos=qos)
         self._redis.request(self._request_reply_channel, request)
 
     def request(self, request, timeout=100.0, block=True):
@@ -189,6 +205,8 @@ class SICConnector(object):
         :param block: If false, immediately returns None after sending the request.
         :return: the SICMessage reply from the device, or none if blocking=False
         :rtype: SICMessage | None
+        :raises ComponentBusyError: if the component has too many requests waiting, see
+                                    SICComponent.REQUEST_QUEUE_DEPTH
         """
         if isinstance(request, type):
             print(
@@ -203,10 +221,20 @@ class SICConnector(object):
         # Update the timestamp, as it is not yet set (normally be set by the device of origin, e.g a camera)
         request._timestamp = self._get_timestamp()
 
-        return self._redis.request(
+        reply = self._redis.request(
             self._request_reply_channel, request, timeout=timeout, block=block
         )
 
+        if reply is not None and is_sic_instance(reply, SICBusyMessage):
+            raise ComponentBusyError(
+                "{} has too many requests waiting to handle {}".format(
+                    self.component_class.get_component_name(),
+                    request.get_message_name(),
+                )
+            )
+
+        return reply
+
     def stop(self):
         """
         Stop the component and disconnect the callback.
@@ -0,0 +1,244 @@
+"""
+An asyncio version of SICConnector, to use components from a single event loop without a thread per connector or
+subscription. Works with any existing connector class and the components it starts, e.g.:
+
+    async def main():
+        gpt, tts = await asyncio.gather(
+            AsyncSICConnector.start(GPT, conf=GPTConf(openai_key=key)),
+            AsyncSICConnector.start(NaoqiTextToSpeech, ip="192.168.0.151"),
+        )
+
+        # overlap the LLM call and speaking
+        reply, _ = await asyncio.gather(
+            gpt.request(GPTRequest("Tell me a joke")),
+            tts.request(NaoqiTextToSpeechRequest("Let me think")),
+        )
+
+        camera = await AsyncSICConnector.start(NaoqiTopCamera, ip="192.168.0.151")
+        async for image in camera.messages(qos=QoS(QOS_LATEST_ONLY)):
+            ...
+
+    asyncio.run(main())
+
+Requires python 3.7+ and redis-py 4.2+, see sic_redis_asyncio.
+"""
+
+import logging
+import time
+
+from sic_framework.core.component_python2 import ConnectRequest
+from sic_framework.core.sensor_python2 import SICSensor
+from sic_framework.core.utils import is_sic_instance
+
+from . import utils
+from .component_manager_python2 import SICNotStartedMessage, SICStartComponentRequest
+from .connector import ComponentBusyError, ComponentNotStartedError
+from .message_python2 import SICBusyMessage, SICPingRequest, SICRequest, SICStopRequest
+from .sic_logging import SIC_LOG_SUBSCRIBER
+from .sic_redis_asyncio import AsyncSICRedis
+
+
+class AsyncSICConnector(object):
+    # define how long an "instant" reply should take at most (ping sometimes takes more than 150ms)
+    _PING_TIMEOUT = 1
+
+    def __init__(
+        self,
+        connector_class,
+        ip="localhost",
+        log_level=logging.INFO,
+        conf=None,
+        redis=None,
+    ):
+        """
+        A proxy to a component, like the SICConnector `connector_class`, with an async API. Use
+        AsyncSICConnector.start to create one, which starts the component if it is not running yet.
+
+        :param connector_class: the SICConnector subclass of the component, e.g. NaoqiTopCamera
+        :param ip: the ip adress of the device the component is running on
+        :param log_level: Controls the verbosity of the connected component logging.
+        :param conf: Optional SICConfMessage to set component parameters.
+        :param redis: An AsyncSICRedis to share with other connectors. By default, the connector has its own.
+        """
+        self.component_class = connector_class.component_class
+
+        assert isinstance(ip, str), "IP must be string"
+
+        # default ip adress is local ip adress (the actual inet, not localhost or 127.0.0.1)
+        if ip in ["localhost", "127.0.0.1"]:
+            ip = utils.get_ip_adress()
+
+        self._ip = ip
+        self._log_level = log_level
+        self._conf = conf
+
+        self._owns_redis = redis is None
+        self._redis = redis if redis is not None else AsyncSICRedis()
+        self._subscriptions = []
+
+        self._request_reply_channel = self.component_class.get_request_reply_channel(ip)
+        self.output_channel = self.component_class.get_output_channel(self._ip)
+        self.input_channel = "{}:input:{}".format(
+            self.component_class.get_component_name(), self._ip
+        )
+
+    @classmethod
+    async def start(
+        cls, connector_class, ip="localhost", log_level=logging.INFO, conf=None, redis=None
+    ):
+        """
+        Create an AsyncSICConnector, and request the component to be started if it is not running yet.
+        See AsyncSICConnector.__init__ for the parameters.
+        :rtype: AsyncSICConnector
+        """
+        connector = cls(connector_class, ip, log_level=log_level, conf=conf, redis=redis)
+        await connector._connect()
+        return connector
+
+    async def _connect(self):
+        await self._redis.connect()
+
+        # Subscribe to the log channel to display to the user
+        SIC_LOG_SUBSCRIBER.subscribe_to_log_channel_once()
+
+        # if we cannot ping the component, request it to be started from the ComponentManager
+        if not await self._ping():
+            await self._start_component()
+
+        # subscribe the component to a channel that the user is able to send a message on if needed
+        await self.request(ConnectRequest(self.input_channel), timeout=self._PING_TIMEOUT)
+
+    async def _ping(self):
+        try:
+            await self.request(SICPingRequest(), timeout=self._PING_TIMEOUT)
+            return True
+
+        except TimeoutError:
+            return False
+
+    async def _start_component(self):
+        """
+        Request the component to be started, see SICConnector._start_component.
+        """
+        print(
+            "Component not already alive, requesting",
+            self.component_class.get_component_name(),
+            "from manager ",
+            self._ip,
+        )
+
+        if issubclass(self.component_class, SICSensor) and self._conf:
+            print(
+                "Warning: setting configuration for SICSensors only works the first time connecting (sensor "
+                "component instances are reused for now)"
+            )
+
+        component_request = SICStartComponentRequest(
+            component_name=self.component_class.get_component_name(),
+            log_level=self._log_level,
+            conf=self._conf,
+        )
+
+        try:
+            component_info = await self._redis.request(
+                self._ip,
+                component_request,
+                timeout=self.component_class.COMPONENT_STARTUP_TIMEOUT,
+            )
+        except TimeoutError:
+            raise TimeoutError(
+                "Could not connect to {}. Is SIC running on the device (ip:{})?".format(
+                    self.component_class.get_component_name(), self._ip
+                )
+            ) from None
+
+        if is_sic_instance(component_info, SICNotStartedMessage):
+            raise ComponentNotStartedError(
+                "\n\nComponent did not start, error should be logged above. ({})".format(
+                    component_info.message
+                )
+            )
+
+    def messages(self, qos=None):
+        """
+        The output of the component, as an async iterator:
+
+            async for message in connector.messages():
+                ...
+
+        Iterating over the connector itself does the same, with the default QoS.
+        :param qos: how messages are queued while the application is busy, see sic_redis.QoS. By default, all
+                    messages are queued.
+        :rtype: AsyncSubscription
+        """
+        subscription = self._redis.subscribe(self.output_channel, qos=qos)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def __aiter__(self):
+        return self.messages()
+
+    async def send_message(self, message):
+        # Update the timestamp, as it should be set by the device of origin
+        message._timestamp = self._get_timestamp()
+        await self._redis.send_message(self.input_channel, message)
+
+    def _get_timestamp(self):
+        return time.time()
+
+    async def connect(self, component, qos=None):
+        """
+        Connect the output of a component to the input of this component.
+        :param component: The component connector providing the input to this component
+        :type component: AsyncSICConnector | SICConnector
+        :param qos: how the component queues these inputs while it is busy, see sic_redis.QoS. By default, the
+                    INPUT_QOS of the component.
+        """
+        request = ConnectRequest(component.output_channel, qos=qos)
+        await self._redis.request(self._request_reply_channel, request)
+
+    async def request(self, request, timeout=100.0, block=True):
+        """
+        Request data from a device, see SICConnector.request. Other tasks keep running while waiting for the reply.
+        :param request: The request to the device
+        :type request: SICRequest
+        :param timeout: A timeout in case the action takes too long. Only works when blocking=True.
+        :param block: If false, immediately returns None after sending the request.
+        :return: the SICMessage reply from the device, or none if blocking=False
+        :rtype: SICMessage | None
+        :raises ComponentBusyError: if the component has too many requests waiting, see
+                                    SICComponent.REQUEST_QUEUE_DEPTH
+        """
+        assert utils.is_sic_instance(request, SICRequest), (
+            "Cannot send requests that do not inherit from "
+            "SICRequest (type: {req})".format(req=type(request))
+        )
+
+        # Update the timestamp, as it is not yet set (normally be set by the device of origin, e.g a camera)
+        request._timestamp = self._get_timestamp()
+
+        reply = await self._redis.request(
+            self._request_reply_channel, request, timeout=timeout, block=block
+        )
+
+        if reply is not None and is_sic_instance(reply, SICBusyMessage):
+            raise ComponentBusyError(
+                "{} has too many requests waiting to handle {}".format(
+                    self.component_class.get_component_name(),
+                    request.get_message_name(),
+                )
+            )
+
+        return reply
+
+    async def stop(self):
+        """
+        Stop the component, and end the iteration over its messages.
+        """
+        await self._redis.send_message(self._request_reply_channel, SICStopRequest())
+
+        for subscription in self._subscriptions:
+            await subscription.close()
+
+        if self._owns_redis:
+            await self._redis.close()
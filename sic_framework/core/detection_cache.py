@@ -0,0 +1,149 @@
+"""
+Skip detection on camera images that barely changed. A robot's camera mostly sees a static scene, in which running a
+detector (such as face detection) on every frame finds the same objects over and over. DetectionCache compares a
+small grayscale thumbnail of every image with the thumbnail of the last image that was detected on, and returns the
+detections of that image if no thumbnail pixel changed by more than a threshold. Every thumbnail pixel is the average
+of a block of the image, which suppresses sensor noise, while an object moving only a few pixels still changes the
+blocks on its edges. Detection is forced every max_age frames, so slow changes and
+objects that appear without changing the image much are still picked up.
+
+Opt-in for the face detection components, see FaceDetectionConf and DNNFaceDetectionConf.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class _CacheEntry(object):
+    def __init__(self, thumbnail, detections):
+        """
+        The last detected image of a source.
+        """
+        self.thumbnail = thumbnail
+        self.detections = detections
+        # the number of frames the detections were reused for
+        self.age = 0
+
+
+class DetectionCache(object):
+    """
+    Reuses the detections of the previous image of the same source (e.g. camera) if the image barely changed. Thread
+    safe, the sources can be detected on in different threads.
+    """
+
+    # the size (width, height) of the thumbnails that are compared, and the number of pixels averaged per thumbnail
+    # pixel in each direction to suppress sensor noise
+    THUMBNAIL_SIZE = (32, 24)
+    SAMPLES = 4
+
+    def __init__(self, threshold=10.0, max_age=10, logger=None, log_interval=300):
+        """
+        :param threshold: the maximum absolute difference between the thumbnail pixels, in gray levels (0-255), below
+                          which an image is considered unchanged
+        :param max_age: the maximum number of consecutive frames to reuse the detections for
+        :param logger: the logger to report the hit rate to, every log_interval frames
+        """
+        self.threshold = threshold
+        self.max_age = max_age
+        self.logger = logger
+        self.log_interval = log_interval
+
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        # time spent detecting and comparing thumbnails, to estimate the time saved
+        self.detection_seconds = 0.0
+        self.comparison_seconds = 0.0
+
+    def thumbnail(self, image):
+        """
+        :param image: HxW or HxWxC uint8 image
+        :return: the downsampled grayscale image as a float32 array
+        """
+        width, height = self.THUMBNAIL_SIZE
+        step_y = max(1, image.shape[0] // (height * self.SAMPLES))
+        step_x = max(1, image.shape[1] // (width * self.SAMPLES))
+
+        # sample a grid of pixels, and average blocks of SAMPLES x SAMPLES of those
+        samples = image[::step_y, ::step_x]
+        if samples.ndim == 3:
+            samples = samples.mean(axis=2, dtype=np.float32)
+        samples = samples[: height * self.SAMPLES, : width * self.SAMPLES]
+
+        rows = samples.shape[0] // self.SAMPLES
+        columns = samples.shape[1] // self.SAMPLES
+        blocks = samples[: rows * self.SAMPLES, : columns * self.SAMPLES].reshape(
+            rows, self.SAMPLES, columns, self.SAMPLES
+        )
+        return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+    def detect(self, source, image, detect):
+        """
+        Get the detections of the image, from the cache if the image barely changed since the last image of the
+        source that was detected on.
+        :param source: identifies the camera the image is from, e.g. the name of the component that sent it
+        :param image: the image
+        :param detect: function to detect on the image, its result is cached
+        :return: the result of detect, for this or a nearly identical image
+        """
+        start = time.time()
+        thumbnail = self.thumbnail(image)
+
+        with self._lock:
+            entry = self._entries.get(source, None)
+            hit = (
+                entry is not None
+                and entry.thumbnail.shape == thumbnail.shape
+                and entry.age < self.max_age
+                and np.abs(thumbnail - entry.thumbnail).max() < self.threshold
+            )
+            self.comparison_seconds += time.time() - start
+            if hit:
+                entry.age += 1
+                self.hits += 1
+                detections = entry.detections
+
+        if not hit:
+            start = time.time()
+            detections = detect(image)
+            elapsed = time.time() - start
+
+            with self._lock:
+                self._entries[source] = _CacheEntry(thumbnail, detections)
+                self.misses += 1
+                self.detection_seconds += elapsed
+
+        frames = self.hits + self.misses
+        if self.logger is not None and frames % self.log_interval == 0:
+            stats = self.get_stats()
+            self.logger.info(
+                "Detection cache: reused {:.0%} of {} frames, saved {:.1f}s".format(
+                    stats["hit_rate"], stats["frames"], stats["saved_seconds"]
+                )
+            )
+
+        return detections
+
+    def get_stats(self):
+        """
+        The hit rate, and the (estimated) detection time saved: the average detection time of each reused frame,
+        minus the time spent comparing thumbnails.
+        :return: dict with frames, hits, hit_rate and saved_seconds
+        """
+        with self._lock:
+            frames = self.hits + self.misses
+            mean_detection_seconds = 0.0
+            if self.misses:
+                mean_detection_seconds = self.detection_seconds / self.misses
+
+            return {
+                "frames": frames,
+                "hits": self.hits,
+                "hit_rate": float(self.hits) / frames if frames else 0.0,
+                "saved_seconds": self.hits * mean_detection_seconds
+                - self.comparison_seconds,
+            }
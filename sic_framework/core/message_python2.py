@@ -1,13 +1,16 @@
 # import dataclasses
+import copy
 import io
 import os
 import random
+import struct
+import threading
 import time
 
 import numpy as np
 import six
 
-from . import utils
+from . import array_codecs, utils
 
 if not six.PY3:
     import cPickle as pickle
@@ -22,32 +25,156 @@ else:
     lib_turbo_jpeg_path = None
     import pickle
 
-try:
-    from turbojpeg import TurboJPEG
 
-    turbojpeg = TurboJPEG(lib_turbo_jpeg_path)
-except (RuntimeError, ImportError):
+class FakeTurboJpeg:
     # fall back to PIL in case TurboJPEG is not installed
     # PIL _can_ use turbojpeg, but can also fall back to a slower libjpeg
     # it is recommended to install turbojpeg
-    print("Turbojpeg not found, falling back to PIL")
-    from PIL import Image
+    def __init__(self):
+        from PIL import Image
 
-    class FakeTurboJpeg:
-        def encode(self, array):
-            output = io.BytesIO()
-            image = Image.fromarray(array)
-            image.save(output, format="JPEG")
-            output.seek(0)
-            return output.read()
+        self._image = Image
 
-        def decode(self, bytes):
-            image = Image.open(io.BytesIO(bytes))
-            image = np.array(image)
-            image = np.flipud(image)[:, :, ::-1]
-            return image
+    def encode(self, array):
+        output = io.BytesIO()
+        image = self._image.fromarray(array)
+        image.save(output, format="JPEG")
+        output.seek(0)
+        return output.read()
 
-    turbojpeg = FakeTurboJpeg()
+    def decode(self, bytes):
+        image = self._image.open(io.BytesIO(bytes))
+        image = np.array(image)
+        image = np.flipud(image)[:, :, ::-1]
+        return image
+
+
+# The JPEG codec is loaded on first use, as most processes never encode or decode an image.
+_turbojpeg = None
+_turbojpeg_lock = threading.Lock()
+
+
+def get_turbojpeg():
+    """
+    Get the JPEG codec: TurboJPEG, or PIL if TurboJPEG is not installed.
+    """
+    global _turbojpeg
+
+    if _turbojpeg is None:
+        with _turbojpeg_lock:
+            if _turbojpeg is None:
+                try:
+                    from turbojpeg import TurboJPEG
+
+                    _turbojpeg = TurboJPEG(lib_turbo_jpeg_path)
+                except (RuntimeError, ImportError):
+                    print("Turbojpeg not found, falling back to PIL")
+                    _turbojpeg = FakeTurboJpeg()
+
+    return _turbojpeg
+
+
+# The framed wire format of a SICMessage: a prefix with a magic string, format version and header length, followed
+# by the header and the raw buffers of the ndarray, JPEG, bytes and nested SICMessage fields. The header is a small
+# pickle of the message class, the remaining fields and a description of each buffer (field, kind, dtype, shape, size).
+WIRE_FORMAT_MAGIC = b"SIC"
+WIRE_FORMAT_VERSION = 1
+_WIRE_FORMAT_PREFIX = struct.Struct("<3sBI")
+
+# Devices running an older version of the framework can only read pickled messages. Set SIC_LEGACY_SERIALIZATION=1
+# to send messages in this format. Both formats can always be read.
+LEGACY_SERIALIZATION = os.getenv("SIC_LEGACY_SERIALIZATION", "0") == "1"
+
+
+# Optional thread pool to decode JPEG images of received messages in, see set_codec_workers.
+_codec_pool = None
+
+# The buffer kind of arrays encoded with a codec is this prefix followed by the name of the codec, see array_codecs
+_CODEC_KIND_PREFIX = "codec:"
+
+# The attributes of a message that hold its serialized form, and are not fields of the message
+_SERIALIZATION_ATTRIBUTES = (
+    "_serialized_cache",
+    "_serialized_codecs",
+    "_encoded_fields",
+    "_decode_lock",
+)
+
+# The types of field values that can not be changed in place, see SICMessage.__setattr__
+_IMMUTABLE_TYPES = six.string_types + six.integer_types + (bytes, float, type(None))
+
+
+def _dtype_to_wire(dtype):
+    """
+    The description of a numpy dtype to send along with an array, which keeps the field names of structured arrays.
+    """
+    if dtype.names:
+        return dtype.descr
+    return dtype.str
+
+
+def _dtype_from_wire(description):
+    """
+    The numpy dtype from its description, see _dtype_to_wire.
+    """
+    if isinstance(description, list):
+        # python2 numpy requires str field names, which are received as unicode from python3
+        return np.dtype([(str(field[0]),) + tuple(field[1:]) for field in description])
+    return np.dtype(description)
+
+
+def set_codec_workers(n_workers):
+    """
+    Decode the JPEG compressed images (and arrays compressed with a codec, see array_codecs) of received messages in a
+    pool of n_workers threads. Decoding starts as soon as a message is received, in parallel with other messages and
+    the application, and accessing the image waits until it is done. TurboJPEG and the codecs release the GIL, so this
+    scales with the number of cores.
+    With 0 workers (the default), images are decoded by the thread that first accesses them. Python 3 only.
+    :param n_workers: The number of decoding threads.
+    """
+    global _codec_pool
+
+    if _codec_pool is not None:
+        _codec_pool.shutdown(wait=False)
+        _codec_pool = None
+
+    if n_workers > 0:
+        from concurrent.futures import ThreadPoolExecutor
+
+        _codec_pool = ThreadPoolExecutor(
+            max_workers=n_workers, thread_name_prefix="SICCodecPool"
+        )
+
+
+class _EncodedField(object):
+    def __init__(self, kind, dtype, shape, buffer, nbytes, decode, prefetch=True):
+        """
+        A field of a received message that is decoded on first access. JPEG images and arrays encoded with a codec are
+        decoded in the codec pool if it is enabled. Until then, the encoded buffer can be forwarded as-is when the message is sent again.
+        :param kind: the buffer kind, see SICMessage._encode_buffer
+        :param buffer: the encoded field value
+        :param decode: function to decode the field with, given kind, dtype, shape and buffer
+        :param prefetch: whether to start decoding in the codec pool right away
+        """
+        self.kind = kind
+        self.dtype = dtype
+        self.shape = shape
+        self.buffer = buffer
+        self.nbytes = nbytes
+        self._decode = decode
+        self._future = None
+
+        if (
+            prefetch
+            and _codec_pool is not None
+            and (kind == "jpeg" or kind.startswith(_CODEC_KIND_PREFIX))
+        ):
+            self._future = _codec_pool.submit(decode, kind, dtype, shape, buffer)
+
+    def decode(self):
+        if self._future is not None:
+            return self._future.result()
+        return self._decode(self.kind, self.dtype, self.shape, self.buffer)
 
 
 class SICMessage(object):
@@ -66,6 +193,13 @@ class SICMessage(object):
     __JPEG_VALUES = []
     __SIC_MESSAGES = []
     _compress_images = False
+    # Lossless codecs to compress numpy array fields with when they are sent to another host, by field name in order
+    # of preference, e.g. {"depth": ("png", "zstd", "zlib")}. The first codec that the sender and all receivers
+    # support is used, see array_codecs.
+    _field_codecs = {}
+    # The numeric fields that may be linearly interpolated between two messages, e.g. ("x", "y"), see
+    # SYNC_INTERPOLATE. Other fields, such as images, are taken from the nearest message.
+    _interpolated_fields = ()
     # this request id must be set when the message is sent as a reply to a SICRequest
     _request_id = None
 
@@ -114,55 +248,479 @@ class SICMessage(object):
 
     @staticmethod
     def np2jpeg(inp):
-        return turbojpeg.encode(inp)
+        return get_turbojpeg().encode(inp)
 
     @staticmethod
     def jpeg2np(inp):
         # takes about 15 ms for 1280x960px
-        img = turbojpeg.decode(inp)
+        img = get_turbojpeg().decode(inp)
 
-        # the img np array now has the following flags:
+        # the img np array might have the following flags:
         # C_CONTIGUOUS : False
         # OWNDATA: False
 
         # cv2 drawing functions fail, with cryptic type errors (but cv2.imShow does not)
-        # the np.array() sets these flags to true
-        # takes about 1 ms for 1280x960px
-        img = np.array(img)
+        # np.require copies the array to set these flags, but only if necessary
+        # a copy takes about 1 ms for 1280x960px
+        img = np.require(img, requirements=["C", "W"])
 
         return img
 
-    def serialize(self):
+    @staticmethod
+    def _np2buffer(inp):
+        """
+        Get the raw memory of a numpy array, without copying it if the array is contiguous.
+        :param inp: a numpy array
+        :return: tuple of the buffer and its size in bytes
+        """
+        inp = np.ascontiguousarray(inp)
+        if six.PY3:
+            return memoryview(inp), inp.nbytes
+        # python2 cannot join buffers with strings
+        buffer = inp.tostring()
+        return buffer, len(buffer)
+
+    def _get_field_codec(self, attr, value, codecs):
+        """
+        The codec to encode a field with, see _field_codecs.
+        :param codecs: the names of the codecs the receivers support
+        :return: an ArrayCodec, or None to send the field as is
+        """
+        if not codecs or attr not in self._field_codecs:
+            return None
+
+        if isinstance(value, (bytes, bytearray)):
+            # listing a field in _field_codecs marks it as binary data, also for python2 strings
+            value = np.frombuffer(value, dtype=np.uint8)
+        elif (
+            not isinstance(value, np.ndarray)
+            or value.dtype.hasobject
+            or (self._compress_images and value.ndim == 3 and value.shape[-1] == 3)
+        ):
+            return None
+
+        if value.size == 0:
+            return None
+
+        for name in self._field_codecs[attr]:
+            if name in codecs:
+                codec = array_codecs.get_codec(name)
+                if codec is not None and codec.accepts(value):
+                    return codec
+
+        return None
+
+    def _encode_buffer(self, value, codec=None):
+        """
+        Encode a field value that is sent as a raw buffer instead of in the header.
+        :param value: the field value
+        :param codec: the ArrayCodec to encode a numpy array or binary value with, see _get_field_codec. Values that
+                      it does not make smaller are sent as is.
+        :return: tuple of (kind, dtype, shape, buffer, size in bytes), or None if the value belongs in the header
+        """
+        if codec is not None:
+            if isinstance(value, np.ndarray):
+                array, dtype = value, _dtype_to_wire(value.dtype)
+            else:
+                # the type of binary values is restored when decoding, see _decode_buffer
+                array = np.frombuffer(value, dtype=np.uint8)
+                dtype = "bytearray" if isinstance(value, bytearray) else "bytes"
+
+            buffer = codec.encode(array)
+            if len(buffer) < array.nbytes:
+                return (
+                    _CODEC_KIND_PREFIX + codec.name,
+                    dtype,
+                    array.shape,
+                    buffer,
+                    len(buffer),
+                )
+
+            if not isinstance(value, np.ndarray):
+                return dtype, None, None, value, len(value)
+
+        if isinstance(value, SICMessage):
+            buffer = value.serialize()
+            return "message", None, None, buffer, len(buffer)
+
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            if self._compress_images and value.ndim == 3 and value.shape[-1] == 3:
+                buffer = self.np2jpeg(value)
+                return "jpeg", None, None, buffer, len(buffer)
+
+            buffer, nbytes = self._np2buffer(value)
+            return "ndarray", _dtype_to_wire(value.dtype), value.shape, buffer, nbytes
+
+        # on python2 'bytes' is also used for text, so only bytearrays are known to be binary data
+        if isinstance(value, bytearray) or (six.PY3 and isinstance(value, bytes)):
+            return type(value).__name__, None, None, value, len(value)
+
+        return None
+
+    @classmethod
+    def _decode_buffer(cls, kind, dtype, shape, buffer):
+        """
+        Decode a field from its raw buffer in the serialized message.
+        """
+        if kind == "ndarray":
+            dtype = _dtype_from_wire(dtype)
+            if len(buffer) == 0 or dtype.itemsize == 0:
+                return np.empty(shape, dtype=dtype)
+            # a read-only view on the received bytes, without copying
+            return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+        if kind == "jpeg":
+            return cls.jpeg2np(buffer)
+        if kind.startswith(_CODEC_KIND_PREFIX):
+            name = kind[len(_CODEC_KIND_PREFIX) :]
+            codec = array_codecs.get_codec(name)
+            if codec is None:
+                raise ValueError(
+                    "Received an array encoded with the {} codec, which is not installed".format(
+                        name
+                    )
+                )
+            if dtype not in ("bytes", "bytearray"):
+                return codec.decode(buffer, _dtype_from_wire(dtype), shape)
+
+            array = codec.decode(buffer, np.dtype(np.uint8), shape)
+            data = array.tobytes() if six.PY3 else array.tostring()
+            return bytearray(data) if dtype == "bytearray" else data
+        if kind in ("shm", "shm_copy"):
+            from . import shared_memory_transport
+
+            array = shared_memory_transport.read_array(
+                bytes(buffer), _dtype_from_wire(dtype), shape
+            )
+            # read-only like arrays sent through redis, except images that would otherwise be JPEG compressed, which
+            # are expected to be writable like a decoded JPEG image
+            if kind == "shm":
+                array.flags.writeable = False
+            return array
+        if kind == "message":
+            return SICMessage.deserialize(bytes(buffer))
+        if kind == "bytearray":
+            return bytearray(buffer)
+        if kind == "bytes":
+            return bytes(buffer)
+
+        raise ValueError("Unknown buffer kind {} in serialized message".format(kind))
+
+    def __setattr__(self, name, value):
+        # any assignment to a field invalidates the cached serialized message, as a mutable value, such as an array,
+        # might have been changed in place before assigning it again. Only re-assigning the same immutable value, such
+        # as the name of the sending component, does not.
+        if (
+            name not in self.__dict__
+            or self.__dict__[name] is not value
+            or not isinstance(value, _IMMUTABLE_TYPES)
+        ):
+            self._clear_serialized_cache()
+
+        encoded_fields = self.__dict__.get("_encoded_fields", None)
+        if encoded_fields:
+            encoded_fields.pop(name, None)
+
+        object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        """
+        Only called when the attribute is not found normally, which is the case for received fields that are not
+        decoded yet. Decode the field and store the result, so it is decoded only once. A message can be shared by the
+        callback threads of several handlers, so the field is decoded while holding the lock of the message.
+        """
+        encoded_fields = self.__dict__.get("_encoded_fields", None)
+
+        if not encoded_fields or name not in encoded_fields:
+            raise AttributeError(
+                "'{}' object has no attribute '{}'".format(
+                    self.__class__.__name__, name
+                )
+            )
+
+        with self._get_decode_lock():
+            # another thread might have decoded (or assigned) the field while waiting for the lock
+            if name not in encoded_fields:
+                return self.__dict__[name]
+
+            value = encoded_fields[name].decode()
+            self.__dict__[name] = value
+            encoded_fields.pop(name, None)
+
+        # the received bytes can no longer be forwarded as-is if the decoded value can be modified in place, such as
+        # a decoded JPEG image or nested message. Read-only arrays and bytes can not.
+        read_only = isinstance(value, bytes) or (
+            isinstance(value, np.ndarray) and not value.flags.writeable
+        )
+        if not read_only:
+            self._clear_serialized_cache()
+
+        return value
+
+    def _get_decode_lock(self):
+        """
+        The lock to hold while decoding fields, or reading the fields and the encoded fields together, created on
+        first use. Reentrant, as serializing a message can decode fields.
+        """
+        lock = self.__dict__.get("_decode_lock", None)
+        if lock is None:
+            # setdefault is atomic, so threads creating the lock at the same time all get the same lock
+            lock = self.__dict__.setdefault("_decode_lock", threading.RLock())
+        return lock
+
+    def __getstate__(self):
+        # locks can not be pickled or copied
+        state = self.__dict__.copy()
+        state.pop("_decode_lock", None)
+        return state
+
+    def _clear_serialized_cache(self):
+        self.__dict__.pop("_serialized_cache", None)
+        self.__dict__.pop("_serialized_codecs", None)
+
+    def _set_encoded_field(self, attr, kind, buffer):
+        """
+        Set a field to a value that is already encoded, such as a JPEG image from a camera. It is sent as is, and only
+        decoded when the field is accessed, like a field of a received message.
+        :param kind: the buffer kind, see _encode_buffer
+        :param buffer: the encoded value
+        """
+        self.__dict__.pop(attr, None)
+        self._clear_serialized_cache()
+
+        encoded_fields = self.__dict__.setdefault("_encoded_fields", dict())
+        encoded_fields[attr] = _EncodedField(
+            kind, None, None, buffer, len(buffer), self._decode_buffer, prefetch=False
+        )
+
+    def _decode_fields(self):
+        """
+        Decode all fields that are not yet decoded.
+        """
+        for attr in list(self.__dict__.get("_encoded_fields", None) or []):
+            getattr(self, attr)
+
+    def _get_fields(self):
+        """
+        The (decoded) fields of this message to serialize, excluding private framework attributes.
+        :return: iterator of (name, value) tuples
+        """
+        # a snapshot, as other threads might decode fields while iterating
+        return (
+            (attr, attr_value)
+            for attr, attr_value in list(vars(self).items())
+            if attr not in _SERIALIZATION_ATTRIBUTES
+        )
+
+    def serialize(self, shared_memory=None, codecs=None):
         """
         Convert object to its bytes representation, compatible between python2 and python3 and
         with support for numpy arrays.
+
+        Numpy arrays, JPEG compressed images, binary data and nested SICMessages are appended as raw buffers to a
+        small header containing the other fields, see WIRE_FORMAT_MAGIC.
+
+        The message itself is not modified. The result is cached on the message until a field is assigned, so sending
+        the same message to multiple channels only encodes (e.g. JPEG compresses) it once. Modifying a field in place,
+        such as drawing on an image array, is not detected: assign the field again to invalidate the cache. The cached
+        result is reused as long as the receivers support the codecs it was encoded with.
+        :param shared_memory: a SharedMemoryRing to write large numpy arrays to instead of including them, only for
+                              messages to receivers on the same host. See shared_memory_transport.
+        :param codecs: the names of the array codecs all receivers support, to encode the fields listed in
+                       _field_codecs with. By default, arrays are not compressed.
         :return: 'bytes' in python3, 'str' in python2 (which are roughly the same)
         """
-        self.__NP_VALUES = []
-        self.__JPEG_VALUES = []
-        self.__SIC_MESSAGES = []
+        codecs = frozenset(codecs or ())
+
+        if (
+            shared_memory is not None
+            and not LEGACY_SERIALIZATION
+            and any(shared_memory.accepts(v) for _, v in self._get_fields())
+        ):
+            # the arrays are written to a new ring buffer slot every time, so this is never cached
+            return self._serialize_frame(shared_memory, codecs)[0]
+
+        cached = self.__dict__.get("_serialized_cache", None)
+        if cached is not None and self.__dict__.get("_serialized_codecs", frozenset()) <= codecs:
+            return cached
+
+        if LEGACY_SERIALIZATION:
+            byte_string = self._serialize_pickle()
+            used_codecs = frozenset()
+        else:
+            byte_string, used_codecs = self._serialize_frame(codecs=codecs)
 
-        # Compress np arrays with np.save
-        for attr in vars(self):
-            attr_value = getattr(self, attr)
+        # nested messages might be changed without this message knowing, so only cache messages without them
+        if not any(isinstance(v, SICMessage) for _, v in self._get_fields()):
+            self.__dict__["_serialized_cache"] = byte_string
+            self.__dict__["_serialized_codecs"] = used_codecs
+
+        return byte_string
+
+    def _serialize_frame(self, shared_memory=None, codecs=frozenset()):
+        """
+        Serialize to the framed wire format, see serialize.
+        :return: tuple of the serialized message ('bytes' in python3, 'str' in python2) and the names of the codecs
+                 it is encoded with
+        """
+        fields = dict()
+        buffer_fields = []
+        buffers = []
+        used_codecs = set()
+
+        # read the fields and the encoded fields together, so a field decoded by another thread in between is
+        # neither missed nor sent twice
+        with self._get_decode_lock():
+            # received fields encoded with a codec the receivers do not support must be decoded to send them
+            encoded_fields = self.__dict__.get("_encoded_fields", None) or {}
+            for attr in list(encoded_fields):
+                kind = encoded_fields[attr].kind
+                if (
+                    kind.startswith(_CODEC_KIND_PREFIX)
+                    and kind[len(_CODEC_KIND_PREFIX) :] not in codecs
+                ):
+                    getattr(self, attr)
+
+            field_values = list(self._get_fields())
+            encoded_fields = list(encoded_fields.items())
+
+        for attr, attr_value in field_values:
+            if shared_memory is not None and shared_memory.accepts(attr_value):
+                # only the descriptor of the ring buffer slot is sent
+                kind = "shm"
+                if (
+                    self._compress_images
+                    and attr_value.ndim == 3
+                    and attr_value.shape[-1] == 3
+                ):
+                    kind = "shm_copy"
+                buffer = shared_memory.write(attr_value).encode("ascii")
+                buffer_fields.append(
+                    (
+                        attr,
+                        kind,
+                        _dtype_to_wire(attr_value.dtype),
+                        attr_value.shape,
+                        len(buffer),
+                    )
+                )
+                buffers.append(buffer)
+                continue
+
+            encoded = self._encode_buffer(
+                attr_value, self._get_field_codec(attr, attr_value, codecs)
+            )
+
+            if encoded is None:
+                fields[attr] = attr_value
+            else:
+                kind, dtype, shape, buffer, nbytes = encoded
+                buffer_fields.append((attr, kind, dtype, shape, nbytes))
+                buffers.append(buffer)
+                if kind.startswith(_CODEC_KIND_PREFIX):
+                    used_codecs.add(kind[len(_CODEC_KIND_PREFIX) :])
+
+        # forward the buffers of received fields that were never decoded as-is, without decoding and re-encoding
+        for attr, field in encoded_fields:
+            buffer_fields.append((attr, field.kind, field.dtype, field.shape, field.nbytes))
+            buffers.append(field.buffer)
+            if field.kind.startswith(_CODEC_KIND_PREFIX):
+                used_codecs.add(field.kind[len(_CODEC_KIND_PREFIX) :])
+
+        header = pickle.dumps((self.__class__, fields, buffer_fields), protocol=2)
+        prefix = _WIRE_FORMAT_PREFIX.pack(
+            WIRE_FORMAT_MAGIC, WIRE_FORMAT_VERSION, len(header)
+        )
+
+        return b"".join([prefix, header] + buffers), frozenset(used_codecs)
+
+    def _copy_on_write(self):
+        """
+        A copy of this message for a receiver in the same process, without serializing it. Numpy arrays are shared as
+        read-only views, as they are when deserialized, so a receiver can not change the message of the sender or
+        other receivers. Images that would be JPEG compressed are copied instead, as receivers expect them to be
+        writable like a decoded JPEG image. Nested messages are copied the same way, other mutable fields deeply.
+        :return: the copy
+        """
+        obj = self.__class__.__new__(self.__class__)
+
+        with self._get_decode_lock():
+            field_values = list(self._get_fields())
+            encoded_fields = dict(self.__dict__.get("_encoded_fields", None) or {})
 
+        for attr, attr_value in field_values:
+            if isinstance(attr_value, np.ndarray):
+                if (
+                    self._compress_images
+                    and attr_value.ndim == 3
+                    and attr_value.shape[-1] == 3
+                ):
+                    attr_value = attr_value.copy()
+                else:
+                    attr_value = attr_value.view()
+                    attr_value.flags.writeable = False
+            elif isinstance(attr_value, SICMessage):
+                attr_value = attr_value._copy_on_write()
+            elif not isinstance(
+                attr_value, six.string_types + six.integer_types + (bytes, float)
+            ) and attr_value is not None:
+                attr_value = copy.deepcopy(attr_value)
+
+            obj.__dict__[attr] = attr_value
+
+        # fields that were received but not decoded stay encoded, and the serialized message remains valid
+        if encoded_fields:
+            obj.__dict__["_encoded_fields"] = encoded_fields
+
+        for attr in ("_serialized_cache", "_serialized_codecs"):
+            if attr in self.__dict__:
+                obj.__dict__[attr] = self.__dict__[attr]
+
+        return obj
+
+    def _serialize_pickle(self):
+        """
+        Serialize to the legacy format, by pickling a copy of the object in which all numpy arrays are replaced with
+        their np.save bytes. Readable by all versions of the framework.
+        :return: 'bytes' in python3, 'str' in python2 (which are roughly the same)
+        """
+        # pickle a shallow copy, as to not change the fields of this message
+        self._decode_fields()
+        fields = list(self._get_pickle_fields())
+        obj = self.__class__.__new__(self.__class__)
+        obj.__dict__.update(fields)
+
+        obj.__NP_VALUES = []
+        obj.__JPEG_VALUES = []
+        obj.__SIC_MESSAGES = []
+
+        # Compress np arrays with np.save
+        for attr, attr_value in fields:
             if isinstance(attr_value, SICMessage):
-                setattr(self, attr, attr_value.serialize())
-                self.__SIC_MESSAGES.append(attr)
+                obj.__dict__[attr] = attr_value._serialize_pickle()
+                obj.__SIC_MESSAGES.append(attr)
             elif isinstance(attr_value, np.ndarray):
                 if (
                     self._compress_images
                     and attr_value.ndim == 3
                     and attr_value.shape[-1] == 3
                 ):
-                    setattr(self, attr, self.np2jpeg(attr_value))
-                    self.__JPEG_VALUES.append(attr)
+                    obj.__dict__[attr] = self.np2jpeg(attr_value)
+                    obj.__JPEG_VALUES.append(attr)
                 else:
-                    setattr(self, attr, self._np2base(attr_value))
-                    self.__NP_VALUES.append(attr)
+                    obj.__dict__[attr] = self._np2base(attr_value)
+                    obj.__NP_VALUES.append(attr)
 
         # Pickle dataclass
-        return pickle.dumps(self, protocol=2)
+        return pickle.dumps(obj, protocol=2)
+
+    def _get_pickle_fields(self):
+        """
+        The fields to serialize in the legacy format, see _serialize_pickle. Messages of which the fields changed can
+        convert them to the fields of older versions of the framework here.
+        :return: iterator of (name, value) tuples
+        """
+        return self._get_fields()
 
     @staticmethod
     def _pickle_load(byte_string):
@@ -202,7 +760,86 @@ class SICMessage(object):
     def deserialize(cls, byte_string):
         """
         Convert object from its bytes representation, compatible between python2 and python3 and
-        with support for numpy arrays.
+        with support for numpy arrays. Reads both the framed and the legacy pickle format.
+
+        Numpy arrays, JPEG compressed images, binary data and nested messages are decoded when they are first
+        accessed (JPEG images in the background if a codec pool is enabled, see set_codec_workers), so a component
+        that does not use a field does not pay for decoding it. When the message is sent again, fields that were never
+        accessed are forwarded as the received bytes, without re-encoding them.
+
+        Note: numpy arrays (except JPEG compressed images) are read-only views on the received bytes, or copies of
+        the arrays in shared memory for messages from the same host. Use array.copy() to modify them.
+        :return: a SICMessage subclass
+        """
+        if byte_string[: len(WIRE_FORMAT_MAGIC)] == WIRE_FORMAT_MAGIC:
+            return cls._deserialize_frame(byte_string)
+
+        return cls._deserialize_pickle(byte_string)
+
+    @classmethod
+    def _deserialize_frame(cls, byte_string):
+        """
+        Convert object from the framed wire format, see serialize.
+        :return: a SICMessage subclass
+        """
+        _, version, header_length = _WIRE_FORMAT_PREFIX.unpack_from(byte_string, 0)
+
+        if version != WIRE_FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported SICMessage wire format version {} (supported: {}). Is the framework up to date on "
+                "all devices?".format(version, WIRE_FORMAT_VERSION)
+            )
+
+        offset = _WIRE_FORMAT_PREFIX.size
+        message_class, fields, buffer_fields = cls._pickle_load(
+            byte_string[offset : offset + header_length]
+        )
+        offset += header_length
+
+        obj = message_class.__new__(message_class)
+        obj.__dict__.update(fields)
+
+        # buffer fields are decoded on first access, see __getattr__. memoryview slices avoid copying the buffers.
+        if six.PY3:
+            byte_view = memoryview(byte_string)
+        else:
+            byte_view = byte_string
+
+        encoded_fields = dict()
+        used_codecs = set()
+        in_shared_memory = False
+        for attr, kind, dtype, shape, nbytes in buffer_fields:
+            buffer = byte_view[offset : offset + nbytes]
+            offset += nbytes
+
+            if kind in ("shm", "shm_copy"):
+                # copy arrays out of shared memory right away, before the sender reuses the ring buffer slot
+                obj.__dict__[attr] = cls._decode_buffer(kind, dtype, shape, buffer)
+                in_shared_memory = True
+                continue
+
+            if kind.startswith(_CODEC_KIND_PREFIX):
+                used_codecs.add(kind[len(_CODEC_KIND_PREFIX) :])
+
+            encoded_fields[attr] = _EncodedField(
+                kind, dtype, shape, buffer, nbytes, cls._decode_buffer
+            )
+
+        if encoded_fields:
+            obj.__dict__["_encoded_fields"] = encoded_fields
+
+        # sending the message again without changing it sends the received bytes, except when they only refer to
+        # shared memory of the sender, which is only valid for a limited time and on this host
+        if not in_shared_memory:
+            obj.__dict__["_serialized_cache"] = byte_string
+            obj.__dict__["_serialized_codecs"] = frozenset(used_codecs)
+
+        return obj
+
+    @classmethod
+    def _deserialize_pickle(cls, byte_string):
+        """
+        Convert object from the legacy pickle format, see _serialize_pickle.
         :return: a SICMessage subclass
         """
         # Read pickle object
@@ -236,7 +873,7 @@ class SICMessage(object):
         out = str(self.__class__.__name__) + "\n"
 
         for attr in sorted(vars(self)):
-            if attr.startswith("__"):
+            if attr.startswith("__") or attr in _SERIALIZATION_ATTRIBUTES:
                 continue
 
             attr_value = str(getattr(self, attr))
@@ -247,6 +884,9 @@ class SICMessage(object):
 
             out += "\n"
 
+        for attr in sorted(self.__dict__.get("_encoded_fields", None) or []):
+            out += " " + attr + ":<not decoded>\n"
+
         return out
 
 
@@ -265,10 +905,13 @@ class SICConfMessage(SICMessage):
 
 class SICRequest(SICMessage):
     """
-    A type of message that must be met with a reply, a SICMessage with the same request id, on the same channel.
+    A type of message that must be met with a reply, a SICMessage with the same request id. The reply is sent to the
+    reply channel of the requesting client if it is set, and otherwise on the same channel.
     """
 
     _request_id = None
+    # The channel the requesting client awaits the reply on. If None, the reply is sent on the request channel.
+    _reply_channel = None
 
     def __init__(self, request_id=None):
         if request_id:
@@ -325,6 +968,12 @@ class SICIgnoreRequestMessage(SICControlMessage):
     _request_id = -1
 
 
+class SICBusyMessage(SICControlMessage):
+    """
+    A reply to a request that was not handled, as the component has too many requests waiting already.
+    """
+
+
 ######################################################################################
 #                             Common data formats                                    #
 ######################################################################################
@@ -352,6 +1001,17 @@ class CompressedImageMessage(CompressedImage, SICMessage):
         CompressedImage.__init__(self, *args, **kwargs)
         SICMessage.__init__(self)
 
+    @classmethod
+    def from_jpeg(cls, jpeg):
+        """
+        A message of an image that is already JPEG compressed, which is sent without decoding and encoding it again.
+        :param jpeg: the contents of the JPEG file
+        """
+        message = cls.__new__(cls)
+        SICMessage.__init__(message)
+        message._set_encoded_field("image", "jpeg", jpeg)
+        return message
+
 
 class CompressedImageRequest(CompressedImage, SICRequest):
     """
@@ -365,12 +1025,13 @@ class CompressedImageRequest(CompressedImage, SICRequest):
 
 class UncompressedImageMessage(SICMessage):
     """
-    Message class to send images/np array without JPEG compression. The data is
-    compressed using default np.save lossless compression. In other words: the
-    data does not change after compression, but this is much slower than JPEGCompressedImageMessage
+    Message class to send images/np array without JPEG compression. The data is compressed losslessly when sent to
+    other hosts, with the fastest codec all receivers support (see array_codecs). In other words: the data does not
+    change after compression, but the message is larger than a CompressedImageMessage.
     """
 
     _compress_images = False
+    _field_codecs = {"image": ("zstd", "lz4", "zlib")}
 
     def __init__(self, image):
         self.image = image
@@ -386,14 +1047,40 @@ class Audio(object):
 
     You can convert to and from .wav files using the built-in module
     https://docs.python.org/2/library/wave.html
+
+    The waveform is compressed losslessly when sent to other hosts, see array_codecs.PCM16Codec, and decoded when it
+    is first accessed. Audio streams, such as microphones, number their chunks so receivers can detect lost chunks,
+    see count_missed_chunks.
     """
 
-    def __init__(self, waveform, sample_rate):
+    _field_codecs = {"waveform": ("pcm16-zstd", "pcm16-zlib")}
+
+    # the number of the chunk in its audio stream, None if the audio is not part of a stream
+    sequence_number = None
+
+    def __init__(self, waveform, sample_rate, sequence_number=None):
         self.sample_rate = sample_rate
         assert isinstance(waveform, bytes) or isinstance(
             waveform, bytearray
         ), "Waveform must be a byte array"
         self.waveform = waveform
+        if sequence_number is not None:
+            self.sequence_number = sequence_number
+
+    def count_missed_chunks(self, previous):
+        """
+        The number of chunks of the audio stream that were lost between the previous chunk that was received and this
+        one. Zero if either chunk is not numbered, or the stream restarted.
+        :param previous: the previous Audio chunk of the stream, or None
+        :rtype: int
+        """
+        if (
+            previous is None
+            or previous.sequence_number is None
+            or self.sequence_number is None
+        ):
+            return 0
+        return max(0, self.sequence_number - previous.sequence_number - 1)
 
 
 class AudioMessage(Audio, SICMessage):
@@ -452,15 +1139,34 @@ class BoundingBox(object):
     Identifier can be used implementation specific to for example indicate a specific object type or
     detected person.
     Confidence indicates can be used to indicate the confidence of the detection mechanism.
+    Keypoints optionally holds a Kx3 array of the x, y and confidence of landmarks, such as the eyes of a face.
     """
 
-    def __init__(self, x, y, w, h, identifier=None, confidence=None):
+    # many are created when reading the bounding boxes of a message, see BoundingBoxesMessage.bboxes
+    __slots__ = ("x", "y", "w", "h", "identifier", "confidence", "keypoints")
+
+    def __init__(self, x, y, w, h, identifier=None, confidence=None, keypoints=None):
         self.x = x
         self.y = y
         self.w = w
         self.h = h
         self.identifier = identifier
         self.confidence = confidence
+        self.keypoints = keypoints
+
+    def __getstate__(self):
+        # pickled as a dict, like the instances of older versions of the framework, which did not have __slots__
+        state = {name: getattr(self, name) for name in self.__slots__}
+        if self.keypoints is None:
+            del state["keypoints"]
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # the (__dict__, slots) state python pickles objects with __slots__ as by default
+            state = dict(state[0] or {}, **(state[1] or {}))
+        for name in self.__slots__:
+            setattr(self, name, state.get(name, None))
 
     def xywh(self):
         """
@@ -475,10 +1181,256 @@ class BoundingBox(object):
         )
 
 
+# The identifier of bounding boxes without one, in an integer identifier column
+_NO_IDENTIFIER = np.iinfo(np.int64).min
+
+
 class BoundingBoxesMessage(SICMessage):
     """
-    A generic class containing multiple bounding boxes as a list of BoundingBox objects.
+    A generic class containing multiple bounding boxes, stored as a numpy structured array in the boxes field, which
+    is sent as a single buffer. Each box has the fields:
+
+    x, y, w, h:  float32 coordinates of the top-left corner and the size, in pixels
+    confidence:  float32, NaN if unknown
+    identifier:  int64 (_NO_IDENTIFIER if none), or a unicode string ("" if none) if any identifier is not an integer
+    keypoints:   Kx3 float32 x, y and confidence of K landmarks, such as the eyes, nose and mouth corners of a face.
+                 Only present if the detector gives keypoints.
+
+    The bboxes attribute gives the boxes as a list of BoundingBox objects, for code that works with those. Use the
+    boxes array and the methods of this class directly when there are many boxes.
     """
 
     def __init__(self, bboxes):
-        self.bboxes = bboxes  # List[BoundingBox]
+        """
+        :param bboxes: the bounding boxes
+        :type bboxes: list[BoundingBox]
+        """
+        self.bboxes = bboxes
+
+    @classmethod
+    def from_array(cls, xywh, confidences=None, identifiers=None, keypoints=None):
+        """
+        Create the message from arrays, without creating BoundingBox objects.
+        :param xywh: Nx4 array of the x, y, w and h of each box
+        :param confidences: array of the N confidences, or None
+        :param identifiers: sequence of the N identifiers, integers or strings, or None
+        :param keypoints: NxKx3 (or Nx3K) array of the x, y and confidence of the keypoints of each box, or None
+        """
+        xywh = np.asarray(xywh, dtype=np.float32).reshape(-1, 4)
+        n_boxes = len(xywh)
+
+        if identifiers is None:
+            identifiers = np.full(n_boxes, _NO_IDENTIFIER, dtype=np.int64)
+        else:
+            identifiers = _identifier_column(identifiers)
+
+        fields = [
+            ("x", "<f4"),
+            ("y", "<f4"),
+            ("w", "<f4"),
+            ("h", "<f4"),
+            ("confidence", "<f4"),
+            ("identifier", identifiers.dtype.str),
+        ]
+        if keypoints is not None:
+            keypoints = np.asarray(keypoints, dtype=np.float32)
+            # the keypoints may be given as flat rows of Kx3 values, known from the columns even without boxes
+            if keypoints.ndim == 3:
+                n_keypoints = keypoints.shape[1]
+            else:
+                n_keypoints = keypoints.shape[-1] // 3
+            keypoints = keypoints.reshape(n_boxes, n_keypoints, 3)
+            fields.append(("keypoints", "<f4", keypoints.shape[1:]))
+
+        boxes = np.empty(n_boxes, dtype=fields)
+        for i, field in enumerate(("x", "y", "w", "h")):
+            boxes[field] = xywh[:, i]
+        boxes["confidence"] = np.nan if confidences is None else confidences
+        boxes["identifier"] = identifiers
+        if keypoints is not None:
+            boxes["keypoints"] = keypoints
+
+        message = cls.__new__(cls)
+        message.boxes = boxes
+        return message
+
+    def _with_boxes(self, boxes):
+        """
+        A new message with (a selection of) the boxes of this one, for the same image.
+        """
+        message = self.__class__.__new__(self.__class__)
+        message.boxes = boxes
+        message._timestamp = self._timestamp
+        message._previous_component_name = self._previous_component_name
+        return message
+
+    def __setstate__(self, state):
+        # older versions of the framework pickle the boxes as a list of BoundingBox objects, in the bboxes attribute,
+        # which would be hidden by the bboxes property
+        state = dict(state)
+        bboxes = state.pop("bboxes", None)
+        self.__dict__.update(state)
+        if bboxes is not None and "boxes" not in state:
+            self.bboxes = bboxes
+
+    def _get_pickle_fields(self):
+        # older versions of the framework read the boxes from a list of BoundingBox objects. A snapshot of the fields,
+        # as reading bboxes stores the list in __dict__.
+        for attr, attr_value in list(self._get_fields()):
+            if attr == "boxes":
+                yield "bboxes", self.bboxes
+            else:
+                yield attr, attr_value
+
+    @property
+    def bboxes(self):
+        """
+        The bounding boxes as a list of BoundingBox objects, created when first accessed. Changing the objects does
+        not change the message, assign the list to bboxes again to do so.
+        :rtype: list[BoundingBox]
+        """
+        boxes = self.boxes
+        view = self.__dict__.get("_bboxes_view", None)
+        if view is not None and view[0] is boxes:
+            return view[1]
+
+        xywh = np.stack([boxes["x"], boxes["y"], boxes["w"], boxes["h"]], axis=1)
+        # cv2 expects pixel coordinates as int
+        if np.array_equal(xywh, np.trunc(xywh)):
+            xywh = xywh.astype(np.int64)
+
+        confidences = boxes["confidence"].astype(object)
+        confidences[np.isnan(boxes["confidence"])] = None
+
+        if "keypoints" in boxes.dtype.names:
+            keypoints = list(boxes["keypoints"])
+        else:
+            keypoints = [None] * len(boxes)
+
+        bboxes = [
+            BoundingBox(
+                x,
+                y,
+                w,
+                h,
+                identifier=identifier,
+                confidence=confidence,
+                keypoints=box_keypoints,
+            )
+            for (x, y, w, h), confidence, identifier, box_keypoints in zip(
+                xywh.tolist(),
+                confidences.tolist(),
+                _identifier_list(boxes["identifier"]),
+                keypoints,
+            )
+        ]
+
+        # not a field, so it is not sent
+        self.__dict__["_bboxes_view"] = (boxes, bboxes)
+        return bboxes
+
+    @bboxes.setter
+    def bboxes(self, bboxes):
+        keypoints = None
+        if bboxes and all(bbox.keypoints is not None for bbox in bboxes):
+            keypoints = [bbox.keypoints for bbox in bboxes]
+
+        identifiers = [bbox.identifier for bbox in bboxes]
+        if all(identifier is None for identifier in identifiers):
+            identifiers = None
+
+        self.boxes = self.from_array(
+            [(bbox.x, bbox.y, bbox.w, bbox.h) for bbox in bboxes],
+            confidences=[
+                np.nan if bbox.confidence is None else bbox.confidence
+                for bbox in bboxes
+            ],
+            identifiers=identifiers,
+            keypoints=keypoints,
+        ).boxes
+
+    def filter_confidence(self, min_confidence):
+        """
+        :return: a BoundingBoxesMessage with the boxes with at least this confidence, boxes without one are removed
+        """
+        return self._with_boxes(self.boxes[self.boxes["confidence"] >= min_confidence])
+
+    def top_k(self, k):
+        """
+        :return: a BoundingBoxesMessage with the k most confident boxes, most confident first. Boxes without a
+        confidence come last, in their original order.
+        """
+        order = np.argsort(-self.boxes["confidence"], kind="mergesort")
+        return self._with_boxes(self.boxes[order[:k]])
+
+    def iou(self, other=None):
+        """
+        The intersection over union of each box of this message with each box of the other message.
+        :param other: a BoundingBoxesMessage, by default this one
+        :return: NxM float32 array
+        """
+        a = self.boxes
+        b = a if other is None else other.boxes
+
+        x1 = np.maximum(a["x"][:, None], b["x"][None, :])
+        y1 = np.maximum(a["y"][:, None], b["y"][None, :])
+        x2 = np.minimum((a["x"] + a["w"])[:, None], (b["x"] + b["w"])[None, :])
+        y2 = np.minimum((a["y"] + a["h"])[:, None], (b["y"] + b["h"])[None, :])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+        union = (a["w"] * a["h"])[:, None] + (b["w"] * b["h"])[None, :] - intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(union > 0, intersection / union, 0).astype(np.float32)
+
+    def scale_to(self, resolution, from_resolution):
+        """
+        Scale the boxes (and keypoints) to an image of another resolution, e.g. to draw the detections of a downscaled
+        image on the original image.
+        :param resolution: the (width, height) to scale to
+        :param from_resolution: the (width, height) of the image the boxes are of
+        :return: a BoundingBoxesMessage with the scaled boxes
+        """
+        scale_x = float(resolution[0]) / from_resolution[0]
+        scale_y = float(resolution[1]) / from_resolution[1]
+
+        boxes = self.boxes.copy()
+        for field, scale in (("x", scale_x), ("y", scale_y), ("w", scale_x), ("h", scale_y)):
+            boxes[field] *= scale
+        if "keypoints" in boxes.dtype.names:
+            boxes["keypoints"][..., 0] *= scale_x
+            boxes["keypoints"][..., 1] *= scale_y
+
+        return self._with_boxes(boxes)
+
+    def _get_fields(self):
+        return (
+            (attr, attr_value)
+            for attr, attr_value in SICMessage._get_fields(self)
+            if attr != "_bboxes_view"
+        )
+
+
+def _identifier_column(identifiers):
+    """
+    The identifier column of BoundingBoxesMessage.boxes: int64 if all identifiers are integers (or None), otherwise
+    unicode strings.
+    """
+    if all(
+        identifier is None or isinstance(identifier, six.integer_types + (np.integer,))
+        for identifier in identifiers
+    ):
+        return np.array(
+            [_NO_IDENTIFIER if i is None else i for i in identifiers], dtype=np.int64
+        )
+
+    strings = [u"" if i is None else six.text_type(i) for i in identifiers]
+    return np.array(strings, dtype="<U{}".format(max([1] + [len(i) for i in strings])))
+
+
+def _identifier_list(column):
+    """
+    The identifiers of an identifier column as a list, with None for boxes without one.
+    """
+    if column.dtype.kind == "i":
+        return [None if i == _NO_IDENTIFIER else i for i in column.tolist()]
+    return [i or None for i in column.tolist()]
@@ -1,6 +1,12 @@
+import bisect
 import collections
+import itertools
+import numbers
+import time
 from abc import ABCMeta, abstractmethod
-from threading import Event
+from threading import Condition, Lock
+
+import numpy as np
 
 from sic_framework.core.component_python2 import SICComponent
 from sic_framework.core.utils import is_sic_instance
@@ -9,20 +15,78 @@ from . import sic_logging
 from .message_python2 import SICConfMessage, SICMessage
 
 
-class MessageQueue(collections.deque):
-    def __init__(self, logger):
+class TimestampBuffer(object):
+    def __init__(self, logger, maxlen):
         """
-        A message buffer, with logging to notify of excessive dropped messages.
+        A buffer of the messages of one input, sorted by the timestamp of their origin, to look up the message
+        nearest to a timestamp in O(log n). Messages are evicted by age, see evict_older_than, and the oldest messages
+        are dropped when there are more than maxlen, with logging to notify of excessive dropped messages.
+        :param maxlen: the maximum number of messages in the buffer
         """
         self.logger = logger
+        self.maxlen = maxlen
         self.dropped_messages_counter = 0
-        super(MessageQueue, self).__init__(maxlen=SICService.MAX_MESSAGE_BUFFER_SIZE)
+        # parallel lists, as bisect does not support a key function on all python versions
+        self.timestamps = []
+        self.messages = []
+
+    def __len__(self):
+        return len(self.messages)
+
+    @staticmethod
+    def get_timestamp(message):
+        # messages without a timestamp of their origin are considered to be created now
+        if message._timestamp is None:
+            return time.time()
+        return message._timestamp
+
+    def insert(self, message):
+        """
+        Insert a message at the position of its timestamp. Messages usually arrive in order, which is an append.
+        """
+        timestamp = self.get_timestamp(message)
+        idx = bisect.bisect_right(self.timestamps, timestamp)
+        self.timestamps.insert(idx, timestamp)
+        self.messages.insert(idx, message)
+
+        if len(self.messages) > self.maxlen:
+            self._drop(len(self.messages) - self.maxlen)
+
+    def newest_timestamp(self):
+        return self.timestamps[-1]
+
+    def nearest(self, timestamp):
+        """
+        :return: the index of the message with the timestamp nearest to the given timestamp
+        """
+        idx = bisect.bisect_left(self.timestamps, timestamp)
+        if idx == len(self.timestamps):
+            return idx - 1
+        if idx > 0 and (
+            timestamp - self.timestamps[idx - 1] <= self.timestamps[idx] - timestamp
+        ):
+            return idx - 1
+        return idx
+
+    def consume(self, idx):
+        """
+        Remove the message at idx, and all older messages as they can no longer be aligned with newer data.
+        """
+        del self.timestamps[: idx + 1]
+        del self.messages[: idx + 1]
+
+    def evict_older_than(self, timestamp):
+        idx = bisect.bisect_left(self.timestamps, timestamp)
+        if idx > 0:
+            self._drop(idx)
 
-    def appendleft(self, x):
+    def _drop(self, n):
+        """
+        Drop the n oldest messages.
+        """
         # TODO when inputs arrive faster than processing, the buffer might fill up. Do we want to handle this better or
         # just silence the logging. Maybe its better to log only when receiving lots of messages but never executing.
-
-        if len(self) == self.maxlen:
+        for message in self.messages[:n]:
             self.dropped_messages_counter += 1
             if self.dropped_messages_counter in {
                 5,
@@ -36,10 +100,12 @@ class MessageQueue(collections.deque):
             }:
                 self.logger.warning(
                     "Dropped {} messages of type {}".format(
-                        self.dropped_messages_counter, x.get_message_name()
+                        self.dropped_messages_counter, message.get_message_name()
                     )
                 )
-        return super(MessageQueue, self).appendleft(x)
+
+        del self.timestamps[:n]
+        del self.messages[:n]
 
 
 class PopMessageException(ValueError):
@@ -97,23 +163,44 @@ class SICMessageDictionary:
         )
 
 
+# Policies to align the messages of multiple inputs, see SICService.SYNC_POLICY
+# Use the message of every input nearest to the newest timestamp for which all inputs have data
+SYNC_EXACT_NEAREST = "exact_nearest"
+# Use the newest message of every input, regardless of their timestamps
+SYNC_LATEST_ONLY = "latest_only"
+# Like SYNC_EXACT_NEAREST, but linearly interpolate the fields the messages declare in _interpolated_fields between the
+# two messages around the timestamp, other fields are taken from the nearest message
+SYNC_INTERPOLATE = "interpolate"
+# Use the newest set of messages, one per input, whose timestamps are all within MAX_MESSAGE_AGE_DIFF_IN_SECONDS
+SYNC_APPROXIMATE_TIME = "approximate_time"
+
+
 class SICService(SICComponent):
     """
     Abstract class for services that provides data fusion based on the timestamp of the data origin.
     """
 
-    MAX_MESSAGE_BUFFER_SIZE = 10
+    # How messages of multiple inputs are aligned, see the SYNC_ policies
+    SYNC_POLICY = SYNC_EXACT_NEAREST
+    # The maximum time between the timestamps of aligned messages (the slop)
     MAX_MESSAGE_AGE_DIFF_IN_SECONDS = (
         0.5  # TODO tune? maybe in config? Can be use case dependent
     )
+    # Messages older than this, compared to the newest message of the same input, are dropped from the input buffers.
+    # Not compared across inputs, as the clocks of the devices the inputs come from might differ.
+    MAX_MESSAGE_AGE_IN_SECONDS = 2.0
+    # The maximum number of messages in the buffer of an input, also when their timestamps are not increasing
+    MAX_MESSAGE_BUFFER_SIZE = 100
 
     def __init__(self, *args, **kwargs):
         super(SICService, self).__init__(*args, **kwargs)
 
-        # this event is set whenever a new message arrives.
-        self._new_data_event = Event()
-
+        # the input buffers are filled by the message handler thread and emptied by the service thread, which waits
+        # for the condition to be notified when a new message arrives or the service stops.
         self._input_buffers = dict()
+        self._input_buffers_lock = Lock()
+        self._input_condition = Condition(self._input_buffers_lock)
+        self._new_data = False
 
     def start(self):
         """
@@ -137,71 +224,141 @@ class SICService(SICComponent):
     def _pop_messages(self):
         """
         Collect all input SICdata messages gathered in the buffers into a dictionary to use in the execute method.
-        Make sure all input messages are aligned to the newest timestamp to synchronise the input data.
+        Make sure all input messages are aligned according to the SYNC_POLICY to synchronise the input data.
         If multiple channels contain the same type, give them an index in the service_input dict.
 
         If the buffers do not contain an aligned set of messages, a PopMessageException is raised.
         :raises: PopMessageException
         :return: tuple of dictionary of messages and the shared timestamp
         """
-
-        self.logger.debug_framework_verbose(
-            "input buffers: {}".format(
-                [(k, len(v)) for k, v in self._input_buffers.items()]
-            )
-        )
-
-        # First, get the most recent message for all buffers. Then, select the oldest message from these messages.
-        # The timestamp of this message corresponds to the most recent timestamp for which we have all information
-        # available
-        try:
-            selected_timestamp = min(
-                [buffer[0]._timestamp for buffer in self._input_buffers.values()]
-            )
-        except IndexError:
-            # Not all buffers are full, so do not pop messages
-            raise PopMessageException(
-                "Could not collect aligned input data from buffers, not all buffers filled"
+        with self._input_buffers_lock:
+            self.logger.debug_framework_verbose(
+                "input buffers: {}".format(
+                    [(k, len(v)) for k, v in self._input_buffers.items()]
+                )
             )
 
-        # Buffers are created dynamically, based on the source components. Only start executing once
-        # we have at least one buffer per message type
-        if len(self._input_buffers) != len(self.get_inputs()):
-            raise PopMessageException("Not enough buffer has been created yet")
-
-        # Second, we go through each buffer and check if we can find a message that is within the time difference
-        # threshold. Duplicate input types are in separate buffers based on their _previous_component attribute.
-
-        # TODO might raise
-        # RuntimeError: deque mutated during iteration
-        # in for msg in buffer: as on_message could be set while iterating
-        message_dict = SICMessageDictionary()
-        messages_to_remove = []
-        for name, buffer in self._input_buffers.items():
-            # get the newest message in the buffer closest to the selected timestamp
-            # if there is none, we raise a ValueError to stop searching and wait for new data again
-            for msg in buffer:
-                if (
-                    abs(msg._timestamp - selected_timestamp)
-                    <= self.MAX_MESSAGE_AGE_DIFF_IN_SECONDS
-                ):
+            # Buffers are created dynamically, based on the source components. Only start executing once
+            # we have at least one buffer per message type
+            if len(self._input_buffers) != len(self.get_inputs()):
+                raise PopMessageException("Not enough buffer has been created yet")
 
-                    message_dict.set(msg)
-                    messages_to_remove.append(msg)
-                    break
-            else:
-                # the timestamps across all buffers did not align within the threshold, so do not pop messages
+            buffers = list(self._input_buffers.values())
+            if not all(len(buffer) for buffer in buffers):
+                # Not all buffers are full, so do not pop messages
                 raise PopMessageException(
-                    "Could not collect aligned input data from buffers, no matching timestamps"
+                    "Could not collect aligned input data from buffers, not all buffers filled"
                 )
 
-        # Third, we now know all buffers contain a valid (aligned) message for the timestamp
-        # only then, consume these messages from the buffers and return the messages.
-        for buffer, msg in zip(self._input_buffers.values(), messages_to_remove):
-            buffer.remove(msg)
+            if self.SYNC_POLICY == SYNC_LATEST_ONLY:
+                selected = [len(buffer) - 1 for buffer in buffers]
+                selected_timestamp = min(b.newest_timestamp() for b in buffers)
+            elif self.SYNC_POLICY == SYNC_APPROXIMATE_TIME:
+                selected, selected_timestamp = self._select_approximate_time(buffers)
+            elif self.SYNC_POLICY in (SYNC_EXACT_NEAREST, SYNC_INTERPOLATE):
+                # The oldest of the newest messages of all buffers is the most recent timestamp for which we have all
+                # information available
+                selected_timestamp = min(b.newest_timestamp() for b in buffers)
+                selected = [buffer.nearest(selected_timestamp) for buffer in buffers]
+
+                for buffer, idx in zip(buffers, selected):
+                    if (
+                        abs(buffer.timestamps[idx] - selected_timestamp)
+                        > self.MAX_MESSAGE_AGE_DIFF_IN_SECONDS
+                    ):
+                        # the timestamps across all buffers did not align within the threshold, so do not pop messages
+                        raise PopMessageException(
+                            "Could not collect aligned input data from buffers, no matching timestamps"
+                        )
+            else:
+                raise ValueError("Unknown SYNC_POLICY {}".format(self.SYNC_POLICY))
+
+            # We now know all buffers contain a valid (aligned) message for the timestamp, only then consume these
+            # messages from the buffers and return the messages.
+            message_dict = SICMessageDictionary()
+            for buffer, idx in zip(buffers, selected):
+                message = buffer.messages[idx]
+                if self.SYNC_POLICY == SYNC_INTERPOLATE:
+                    message = self._interpolate(buffer, idx, selected_timestamp)
+                message_dict.set(message)
+                buffer.consume(idx)
 
         return message_dict, selected_timestamp
 
+    def _select_approximate_time(self, buffers):
+        """
+        Find the newest set of messages, one per buffer, that are all within MAX_MESSAGE_AGE_DIFF_IN_SECONDS of each
+        other. Every candidate set is anchored at a message of the buffer with the oldest newest message, and uses the
+        nearest message of every other buffer.
+        :return: tuple of the index of the selected message in each buffer and their oldest timestamp
+        """
+        anchor = min(buffers, key=lambda b: b.newest_timestamp())
+
+        # the most recent anchors first, as we prefer the newest aligned data
+        for timestamp in reversed(anchor.timestamps):
+            selected = [buffer.nearest(timestamp) for buffer in buffers]
+            timestamps = [b.timestamps[idx] for b, idx in zip(buffers, selected)]
+
+            spread = max(timestamps) - min(timestamps)
+            if spread <= self.MAX_MESSAGE_AGE_DIFF_IN_SECONDS:
+                return selected, min(timestamps)
+
+        raise PopMessageException(
+            "Could not collect aligned input data from buffers, no matching timestamps"
+        )
+
+    @staticmethod
+    def _interpolate(buffer, idx, timestamp):
+        """
+        Linearly interpolate the fields the message class declares in _interpolated_fields (numbers, sequences of
+        numbers and numeric arrays) between the messages before and after the timestamp in the buffer. All other
+        fields, such as images, are taken from the nearest message.
+        :param idx: the index of the message nearest to the timestamp
+        :return: the message at idx, or a copy with the interpolated values
+        """
+        # the nearest message is one of the two messages around the timestamp
+        if buffer.timestamps[idx] > timestamp:
+            before, after = idx - 1, idx
+        else:
+            before, after = idx, idx + 1
+
+        if before < 0 or after >= len(buffer):
+            return buffer.messages[idx]
+
+        t0, t1 = buffer.timestamps[before], buffer.timestamps[after]
+        if t1 == t0:
+            return buffer.messages[idx]
+
+        weight = (timestamp - t0) / float(t1 - t0)
+        m0, m1 = buffer.messages[before], buffer.messages[after]
+
+        message = buffer.messages[idx]._copy_on_write()
+        message._timestamp = timestamp
+
+        for attr in m0._interpolated_fields:
+            v0, v1 = getattr(m0, attr, None), getattr(m1, attr, None)
+
+            if isinstance(v0, np.ndarray) and isinstance(v1, np.ndarray):
+                if v0.shape == v1.shape and np.issubdtype(v0.dtype, np.number):
+                    value = v0 + (v1.astype(np.float64) - v0) * weight
+                    setattr(message, attr, value.astype(v0.dtype))
+            elif isinstance(v0, (list, tuple)) and isinstance(v1, (list, tuple)):
+                if len(v0) == len(v1) and all(
+                    isinstance(v, numbers.Real) and not isinstance(v, bool)
+                    for v in itertools.chain(v0, v1)
+                ):
+                    value = [a + (b - a) * weight for a, b in zip(v0, v1)]
+                    setattr(message, attr, type(v0)(value))
+            elif (
+                isinstance(v0, numbers.Real)
+                and isinstance(v1, numbers.Real)
+                and not isinstance(v0, bool)
+                and not isinstance(v1, bool)
+            ):
+                setattr(message, attr, v0 + (v1 - v0) * weight)
+
+        return message
+
     def on_message(self, message):
         """
         Collect an input message into the appropriate buffer.
@@ -214,28 +371,36 @@ class SICService(SICComponent):
 
         idx = (message.get_message_name(), message._previous_component_name)
 
-        try:
-            self._input_buffers[idx].appendleft(message)
-        except KeyError:
-            self._input_buffers[idx] = MessageQueue(self.logger)
-            self._input_buffers[idx].appendleft(message)
+        with self._input_buffers_lock:
+            buffer = self._input_buffers.get(idx, None)
+            if buffer is None:
+                buffer = TimestampBuffer(self.logger, self.MAX_MESSAGE_BUFFER_SIZE)
+                self._input_buffers[idx] = buffer
+            buffer.insert(message)
 
-        self._new_data_event.set()
+            # evict stale data of this input, relative to its own newest data
+            buffer.evict_older_than(
+                buffer.newest_timestamp() - self.MAX_MESSAGE_AGE_IN_SECONDS
+            )
+
+            self._new_data = True
+            self._input_condition.notify()
 
     def _listen(self):
         """
         Wait for data and execute the service when possible.
         """
-        while not self._stop_event.is_set():
-            # wait for new data to be set by the _process_message callback, and check every .1 second to check if the
-            # service must stop
-            self._new_data_event.wait(timeout=0.1)
+        while True:
+            # wait for new data to be set by the on_message callback, or for the service to stop
+            with self._input_condition:
+                while not self._new_data and not self._stop_event.is_set():
+                    self._input_condition.wait()
 
-            if not self._new_data_event.is_set():
-                continue
+                if self._stop_event.is_set():
+                    break
 
-            # clear the flag so we will wait for new data again next iteration
-            self._new_data_event.clear()
+                # clear the flag so we will wait for new data again next iteration
+                self._new_data = False
 
             # pop messages if all buffers contain a timestamp aligned message, if not a PopMessageException is raised
             # and we will have to wait for new data
@@ -260,3 +425,10 @@ class SICService(SICComponent):
 
         self.logger.debug("Stopped listening")
         self.stop()
+
+    def stop(self, *args):
+        super(SICService, self).stop(*args)
+
+        # wake up the service thread, so it notices the stop event immediately
+        with self._input_condition:
+            self._input_condition.notify_all()
@@ -0,0 +1,239 @@
+"""
+Same-host transport for large numpy arrays. Instead of sending the array through redis, the sender writes it into a
+ring buffer in shared memory and only sends a small descriptor. Receivers on the same host copy the array out of
+shared memory as soon as the message is received, so the array stays valid when the sender reuses the slot.
+
+SICRedis uses this automatically for channels whose subscribers all run on the same host as the sender, see
+SICRedis.send_message. Python 3 only.
+"""
+
+import atexit
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+from . import utils
+
+# Arrays smaller than this are sent inline, as the redis round trip is not the bottleneck for them.
+MIN_SHARED_MEMORY_BYTES = int(os.getenv("SIC_SHARED_MEMORY_MIN_BYTES", 64 * 1024))
+
+# Each slot starts with the sequence number of the array in it, so readers can detect if the slot was overwritten.
+_SLOT_HEADER = struct.Struct("<Q")
+# Align the array data to cache lines
+_SLOT_ALIGNMENT = 64
+
+# All segments created or attached to by this process, by name, and the names of the ones created by this process
+_segments = dict()
+_owned_segments = set()
+_segments_lock = threading.Lock()
+
+
+class SharedMemoryFrameLost(RuntimeError):
+    """
+    The array in shared memory was overwritten (or its segment removed) before it was read. The receiver did not keep
+    up with the sender, or kept the message longer than the ring buffer holds arrays.
+    """
+
+
+def _align(n):
+    return (n + _SLOT_ALIGNMENT - 1) // _SLOT_ALIGNMENT * _SLOT_ALIGNMENT
+
+
+class SharedMemoryRing(object):
+    """
+    A ring buffer of fixed size slots in a shared memory segment, owned by the sender. Every array written gets the
+    next slot, so an array stays readable until N_SLOTS more arrays are written. The segment is replaced by a larger
+    one when an array does not fit in a slot.
+    """
+
+    N_SLOTS = int(os.getenv("SIC_SHARED_MEMORY_SLOTS", 32))
+
+    def __init__(self):
+        # segments are named sic_<ring id>_<generation>, so receivers can tell when a ring replaced its segment
+        self._id = utils.str_if_bytes(utils.random_hex())
+        self._generation = 0
+        self._shm = None
+        self._slot_size = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _allocate(self, nbytes):
+        if self._shm is not None:
+            # receivers that already attached keep their mapping, it is freed once they are done with it
+            self._release()
+
+        self._slot_size = _align(_SLOT_HEADER.size) + _align(nbytes)
+        self._generation += 1
+        name = "sic_{}_{}".format(self._id, self._generation)
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=self._slot_size * self.N_SLOTS
+        )
+
+        with _segments_lock:
+            _segments[self._shm.name] = self._shm
+            _owned_segments.add(self._shm.name)
+
+    @staticmethod
+    def accepts(value):
+        """
+        Whether the value is a numpy array large enough to send through shared memory.
+        """
+        return (
+            isinstance(value, np.ndarray)
+            and not value.dtype.hasobject
+            and value.nbytes >= MIN_SHARED_MEMORY_BYTES
+        )
+
+    def write(self, array):
+        """
+        Copy the array into the next slot.
+        :param array: a numpy array
+        :return: the descriptor to read the array with, see read_array
+        """
+        array = np.ascontiguousarray(array)
+
+        with self._lock:
+            if array.nbytes > self._slot_size - _align(_SLOT_HEADER.size):
+                # grow by at least a factor two, to not reallocate for every slightly larger array
+                self._allocate(max(array.nbytes, 2 * self._slot_size))
+
+            self._seq += 1
+            offset = (self._seq % self.N_SLOTS) * self._slot_size
+            buf = self._shm.buf
+
+            # mark the slot as being written, so a reader can not mistake a half written slot for the previous array
+            _SLOT_HEADER.pack_into(buf, offset, 0)
+            data_offset = offset + _align(_SLOT_HEADER.size)
+            target = np.ndarray(
+                array.shape, dtype=array.dtype, buffer=buf, offset=data_offset
+            )
+            target[...] = array
+            _SLOT_HEADER.pack_into(buf, offset, self._seq)
+
+            return "{}:{}:{}".format(self._shm.name, offset, self._seq)
+
+    def _release(self):
+        with _segments_lock:
+            _segments.pop(self._shm.name, None)
+            _owned_segments.discard(self._shm.name)
+        try:
+            self._shm.unlink()
+            self._shm.close()
+        except (BufferError, FileNotFoundError):
+            # arrays in this process still point to the segment, it is freed when they are
+            pass
+        self._shm = None
+
+    def close(self):
+        with self._lock:
+            if self._shm is not None:
+                self._release()
+
+
+def _open(name):
+    """
+    Attach to a segment created by another process.
+    :raises FileNotFoundError: if the segment no longer exists
+    """
+    shm = shared_memory.SharedMemory(name=name)
+
+    # the sender owns the segment. Before python 3.13 the resource tracker unlinks every segment a process
+    # attached to when it exits, which would remove it for the sender and other receivers as well.
+    if sys.version_info < (3, 13):
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    return shm
+
+
+def _close_stale_segments(name):
+    """
+    Close the segments this process attached to that are no longer used: the previous segments of the ring that
+    created the given segment, and segments that were removed by their sender (e.g. because it restarted). Only called
+    when a new segment is attached, which is rare. Must hold _segments_lock.
+    :param name: the name of the newly attached segment
+    """
+    ring_prefix = name.rsplit("_", 1)[0] + "_"
+
+    for other in list(_segments):
+        if other in _owned_segments or other == name:
+            continue
+
+        stale = other.startswith(ring_prefix)
+        if not stale:
+            try:
+                _open(other).close()
+            except FileNotFoundError:
+                stale = True
+
+        if stale:
+            try:
+                _segments.pop(other).close()
+            except BufferError:
+                # an array in this process still points to the segment, it is freed when it is
+                pass
+
+
+def _attach(name):
+    with _segments_lock:
+        shm = _segments.get(name, None)
+
+        if shm is None:
+            try:
+                shm = _open(name)
+            except FileNotFoundError:
+                raise SharedMemoryFrameLost(
+                    "Shared memory segment {} no longer exists".format(name)
+                )
+
+            _close_stale_segments(name)
+            _segments[name] = shm
+
+        return shm
+
+
+def read_array(descriptor, dtype, shape):
+    """
+    Copy an array written by a SharedMemoryRing out of shared memory. A view on the ring buffer slot would silently
+    change once the sender reuses the slot (see SharedMemoryRing.N_SLOTS), e.g. while the message waits in a handler
+    queue, so the array is copied, and the slot is checked again afterwards to detect it was overwritten while copying.
+    :param descriptor: the descriptor returned by SharedMemoryRing.write
+    :return: the numpy array
+    :raises SharedMemoryFrameLost: if the slot no longer holds the array
+    """
+    name, offset, seq = utils.str_if_bytes(descriptor).rsplit(":", 2)
+    offset, seq = int(offset), int(seq)
+
+    buf = _attach(name).buf
+
+    _check_slot(buf, name, offset, seq)
+    array = np.ndarray(
+        shape, dtype=dtype, buffer=buf, offset=offset + _align(_SLOT_HEADER.size)
+    ).copy()
+    _check_slot(buf, name, offset, seq)
+
+    return array
+
+
+def _check_slot(buf, name, offset, seq):
+    (slot_seq,) = _SLOT_HEADER.unpack_from(buf, offset)
+    if slot_seq != seq:
+        raise SharedMemoryFrameLost(
+            "Array {} in shared memory {} was overwritten by array {}".format(
+                seq, name, slot_seq
+            )
+        )
+
+
+@atexit.register
+def _close_segments():
+    # segments are unlinked by their SharedMemoryRing owners, only close the mappings
+    with _segments_lock:
+        for shm in _segments.values():
+            try:
+                shm.close()
+            except BufferError:
+                pass
@@ -82,6 +82,9 @@ class SICLogStream(io.TextIOBase):
         self.redis = redis
         self.logging_channel = logging_channel
 
+        # publish the log lines in batches, so verbose logging does not wait for a round trip to redis for every line
+        self.redis.set_channel_batching(logging_channel)
+
     def readable(self):
         return False
 
@@ -28,26 +28,387 @@ to request handlers with
 """
 
 import atexit
+import collections
+import functools
 import os
+import socket
+import sys
 import threading
 import time
+import traceback
 
+import numpy as np
 import redis
 import six
-from six.moves import queue
 
-from sic_framework.core import utils
-from sic_framework.core.message_python2 import SICMessage, SICRequest
+from sic_framework.core import array_codecs, message_python2, utils
+from sic_framework.core.message_python2 import SICBusyMessage, SICMessage, SICRequest
 from sic_framework.core.utils import is_sic_instance
 
+# Send large numpy arrays through shared memory to subscribers on the same host, see SICRedis.send_message.
+# Set SIC_SHARED_MEMORY=0 to always send them through redis. Requires python 3.8+.
+SHARED_MEMORY = (
+    sys.version_info >= (3, 8) and os.getenv("SIC_SHARED_MEMORY", "1") != "0"
+)
+
+# Hand messages directly to subscribers in the same process, see SICRedis.send_message. Set SIC_IN_PROCESS=0 to
+# always send them through redis.
+IN_PROCESS_DELIVERY = os.getenv("SIC_IN_PROCESS", "1") != "0"
+
+# The transports a channel can be sent over, see SICRedis.set_channel_transport
+# Redis pub/sub (the default): messages are lost when a subscriber is slow or (re)connecting. E.g. for camera images.
+TRANSPORT_PUBSUB = "pubsub"
+# A capped redis stream read with consumer groups: messages are not lost while a subscriber is slow. E.g. for audio,
+# of which every chunk is needed. Requires redis 5.0+.
+TRANSPORT_STREAM = "stream"
+
+
+# Quality of service policies for the queue of messages waiting for a callback, see QoS
+# Queue all messages, without a limit (the default)
+QOS_RELIABLE = "reliable"
+# Keep only the newest `depth` messages, dropping older messages that are still waiting. E.g. for camera images.
+QOS_LATEST_ONLY = "latest_only"
+# Queue at most `depth` messages and never drop any: when the queue is full, receiving messages on this SICRedis waits
+# until the callback catches up. E.g. for audio.
+QOS_BOUNDED_FIFO = "bounded_fifo"
+# Queue at most `depth` messages, dropping the oldest message when the queue is full. E.g. for telemetry.
+QOS_DROP_OLDEST = "drop_oldest"
+# Queue at most `depth` messages, dropping new messages when the queue is full. E.g. for requests, which are replied to
+# with a SICBusyMessage when dropped, see SICRedis.register_request_handler.
+QOS_DROP_NEWEST = "drop_newest"
+
+
+class QoS(object):
+    def __init__(self, policy=QOS_RELIABLE, depth=None):
+        """
+        The quality of service of a message handler: how messages are queued when they arrive faster than the
+        handler processes them.
+
+        Example:
+            r.register_message_handler("camera", on_image, qos=QoS(QOS_LATEST_ONLY))
+            r.register_message_handler("microphone", on_audio, qos=QoS(QOS_BOUNDED_FIFO, depth=100))
+
+        Note: with QOS_BOUNDED_FIFO, a full queue also holds up the other handlers (and request replies) of the same
+        SICRedis, so the handler must never wait for those.
+        :param policy: One of the QOS_ policies.
+        :param depth: The maximum number of waiting messages. Defaults to 1 for QOS_LATEST_ONLY, and is required for
+                      the other policies, except QOS_RELIABLE.
+        """
+        if policy == QOS_LATEST_ONLY and depth is None:
+            depth = 1
+
+        if policy not in (
+            QOS_RELIABLE,
+            QOS_LATEST_ONLY,
+            QOS_BOUNDED_FIFO,
+            QOS_DROP_OLDEST,
+            QOS_DROP_NEWEST,
+        ):
+            raise ValueError("Unknown QoS policy {}".format(policy))
+        if policy != QOS_RELIABLE and (depth is None or depth < 1):
+            raise ValueError(
+                "QoS policy {} requires a depth of at least 1".format(policy)
+            )
+
+        self.policy = policy
+        self.depth = depth
+
+
+class ChannelStats(object):
+    def __init__(self):
+        """
+        Counters of the messages received on a channel by a message handler.
+        """
+        self.received = 0
+        self.dropped = 0
+
+    def __repr__(self):
+        return "ChannelStats(received={}, dropped={})".format(
+            self.received, self.dropped
+        )
+
+
+class CallbackQueue(object):
+    def __init__(self, qos=None):
+        """
+        The messages waiting to be handled by a callback, queued according to its QoS. Messages are put by the
+        reader thread, or by the sender for messages from this process, and taken by the callback worker thread.
+        """
+        self.qos = qos if qos is not None else QoS()
+        self.channel_stats = collections.defaultdict(ChannelStats)
+        self.max_depth = 0
+        self._messages = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._messages)
+
+    def put(self, channel, message):
+        """
+        Queue a message according to the QoS.
+        :return: False if the message was dropped because the queue is full (QOS_DROP_NEWEST), True otherwise
+        """
+        with self._condition:
+            if self._closed:
+                return True
+
+            stats = self.channel_stats[channel]
+            stats.received += 1
+
+            depth = self.qos.depth
+            if depth is not None:
+                if self.qos.policy == QOS_BOUNDED_FIFO:
+                    while len(self._messages) >= depth and not self._closed:
+                        self._condition.wait()
+                    if self._closed:
+                        return True
+                elif self.qos.policy == QOS_DROP_NEWEST:
+                    if len(self._messages) >= depth:
+                        stats.dropped += 1
+                        if isinstance(message, _StreamDelivery):
+                            message.done()
+                        return False
+                elif len(self._messages) >= depth:
+                    dropped_channel, dropped = self._messages.popleft()
+                    self.channel_stats[dropped_channel].dropped += 1
+                    if isinstance(dropped, _StreamDelivery):
+                        # dropping is how this handler handles the message, do not redeliver it
+                        dropped.done()
+
+            self._messages.append((channel, message))
+            self.max_depth = max(self.max_depth, len(self._messages))
+            self._condition.notify_all()
+            return True
+
+    def get(self):
+        """
+        Wait for the next message. Once the queue is closed, the remaining messages are returned first.
+        :return: the message (or _StreamDelivery), or _STOP_CALLBACK when the queue is closed and empty
+        """
+        with self._condition:
+            while not self._messages and not self._closed:
+                self._condition.wait()
+
+            if not self._messages:
+                return _STOP_CALLBACK
+
+            _, message = self._messages.popleft()
+            self._condition.notify_all()
+            return message
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
 
 class CallbackThread:
-    def __init__(self, function, pubsub, thread):
+    def __init__(
+        self,
+        function,
+        pubsub,
+        thread,
+        channels=None,
+        ignore_requests=True,
+        qos=None,
+        priority=None,
+    ):
+        """
+        A callback registered on one or more channels of a SICRedis. Messages are read from the shared pubsub
+        connection by the SICRedis reader thread and handed to this callback. If `thread` is set, the callback is
+        executed in that (worker) thread, so a slow or blocking callback does not hold up other callbacks. Messages
+        wait in the queue according to the QoS. If `thread` is None, the callback is executed inline on the reader
+        thread and must therefore never block.
+
+        A callback can have multiple worker threads taking messages from the queue (`threads`), and a priority lane:
+        messages for which `priority` returns true are put in a queue of their own, with a worker thread of its own.
+        """
         self.function = function
         self.pubsub = pubsub
         self.thread = thread
+        self.threads = [thread] if thread is not None else []
+        self.channels = channels if channels else []
+        self.ignore_requests = ignore_requests
+        self.queue = CallbackQueue(qos)
+        self.priority = priority
+        self.priority_queue = CallbackQueue() if priority is not None else None
+        # called with the messages dropped because the queue is full, see QOS_DROP_NEWEST
+        self.on_drop = None
+        # the channels that are read from a redis stream instead of pubsub, see SICRedis.set_channel_transport
+        self.stream_channels = []
+
+
+class _StreamDelivery:
+    def __init__(self, message, n_callbacks, ack):
+        """
+        A message read from a redis stream, that is acknowledged once all callbacks that it was queued for handled it.
+        Until then, it is redelivered when the SICRedis reconnects to redis.
+        """
+        self.message = message
+        self._remaining = n_callbacks
+        self._ack = ack
+        self._lock = threading.Lock()
+
+    def done(self):
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+
+        if last:
+            self._ack()
+
+
+class _PendingRequest:
+    def __init__(self):
+        """
+        A request awaiting its reply on the reply inbox of a SICRedis.
+        """
+        self.done = threading.Event()
+        self.reply = None
 
 
+class _PublishBatcher:
+    # senders wait when this many times max_messages are queued, until the thread catches up
+    MAX_QUEUED_BATCHES = 4
+
+    def __init__(self, redis_client, thread_name):
+        """
+        Publishes the messages of the batched channels of a SICRedis from a thread of its own. All messages queued
+        while the previous batch was being published are sent in a single redis pipeline, taking one round trip.
+        See SICRedis.set_channel_batching.
+        """
+        self._redis = redis_client
+        self._messages = []
+        # the time by which the queued messages must be published, None if there are none
+        self._deadline = None
+        self._n_queued = 0
+        self._n_published = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, name=thread_name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, channel, data, max_delay, max_messages):
+        with self._condition:
+            while (
+                len(self._messages) >= self.MAX_QUEUED_BATCHES * max_messages
+                and not self._closed
+                and self._thread.is_alive()
+            ):
+                self._condition.wait(0.1)
+
+            self._messages.append((channel, data))
+            self._n_queued += 1
+
+            if len(self._messages) >= max_messages:
+                deadline = 0
+            else:
+                deadline = time.time() + max_delay
+            if self._deadline is None or deadline < self._deadline:
+                self._deadline = deadline
+                self._condition.notify_all()
+
+    def flush(self):
+        """
+        Publish the queued messages now, and wait until they are published.
+        """
+        with self._condition:
+            n_queued = self._n_queued
+            if self._n_published >= n_queued:
+                return
+
+            self._deadline = 0
+            self._condition.notify_all()
+            while self._n_published < n_queued and self._thread.is_alive():
+                self._condition.wait(0.1)
+
+    def close(self):
+        """
+        Publish the queued messages and stop the thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (
+                    self._deadline is None or self._deadline > time.time()
+                ):
+                    if self._deadline is None:
+                        self._condition.wait()
+                    else:
+                        self._condition.wait(self._deadline - time.time())
+
+                if self._closed and not self._messages:
+                    return
+
+                messages = self._messages
+                self._messages = []
+                self._deadline = None
+
+            pipe = self._redis.pipeline(transaction=False)
+            for channel, data in messages:
+                pipe.publish(channel, data)
+            try:
+                pipe.execute()
+            except Exception as e:
+                # not logged through a SICLogStream, as that would queue another message to publish
+                print(
+                    "Could not publish {} messages to redis: {}".format(
+                        len(messages), e
+                    )
+                )
+
+            with self._condition:
+                self._n_published += len(messages)
+                self._condition.notify_all()
+
+
+class _InProcessBus:
+    def __init__(self):
+        """
+        The SICRedis instances in this process that are subscribed to each channel, to hand messages to directly.
+        """
+        self._subscribers = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, sic_redis):
+        with self._lock:
+            for c in channels:
+                self._subscribers[c].append(sic_redis)
+
+    def unsubscribe(self, channels, sic_redis):
+        with self._lock:
+            for c in channels:
+                if sic_redis in self._subscribers.get(c, []):
+                    self._subscribers[c].remove(sic_redis)
+                    if not self._subscribers[c]:
+                        del self._subscribers[c]
+
+    def get_subscribers(self, channel):
+        with self._lock:
+            return list(self._subscribers.get(channel, []))
+
+
+_in_process_bus = _InProcessBus()
+
+# The reader thread blocks on the pubsub connection until a message arrives. Older redis versions on python2 devices
+# might not support blocking reads, so poll there.
+_PUBSUB_READ_TIMEOUT = None if six.PY3 else 0.1
+# The same for the stream reader thread, in milliseconds (0 blocks until a message arrives)
+_STREAM_READ_BLOCK_MS = 0 if six.PY3 else 100
+
+# sentinel to signal a callback worker thread to stop
+_STOP_CALLBACK = object()
+
 # keep track of all redis instances, so we can close them on exit
 _sic_redis_instances = []
 
@@ -76,6 +437,119 @@ def get_redis_db_ip_password():
     return host, password
 
 
+# The connection pool to each redis server, shared by all SICRedis instances in this process, with the keyword
+# arguments to connect with, by host and password. See get_connection_pool.
+_connections = dict()
+_connections_lock = threading.Lock()
+
+
+def _connect(host, password):
+    """
+    Connect to redis, trying whether a password and TLS are required.
+    :return: the redis client and the keyword arguments it was created with
+    """
+    # Let's try to connect first without TLS / working without TLS facilitates simple use of redis-cli
+    kwargs = dict(host=host, ssl=False, password=password)
+    try:
+        client = redis.Redis(**kwargs)
+        client.ping()
+    except redis.exceptions.AuthenticationError:
+        # redis is running without a password, do not supply it.
+        kwargs = dict(host=host, ssl=False)
+        client = redis.Redis(**kwargs)
+        client.ping()
+    except redis.exceptions.ConnectionError as e:
+        # Must be a connection error; so now let's try to connect with TLS
+        ssl_ca_certs = os.path.join(os.path.dirname(__file__), "cert.pem")
+        print(
+            "TLS required. Looking for certificate here:",
+            ssl_ca_certs,
+            "(Source error {})".format(e),
+        )
+        kwargs = dict(host=host, ssl=True, ssl_ca_certs=ssl_ca_certs, password=password)
+        try:
+            client = redis.Redis(**kwargs)
+            client.ping()
+        except redis.exceptions.ConnectionError:
+            e = Exception(
+                "Could not connect to redis at {} \n\n Have you started redis? Use: `redis-server conf/redis/redis.conf`".format(
+                    host
+                )
+            )
+            # six.raise_from(e, None) # unsupported on some peppers
+            six.reraise(Exception, e, None)
+
+    return client, kwargs
+
+
+def _get_connection():
+    host, password = get_redis_db_ip_password()
+
+    with _connections_lock:
+        connection = _connections.get((host, password), None)
+
+        if connection is None:
+            client, kwargs = _connect(host, password)
+            connection = (client.connection_pool, kwargs)
+            _connections[(host, password)] = connection
+
+        return connection
+
+
+def get_connection_pool():
+    """
+    The connection pool to the redis server (see get_redis_db_ip_password), shared by all SICRedis instances in this
+    process. Whether redis requires a password or TLS is tried only once, when the pool is created.
+    """
+    return _get_connection()[0]
+
+
+def get_connection_kwargs():
+    """
+    The keyword arguments to create a redis client with, such as a redis.asyncio.Redis, as determined when creating
+    the connection pool.
+    """
+    return dict(_get_connection()[1])
+
+
+def get_hosts_key(channel):
+    """
+    The redis hash in which every subscriber of a channel registers the host it runs on, by client id.
+    """
+    return "sic:hosts:{}".format(channel)
+
+
+def get_stream_group(name, client_id):
+    """
+    The consumer group a client reads the streams of stream channels with: one per client, named after the component
+    or application using it, for easier debugging. Other clients can tell whether the client is still connected from
+    the client id at the end, see SICRedis._remove_dead_stream_groups.
+    """
+    if name:
+        return "{}:{}".format(name, client_id)
+    return client_id
+
+
+def get_codecs_key(channel):
+    """
+    The redis hash in which every subscriber of a channel registers the array codecs it supports, by client id. For
+    the stream of a channel (see get_stream_key), every consumer group registers them, by group name. The codecs are
+    a comma separated list of names, see array_codecs.
+    """
+    return "sic:codecs:{}".format(channel)
+
+
+# The redis hash of the channels that are sent over a redis stream, with the maximum length of the stream
+STREAM_CHANNELS_KEY = "sic:streams"
+
+
+def get_stream_key(channel):
+    """
+    The redis stream that messages on a channel are added to, if it uses the stream transport.
+    """
+    return "sic:stream:{}".format(channel)
+
+
 class SICRedis:
     """
     A custom version of redis, that more transparently handles the type of communication necessary for SIC. The aim
@@ -83,8 +557,35 @@ class SICRedis:
 
     Redis pubsub API can also be quite fickle due to not-so-useful subscriber messages and blocking behaviour, and
     this is ignored by this extension. Using any other redis functions 'as is' is discouraged.
+
+    All callbacks registered on a SICRedis share a single pubsub connection and a single reader thread, which
+    dispatches incoming messages to the callbacks registered on that channel. Channels that use the stream transport
+    (see set_channel_transport) are read by a second reader thread.
     """
 
+    # How long the number of redis subscribers of a channel is cached for in-process delivery, in seconds
+    SUBSCRIBER_COUNT_TTL = 0.5
+
+    # The default number of messages kept in the stream of a channel that uses the stream transport
+    STREAM_MAXLEN = 1000
+
+    # How long the transport of a channel is cached for by senders, in seconds
+    STREAM_CHANNELS_TTL = 1
+
+    # How long the array codecs the subscribers of a channel support are cached for by senders, in seconds
+    CHANNEL_CODECS_TTL = 1
+
+    # How long the registered hosts and codecs of the subscribers of a channel are cached for by senders, in seconds
+    SUBSCRIBERS_TTL = 1
+
+    # How long to wait for redis to confirm the subscription to the reply inbox, in seconds
+    SUBSCRIBE_TIMEOUT = 5
+
+    # The default maximum time a message on a batched channel waits to be published, in seconds, and the number of
+    # queued messages that are published right away. See set_channel_batching.
+    BATCH_MAX_DELAY = 0.01
+    BATCH_MAX_MESSAGES = 64
+
     def __init__(self, parent_name=None):
         """
         :param parent_name: The name of the module that uses this redis connection, for easier debugging
@@ -92,56 +593,738 @@ class SICRedis:
 
         self.stopping = False
         self._running_callbacks = []
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+        # All SICRedis instances in this process share the connections to redis, which are set up (and the password
+        # and TLS requirements tried) when the first instance is created. Closing an instance keeps the pool open.
+        self._redis = redis.Redis(connection_pool=get_connection_pool())
+
+        # To be set by any component that requires exceptions in the callback threads to be logged to somewhere
+        self.parent_logger = None
+
+        # service name (assigned to thread to help debugging)
+        self.service_name = parent_name
 
-        # we assume that a password is required
-        host, password = get_redis_db_ip_password()
+        # The shared pubsub connection, the thread reading from it (started on the first subscription) and the
+        # callbacks registered per channel. Subscribing and unsubscribing is done on the live connection.
+        # subscribe messages are not passed to the callbacks, but confirm subscriptions, see _await_subscription
+        self._pubsub = self._redis.pubsub()
+        self._subscription_events = dict()
+        self._pubsub_thread = None
+        self._channel_callbacks = collections.defaultdict(list)
+        self._callbacks_lock = threading.Lock()
+
+        # The number of redis subscribers per channel, with the time it was retrieved, to know whether a channel only
+        # has subscribers in this process without asking redis for every message. See _has_remote_subscribers.
+        self._n_subscribers_cache = dict()
+
+        # Identifies this client and its host to senders, which use shared memory for large arrays when all
+        # subscribers of a channel are on their host. The ring buffer is created on the first such message.
+        self._client_id = utils.str_if_bytes(utils.random_hex())
+        self._host = "{}/{}".format(utils.get_ip_adress(), socket.gethostname())
+        self._shared_memory = None
+
+        # A long-lived channel this client receives all replies to its requests on, and the requests that are still
+        # awaiting a reply, by request id. The inbox is subscribed to on the first request.
+        self._reply_inbox = "sic:reply:{}".format(self._client_id)
+
+        # A channel without callbacks, to wake up the reader thread when closing and to signal this client is alive
+        self._control_channel = "sic:control:{}".format(self._client_id)
+        self._reply_inbox_callback = None
+        self._reply_inbox_subscribed = None
+        self._pending_requests = dict()
+        self._pending_requests_lock = threading.Lock()
+
+        # The channels read from a redis stream, see set_channel_transport, and those of which the messages that were
+        # read but not acknowledged must be read again. The streams are read with a consumer group of this instance,
+        # named <name>:<client id>, which starts at the messages added after subscribing and is removed when closing.
+        # A shared group would divide the messages among instances with the same name, and replay old messages after
+        # a restart. The reader thread is woken up through a stream of its own.
+        self._stream_thread = None
+        self._stream_channels = set()
+        self._stream_recover = set()
+        self._stream_group_keys = set()
+        self._stream_group = get_stream_group(parent_name, self._client_id)
+        self._stream_wake_key = "sic:wake:{}".format(self._client_id)
+
+        # The maximum stream length of each channel (None for pubsub channels), with the time it was retrieved
+        self._stream_maxlen_cache = dict()
+
+        # The array codecs all subscribers of a channel support, and the subscribers of a channel (see
+        # _get_subscribers), with the time they were retrieved
+        self._channel_codecs_cache = dict()
+        self._subscribers_cache = dict()
+
+        # The (max_delay, max_messages) of the channels of which the messages are published in batches, and the
+        # thread publishing them (started when the first channel is batched), see set_channel_batching.
+        self._batched_channels = dict()
+        self._batcher = None
 
-        # Let's try to connect first without TLS / working without TLS facilitates simple use of redis-cli
+        _sic_redis_instances.append(self)
+
+    def _get_thread_name(self, postfix):
+        if self.service_name:
+            return "{}_{}".format(self.service_name, postfix)
+        return "SICRedis_{}".format(postfix)
+
+    def _log_callback_exception(self, e):
+        """
+        Errors in a remote thread fail silently, so explicitly log anything to the user.
+        """
+        if self.parent_logger:
+            self.parent_logger.exception(e)
+        else:
+            traceback.print_exc()
+
+    def _read_pubsub(self):
+        """
+        The reader thread of the shared pubsub connection. Reads messages from all subscribed channels and dispatches
+        them to the callbacks registered on that channel.
+        """
+        while not self.stopping:
+            try:
+                # block until a message arrives. close() wakes the thread up with a message on the control channel.
+                pubsub_msg = self._pubsub.get_message(timeout=_PUBSUB_READ_TIMEOUT)
+            except Exception as e:
+                # Ignore the exception if the main program is already stopping (which trigger ValueErrors)
+                if self.stopping:
+                    break
+                raise e
+
+            if pubsub_msg is None or self.stopping:
+                continue
+
+            if pubsub_msg["type"] == "subscribe":
+                channel = utils.str_if_bytes(pubsub_msg["channel"])
+                with self._callbacks_lock:
+                    event = self._subscription_events.pop(channel, None)
+                if event is not None:
+                    event.set()
+            elif pubsub_msg["type"] == "message":
+                self._dispatch(pubsub_msg)
+
+    def _read_streams(self):
+        """
+        The reader thread of the stream channels. Reads messages from the streams of all stream channels with the
+        consumer group of this client, and dispatches them to the callbacks registered on that channel. A message is
+        acknowledged once it is handled, see _StreamDelivery, so it is read again if this client reconnects before.
+        """
+        while not self.stopping:
+            with self._callbacks_lock:
+                channels = {get_stream_key(c): c for c in self._stream_channels}
+                recover = {get_stream_key(c): "0" for c in self._stream_recover}
+                self._stream_recover.clear()
+
+            streams = {k: ">" for k in channels}
+            streams[self._stream_wake_key] = ">"
+
+            try:
+                # first the messages of this group that were read before, but not acknowledged, then block until new
+                # messages arrive. Subscribing and close() wake the thread up with a message on the wake stream.
+                entries = []
+                if recover:
+                    entries += (
+                        self._redis.xreadgroup(
+                            self._stream_group, self._stream_group, recover
+                        )
+                        or []
+                    )
+                entries += (
+                    self._redis.xreadgroup(
+                        self._stream_group,
+                        self._stream_group,
+                        streams,
+                        block=_STREAM_READ_BLOCK_MS,
+                    )
+                    or []
+                )
+            except redis.exceptions.ConnectionError as e:
+                if self.stopping:
+                    break
+                self._log_callback_exception(e)
+                # read the messages that were in flight again once redis is back
+                time.sleep(1)
+                with self._callbacks_lock:
+                    self._stream_recover.update(self._stream_channels)
+                continue
+            except redis.exceptions.ResponseError as e:
+                if self.stopping:
+                    break
+                if "NOGROUP" not in str(e) and "UNBLOCKED" not in str(e):
+                    raise e
+                # a stream was removed, e.g. redis restarted without persistence, start over with new streams
+                with self._callbacks_lock:
+                    for key in self._stream_group_keys:
+                        self._create_stream_group(key)
+                continue
+            except Exception as e:
+                # Ignore the exception if the main program is already stopping (which trigger ValueErrors)
+                if self.stopping:
+                    break
+                raise e
+
+            for key, messages in entries:
+                key = utils.str_if_bytes(key)
+
+                if key == self._stream_wake_key:
+                    self._redis.xack(key, self._stream_group, *[i for i, _ in messages])
+                    continue
+
+                for entry_id, fields in messages:
+                    if self.stopping:
+                        break
+                    self._dispatch_stream(channels[key], key, entry_id, fields)
+
+    def _dispatch_stream(self, channel, key, entry_id, fields):
+        """
+        Deliver a message read from the stream of a channel to all callbacks registered on the channel.
+        :param fields: the fields of the stream entry, None if it was removed from the stream before it was read again
+        """
+        with self._callbacks_lock:
+            callbacks = list(self._channel_callbacks.get(channel, []))
+
+        if not callbacks:
+            # the channel was unsubscribed from, leave the message to be read again when subscribing again
+            return
+
+        ack = functools.partial(self._ack_stream, key, entry_id)
+
+        data = fields.get(b"data", None) if fields else None
+        if data is None:
+            ack()
+            return
+
+        try:
+            sic_message = SICMessage.deserialize(data)
+        except Exception as e:
+            self._log_callback_exception(e)
+            ack()
+            return
+
+        self._deliver(channel, callbacks, sic_message, ack=ack)
+
+    def _ack_stream(self, key, entry_id):
         try:
-            self._redis = redis.Redis(host=host, ssl=False, password=password)
-        except redis.exceptions.AuthenticationError:
-            # redis is running without a password, do not supply it.
-            self._redis = redis.Redis(host=host, ssl=False)
-        except redis.exceptions.ConnectionError as e:
-            # Must be a connection error; so now let's try to connect with TLS
-            ssl_ca_certs = os.path.join(os.path.dirname(__file__), "cert.pem")
-            print(
-                "TLS required. Looking for certificate here:",
-                ssl_ca_certs,
-                "(Source error {})".format(e),
+            self._redis.xack(key, self._stream_group, entry_id)
+        except redis.exceptions.ConnectionError:
+            # the message is read again after reconnecting
+            pass
+
+    def _dispatch(self, pubsub_msg):
+        """
+        Deliver a pubsub message to all callbacks registered on its channel. The message is deserialized only once.
+        :param pubsub_msg: the raw redis pubsub message
+        """
+        channel = utils.str_if_bytes(pubsub_msg["channel"])
+
+        with self._callbacks_lock:
+            callbacks = list(self._channel_callbacks.get(channel, []))
+
+        if not callbacks:
+            return
+
+        try:
+            sic_message = self.parse_pubsub_message(pubsub_msg)
+        except Exception as e:
+            self._log_callback_exception(e)
+            return
+
+        if sic_message is None:
+            return
+
+        self._deliver(channel, callbacks, sic_message)
+
+    def _dispatch_in_process(self, channel, message):
+        """
+        Deliver a message sent by a SICRedis in this process to all callbacks registered on the channel, as a
+        copy-on-write copy instead of serializing it.
+        :param message: the SICMessage as it was sent
+        """
+        with self._callbacks_lock:
+            callbacks = list(self._channel_callbacks.get(channel, []))
+
+        if not callbacks or self.stopping:
+            return
+
+        self._deliver(channel, callbacks, message._copy_on_write())
+
+    def _deliver(self, channel, callbacks, sic_message, ack=None):
+        """
+        Execute the inline callbacks and queue the message for the others.
+        :param ack: For messages read from a stream, the function to acknowledge the message with once all callbacks
+                    handled it.
+        """
+        queued = sic_message
+        n_queued = len([c for c in callbacks if c.thread is not None])
+        if ack is not None and n_queued:
+            queued = _StreamDelivery(sic_message, n_queued, ack)
+
+        for c in callbacks:
+            if c.thread is None:
+                self._execute_callback(c, sic_message)
+            elif c.priority is not None and c.priority(sic_message):
+                c.priority_queue.put(channel, queued)
+            elif not c.queue.put(channel, queued) and c.on_drop is not None:
+                c.on_drop(sic_message)
+
+        if ack is not None and not n_queued:
+            ack()
+
+    def _execute_callback(self, callback_thread, sic_message):
+        if callback_thread.ignore_requests and is_sic_instance(sic_message, SICRequest):
+            return
+
+        try:
+            callback_thread.function(sic_message)
+        except Exception as e:
+            self._log_callback_exception(e)
+
+    def _run_callback_worker(self, callback_thread, queue):
+        """
+        Execute the callback for every message handed over by the reader thread, until the callback is unregistered.
+        :param queue: the queue of the callback to take messages from
+        """
+        while True:
+            sic_message = queue.get()
+
+            if sic_message is _STOP_CALLBACK:
+                break
+
+            if isinstance(sic_message, _StreamDelivery):
+                self._execute_callback(callback_thread, sic_message.message)
+                sic_message.done()
+            else:
+                self._execute_callback(callback_thread, sic_message)
+
+    def _subscribe(self, callback_thread):
+        """
+        Add the callback to the channel callback lists and subscribe to any channel that is not yet subscribed to on
+        the shared pubsub connection, or its stream. Starts the reader thread on the first subscription.
+        """
+        with self._callbacks_lock:
+            new_channels = [
+                c for c in callback_thread.channels if not self._channel_callbacks[c]
+            ]
+            new_stream_channels = [
+                c for c in new_channels if c in callback_thread.stream_channels
+            ]
+            new_channels = [
+                c for c in new_channels if c not in callback_thread.stream_channels
+            ]
+
+            for c in callback_thread.channels:
+                self._channel_callbacks[c].append(callback_thread)
+
+            self._running_callbacks.append(callback_thread)
+
+            if self._pubsub_thread is None:
+                # stay subscribed to the control channel, so the reader always has a channel to block on. This also
+                # tells other clients this client is alive, see _subscribers_on_same_host.
+                self._pubsub.subscribe(self._control_channel)
+
+            if new_channels:
+                # register our host before subscribing, so a sender never counts more subscribers than hosts
+                self._register_host(new_channels)
+                self._pubsub.subscribe(*new_channels)
+                _in_process_bus.subscribe(new_channels, self)
+
+            if new_stream_channels:
+                self._subscribe_streams(new_stream_channels)
+
+            if self._pubsub_thread is None:
+                self._pubsub_thread = threading.Thread(
+                    target=self._read_pubsub,
+                    name=self._get_thread_name("pubsub_reader"),
+                )
+                self._pubsub_thread.start()
+
+    def _unsubscribe(self, callback_thread):
+        """
+        Remove the callback from the channel callback lists, and unsubscribe from channels no callback listens to
+        anymore.
+        """
+        with self._callbacks_lock:
+            if callback_thread not in self._running_callbacks:
+                return
+
+            self._running_callbacks.remove(callback_thread)
+
+            unused_channels = []
+            for c in callback_thread.channels:
+                self._channel_callbacks[c].remove(callback_thread)
+                if not self._channel_callbacks[c]:
+                    del self._channel_callbacks[c]
+                    unused_channels.append(c)
+
+            unused_stream_channels = [
+                c for c in unused_channels if c in callback_thread.stream_channels
+            ]
+            unused_channels = [
+                c for c in unused_channels if c not in callback_thread.stream_channels
+            ]
+
+            if unused_channels and not self.stopping:
+                self._pubsub.unsubscribe(*unused_channels)
+
+            if unused_channels:
+                _in_process_bus.unsubscribe(unused_channels, self)
+                self._unregister_host(unused_channels)
+
+            if unused_stream_channels:
+                self._stream_channels.difference_update(unused_stream_channels)
+                self._stream_recover.difference_update(unused_stream_channels)
+                if not self.stopping:
+                    self._wake_stream_reader()
+
+        if callback_thread.thread is not None:
+            callback_thread.queue.close()
+        if callback_thread.priority_queue is not None:
+            callback_thread.priority_queue.close()
+
+    def _subscribe_streams(self, channels):
+        """
+        Join the streams of the channels with the consumer group of this client, and have the stream reader thread
+        read them, starting with the messages the group read before but did not acknowledge. Must be called with the
+        callbacks lock held.
+        """
+        codecs = ",".join(array_codecs.get_available_codecs())
+        for c in channels:
+            self._create_stream_group(get_stream_key(c))
+            self._redis.hset(
+                get_codecs_key(get_stream_key(c)), self._stream_group, codecs
             )
-            self._redis = redis.Redis(
-                host=host, ssl=True, ssl_ca_certs=ssl_ca_certs, password=password
+
+        self._stream_channels.update(channels)
+        self._stream_recover.update(channels)
+
+        if self._stream_thread is None:
+            self._create_stream_group(self._stream_wake_key)
+            self._stream_thread = threading.Thread(
+                target=self._read_streams,
+                name=self._get_thread_name("stream_reader"),
             )
+            self._stream_thread.start()
+        else:
+            self._wake_stream_reader()
+
+    def _create_stream_group(self, key):
+        try:
+            # a new group only reads the messages added from now on, an existing group continues where it was
+            self._redis.xgroup_create(key, self._stream_group, id="$", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise e
+
+        self._stream_group_keys.add(key)
+
+    def _wake_stream_reader(self):
+        self._redis.xadd(self._stream_wake_key, {"wake": b""}, maxlen=1)
 
+    def _remove_stream_groups(self):
+        """
+        Remove the wake stream, and the consumer groups of this client.
+        """
         try:
-            self._redis.ping()
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.delete(self._stream_wake_key)
+            for key in self._stream_group_keys:
+                if key != self._stream_wake_key:
+                    pipe.xgroup_destroy(key, self._stream_group)
+                    pipe.hdel(get_codecs_key(key), self._stream_group)
+            pipe.execute(raise_on_error=False)
         except redis.exceptions.ConnectionError:
-            e = Exception(
-                "Could not connect to redis at {} \n\n Have you started redis? Use: `redis-server conf/redis/redis.conf`".format(
-                    host
-                )
+            pass
+
+    def _register_host(self, channels):
+        """
+        Register the host of this client as a subscriber of the channels, see _subscribers_on_same_host, and the array
+        codecs it supports, see _get_channel_codecs.
+        """
+        codecs = ",".join(array_codecs.get_available_codecs())
+        pipe = self._redis.pipeline(transaction=False)
+        for c in channels:
+            pipe.hset(get_hosts_key(c), self._client_id, self._host)
+            pipe.hset(get_codecs_key(c), self._client_id, codecs)
+        pipe.execute()
+
+    def _unregister_host(self, channels):
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for c in channels:
+                pipe.hdel(get_hosts_key(c), self._client_id)
+                pipe.hdel(get_codecs_key(c), self._client_id)
+            pipe.execute()
+        except redis.exceptions.ConnectionError:
+            # clients that stay registered after disconnecting only cause messages to be sent through redis
+            pass
+
+    def _get_subscribers(self, channel):
+        """
+        The number of redis subscribers of a pubsub channel, and the host and array codecs of the subscribers that
+        registered them (see _register_host), by client id. Registrations of clients that are no longer connected,
+        such as clients that crashed, are removed: a client is connected as long as its pubsub connection is subscribed
+        to its control channel, on which it subscribes to all channels. Every registration that is left is therefore
+        one of the subscribers, and if there are fewer registrations than subscribers, some subscribers did not
+        register, such as older versions of the framework. Cached for SUBSCRIBERS_TTL seconds.
+        :return: (number of subscribers, {client id: (host, comma separated codecs)})
+        """
+        now = time.time()
+        cached = self._subscribers_cache.get(channel, None)
+        if cached is not None and now - cached[0] <= self.SUBSCRIBERS_TTL:
+            return cached[1]
+
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.pubsub_numsub(channel)
+        pipe.hgetall(get_hosts_key(channel))
+        pipe.hgetall(get_codecs_key(channel))
+        ((_, n_subscribers),), hosts, codecs = pipe.execute()
+
+        registered = dict()
+        client_ids = list(set(hosts) | set(codecs))
+        if client_ids:
+            alive = self._redis.pubsub_numsub(
+                *["sic:control:{}".format(utils.str_if_bytes(c)) for c in client_ids]
             )
-            # six.raise_from(e, None) # unsupported on some peppers
-            six.reraise(Exception, e, None)
 
-        # To be set by any component that requires exceptions in the callback threads to be logged to somewhere
-        self.parent_logger = None
+            pipe = self._redis.pipeline(transaction=False)
+            for client_id, (_, n_connections) in zip(client_ids, alive):
+                if n_connections:
+                    registered[utils.str_if_bytes(client_id)] = (
+                        utils.str_if_bytes(hosts.get(client_id, b"")),
+                        utils.str_if_bytes(codecs.get(client_id, b"")),
+                    )
+                else:
+                    pipe.hdel(get_hosts_key(channel), client_id)
+                    pipe.hdel(get_codecs_key(channel), client_id)
+            pipe.execute()
 
-        # service name (assigned to thread to help debugging)
-        self.service_name = parent_name
+        subscribers = (n_subscribers, registered)
+        self._subscribers_cache[channel] = (now, subscribers)
+        return subscribers
 
-        _sic_redis_instances.append(self)
+    def _subscribers_on_same_host(self, channel):
+        """
+        Check if all subscribers of the channel run on the same host as this client. Subscribers that did not register
+        their host, such as older versions of the framework, are counted as remote. See _get_subscribers.
+        """
+        n_subscribers, registered = self._get_subscribers(channel)
+
+        return (
+            n_subscribers > 0
+            and n_subscribers == len(registered)
+            and all(host == self._host for host, _ in registered.values())
+        )
+
+    def _has_remote_subscribers(self, channel, n_local_subscribers):
+        """
+        Check if the channel has subscribers outside of this process, by comparing the number of redis subscribers to
+        the number of subscribed SICRedis instances in this process. The redis count is refreshed at most every
+        SUBSCRIBER_COUNT_TTL seconds, so a remote subscriber that just subscribed might miss messages for that long.
+        """
+        now = time.time()
+        cached = self._n_subscribers_cache.get(channel, None)
+
+        if cached is None or now - cached[0] > self.SUBSCRIBER_COUNT_TTL:
+            ((_, n_subscribers),) = self._redis.pubsub_numsub(channel)
+            cached = (now, n_subscribers)
+            self._n_subscribers_cache[channel] = cached
+
+        return cached[1] > n_local_subscribers
+
+    def _get_channel_codecs(self, channel, stream=False):
+        """
+        The names of the array codecs that this client and all subscribers of the channel support, see array_codecs.
+        Empty if a subscriber did not register its codecs, such as older versions of the framework, so they always
+        receive uncompressed arrays. Cached for CHANNEL_CODECS_TTL seconds.
+        :param stream: whether the channel uses the stream transport, of which the subscribers are consumer groups
+        :rtype: frozenset[str]
+        """
+        now = time.time()
+        cached = self._channel_codecs_cache.get((channel, stream), None)
+        if cached is not None and now - cached[0] <= self.CHANNEL_CODECS_TTL:
+            return cached[1]
+
+        if stream:
+            key = get_stream_key(channel)
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.xinfo_groups(key)
+            pipe.hgetall(get_codecs_key(key))
+            groups, registered = pipe.execute(raise_on_error=False)
+            if isinstance(groups, Exception):
+                # the stream does not exist yet
+                groups = []
+            group_names = self._remove_dead_stream_groups(
+                key, [g["name"] for g in groups]
+            )
+            all_registered = bool(group_names) and all(
+                name in registered for name in group_names
+            )
+            registered = [registered.get(name) for name in group_names]
+        else:
+            n_subscribers, subscribers = self._get_subscribers(channel)
+            all_registered = n_subscribers > 0 and n_subscribers == len(subscribers)
+            registered = [names for _, names in subscribers.values()]
+
+        codecs = frozenset()
+        if all_registered:
+            codecs = frozenset(array_codecs.get_available_codecs())
+            for names in registered:
+                codecs &= frozenset(utils.str_if_bytes(names).split(","))
+
+        self._channel_codecs_cache[(channel, stream)] = (now, codecs)
+        return codecs
+
+    def _remove_dead_stream_groups(self, key, group_names):
+        """
+        Remove the consumer groups of clients that are no longer connected (see _get_subscribers), such as clients
+        that crashed, from a stream.
+        :return: the names of the groups of connected clients
+        """
+        if not group_names:
+            return group_names
+
+        alive = self._redis.pubsub_numsub(
+            *[
+                "sic:control:{}".format(utils.str_if_bytes(name).rsplit(":", 1)[-1])
+                for name in group_names
+            ]
+        )
+
+        live_names = []
+        pipe = self._redis.pipeline(transaction=False)
+        for name, (_, n_connections) in zip(group_names, alive):
+            if n_connections:
+                live_names.append(name)
+            else:
+                pipe.xgroup_destroy(key, name)
+                pipe.hdel(get_codecs_key(key), name)
+        pipe.execute(raise_on_error=False)
+
+        return live_names
+
+    def set_channel_transport(self, channel, transport, maxlen=None):
+        """
+        Select the transport of a channel, for all its senders and subscribers. Pubsub is the default. With the stream
+        transport, messages are added to a capped redis stream, from which every subscribing SICRedis reads with a
+        consumer group of its own, starting at the messages added after it subscribed. A message is acknowledged once
+        its callbacks handled it, so messages are not lost when a subscriber is slow, and messages that were read but
+        not handled are read again when the connection to redis is restored. Requests on a stream channel are
+        acknowledged once they are replied to.
+
+        Subscribers select the transport when registering a message handler, so it should be set before that, e.g. by
+        the component sending on the channel (see SICComponent.OUTPUT_TRANSPORT). Senders use the new transport within
+        STREAM_CHANNELS_TTL seconds.
+
+        Example:
+            r.set_channel_transport("microphone", TRANSPORT_STREAM)
+            r.send_message("microphone", AudioMessage(waveform, sample_rate))
+
+        :param channel: the channel
+        :param transport: TRANSPORT_PUBSUB or TRANSPORT_STREAM
+        :param maxlen: The approximate number of messages kept in the stream, by default STREAM_MAXLEN. Only for the
+                       stream transport.
+        """
+        channel = utils.str_if_bytes(channel)
+
+        if transport == TRANSPORT_STREAM:
+            self._redis.hset(
+                STREAM_CHANNELS_KEY, channel, maxlen if maxlen else self.STREAM_MAXLEN
+            )
+        elif transport == TRANSPORT_PUBSUB:
+            self._redis.hdel(STREAM_CHANNELS_KEY, channel)
+        else:
+            raise ValueError("Unknown transport {}".format(transport))
+
+        self._stream_maxlen_cache.pop(channel, None)
 
-    def register_message_handler(self, channels, callback, ignore_requests=True):
+    def _get_stream_maxlen(self, channel):
         """
-        Subscribe a callback function to one or more channels, and also start a thread to monitor for new messages.
+        The maximum length of the stream of a channel, or None if the channel uses pubsub. Refreshed at most every
+        STREAM_CHANNELS_TTL seconds.
+        """
+        now = time.time()
+        cached = self._stream_maxlen_cache.get(channel, None)
+
+        if cached is None or now - cached[0] > self.STREAM_CHANNELS_TTL:
+            maxlen = self._redis.hget(STREAM_CHANNELS_KEY, channel)
+            cached = (now, int(maxlen) if maxlen is not None else None)
+            self._stream_maxlen_cache[channel] = cached
+
+        return cached[1]
+
+    def set_channel_batching(
+        self, channel, enabled=True, max_delay=None, max_messages=None
+    ):
+        """
+        Publish the messages this client sends on a channel in batches. send_message queues the message, and a thread
+        of this client publishes it together with all other messages queued in the meantime in a single redis
+        pipeline: one round trip per batch instead of per message. For small messages sent at a high rate, such as
+        joint angles and log lines. Receivers are not affected, as each message is still published on its own.
+
+        A message is published at most max_delay seconds after it was sent, or right away when max_messages are
+        queued. Messages for subscribers in this process, large arrays sent through shared memory and messages on
+        stream channels are sent right away, after the queued messages.
+        :param channel: The channel to batch the messages of.
+        :param enabled: False to publish every message right away again (the default for all channels).
+        :param max_delay: in seconds, SICRedis.BATCH_MAX_DELAY by default.
+        :param max_messages: SICRedis.BATCH_MAX_MESSAGES by default.
+        """
+        if not enabled:
+            if self._batched_channels.pop(channel, None) is not None:
+                self._batcher.flush()
+            return
+
+        if self._batcher is None:
+            self._batcher = _PublishBatcher(
+                self._redis, self._get_thread_name("batch_publisher")
+            )
+
+        self._batched_channels[channel] = (
+            max_delay if max_delay is not None else self.BATCH_MAX_DELAY,
+            max_messages if max_messages is not None else self.BATCH_MAX_MESSAGES,
+        )
+
+    def register_message_handler(
+        self, channels, callback, ignore_requests=True, qos=None, transport=None
+    ):
+        """
+        Subscribe a callback function to one or more channels. Messages are read by the shared reader thread of
+        this SICRedis, and the callback is executed in its own thread.
         By default, ignores SICRequests.
         :param callback: a function expecting a SICMessage and a channel argument to process the messages received on `channel`
         :param channels: channel or channels to listen to
         :param ignore_requests: Flag to control whether the message handler should also trigger the callback if the
                                 message is a SICRequest
-        :return: The CallbackThread object containing the the thread that is listening to the channel.
+        :param qos: The QoS of the handler, how messages are queued while the callback is busy. By default, all
+                    messages are queued.
+        :param transport: TRANSPORT_PUBSUB or TRANSPORT_STREAM, which must match the transport the channels are
+                          sent over. By default, the transport set for each channel, see set_channel_transport.
+        :return: The CallbackThread object containing the the thread that is executing the callback.
+        """
+        return self._register_callback(
+            channels, callback, ignore_requests, qos=qos, transport=transport
+        )
+
+    def _register_callback(
+        self,
+        channels,
+        callback,
+        ignore_requests=True,
+        inline=False,
+        qos=None,
+        transport=None,
+        n_workers=1,
+        priority=None,
+        on_drop=None,
+    ):
+        """
+        See register_message_handler.
+        :param inline: If true, execute the callback on the reader thread instead of in its own thread. Only for
+                       callbacks that return immediately.
+        :param n_workers: The number of worker threads executing the callback.
+        :param priority: A function returning whether a message should skip the queue, see CallbackThread.
+        :param on_drop: A function called with the messages dropped because the queue is full, see QOS_DROP_NEWEST.
         """
 
         # convert single channel case to list of channels case
@@ -151,79 +1334,174 @@ class SICRedis:
 
         assert len(channels), "Must provide at least one channel"
 
-        # ignore subscribers messages as to not trigger the callback with useless information
-        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
-
-        # unpack pubsub message to SICMessage
-        def wrapped_callback(pubsub_msg):
-            try:
-                sic_message = self.parse_pubsub_message(pubsub_msg)
+        channels = [utils.str_if_bytes(c) for c in channels]
 
-                if ignore_requests and is_sic_instance(sic_message, SICRequest):
-                    return
+        c = CallbackThread(
+            callback,
+            pubsub=self._pubsub,
+            thread=None,
+            channels=channels,
+            ignore_requests=ignore_requests,
+            qos=qos,
+            priority=priority,
+        )
+        c.on_drop = on_drop
+
+        if transport == TRANSPORT_STREAM:
+            c.stream_channels = list(channels)
+        elif transport is None:
+            maxlens = self._redis.hmget(STREAM_CHANNELS_KEY, channels)
+            c.stream_channels = [
+                channel for channel, m in zip(channels, maxlens) if m is not None
+            ]
+
+        if not inline:
+            queues = [c.queue] * n_workers
+            if c.priority_queue is not None:
+                queues.append(c.priority_queue)
+
+            for queue in queues:
+                thread = threading.Thread(
+                    target=self._run_callback_worker,
+                    args=(c, queue),
+                    name=self._get_thread_name("callback_thread"),
+                )
+                thread.start()
+                c.threads.append(thread)
 
-                return callback(sic_message)
-            except Exception as e:
-                # Errors in a remote thread fail silently, so explicitly catch anything and log to the user.
-                if self.parent_logger:
-                    self.parent_logger.exception(e)
-                raise e
+            c.thread = c.threads[0]
 
-        channels = [utils.str_if_bytes(c) for c in channels]
+        self._subscribe(c)
 
-        pubsub.subscribe(**{c: wrapped_callback for c in channels})
+        return c
 
-        def exception_handler(e, pubsub, thread):
-            # Ignore the exception if the main program is already stopping (which trigger ValueErrors)
-            if not self.stopping:
-                raise e
+    def get_channel_stats(self):
+        """
+        The number of messages received and dropped per channel, and the current and maximum number of messages
+        waiting, summed over the message handlers on each channel.
+        :return: dict of channel to a dict with 'received', 'dropped', 'queue_depth' and 'max_queue_depth'
+        """
+        stats = dict()
 
-        # sleep_time is how often the thread checks if the connection is still alive (and checks the stop condition),
-        # if it is 0.0 it can never time out. It can receive messages much faster, so lets be nice to the CPU with 0.1.
-        if six.PY3:
-            thread = pubsub.run_in_thread(
-                sleep_time=0.1, daemon=False, exception_handler=exception_handler
-            )
-        else:
-            # python2 does not support exception handler, but it's not as important to provide a clean exit on the robots
-            thread = pubsub.run_in_thread(sleep_time=0.1, daemon=False)
+        with self._callbacks_lock:
+            callbacks = list(self._running_callbacks)
 
-        if self.service_name:
-            thread.name = "{}_callback_thread".format(self.service_name)
+        for c in callbacks:
+            if c.thread is None:
+                continue
 
-        c = CallbackThread(callback, pubsub=pubsub, thread=thread)
-        self._running_callbacks.append(c)
+            for channel in c.channels:
+                channel_stats = stats.setdefault(
+                    channel,
+                    dict(received=0, dropped=0, queue_depth=0, max_queue_depth=0),
+                )
+                counters = c.queue.channel_stats.get(channel, ChannelStats())
+                channel_stats["received"] += counters.received
+                channel_stats["dropped"] += counters.dropped
+                channel_stats["queue_depth"] += len(c.queue)
+                channel_stats["max_queue_depth"] += c.queue.max_depth
 
-        return c
+        return stats
 
     def unregister_callback(self, callback_thread):
         """
-        Unhook a callback by unsubscribing from redis and stopping the thread. Will unregister all hooks if
-        multiple hooks are created.
+        Unhook a callback by unsubscribing it from its channels and stopping its thread. The channels are
+        unsubscribed from redis once no other callback listens to them.
         :param callback_thread: The CallbackThread to unregister
         """
-
-        callback_thread.pubsub.unsubscribe()
-        callback_thread.thread.stop()
-        self._running_callbacks.remove(callback_thread)
+        self._unsubscribe(callback_thread)
 
     def send_message(self, channel, message):
         """
         Send a SICMessage to a service/device listening on the channel.
+
+        If all subscribers of the channel are SICRedis instances in this process, such as components started by a
+        Desktop in the process of the application, the message is handed to them directly without serializing it.
+        Each receiver gets a copy-on-write copy, see SICMessage._copy_on_write. Arrays must therefore not be modified
+        in place after sending them.
+
+        Otherwise, large numpy arrays, such as camera images, are written to shared memory instead of being sent
+        through redis if all subscribers of the channel run on this host (and python 3.8+). Only a descriptor of the
+        array is sent, and the receivers copy the array out of shared memory on receipt. Other messages are sent
+        through redis, with the fields listed in SICMessage._field_codecs compressed with a codec all subscribers
+        support.
+
+        Messages on channels that use the stream transport are always added to the stream of the channel, see
+        set_channel_transport. Messages on batched channels are published by another thread, see
+        set_channel_batching.
         :param channel: The redis pubsub channel to communicate on.
         :param message: The message
-        :return: The number of subscribers that received the message.
+        :return: The number of subscribers that received the message, the id of the stream entry for stream
+                 channels, or None for messages that are published in a batch.
         """
         assert isinstance(
             message, SICMessage
         ), "Message must inherit from SICMessage (got {})".format(type(message))
 
-        return self._redis.publish(channel, message.serialize())
+        batching = self._batched_channels.get(channel)
+
+        maxlen = self._get_stream_maxlen(channel)
+        if maxlen is not None:
+            if batching is not None:
+                self._batcher.flush()
+            codecs = None
+            if message._field_codecs:
+                codecs = self._get_channel_codecs(channel, stream=True)
+            return self._redis.xadd(
+                get_stream_key(channel),
+                {"data": message.serialize(codecs=codecs)},
+                maxlen=maxlen,
+                approximate=True,
+            )
+
+        local_subscribers = (
+            _in_process_bus.get_subscribers(channel) if IN_PROCESS_DELIVERY else []
+        )
+        if local_subscribers and not self._has_remote_subscribers(
+            channel, len(local_subscribers)
+        ):
+            if batching is not None:
+                self._batcher.flush()
+            for sic_redis in local_subscribers:
+                sic_redis._dispatch_in_process(channel, message)
+            return len(local_subscribers)
+
+        shared_memory = None
+        if SHARED_MEMORY and any(
+            isinstance(v, np.ndarray) for _, v in message._get_fields()
+        ):
+            # imported here, as only processes sending arrays need it
+            from sic_framework.core import shared_memory_transport
+
+            if any(
+                shared_memory_transport.SharedMemoryRing.accepts(v)
+                for _, v in message._get_fields()
+            ) and self._subscribers_on_same_host(channel):
+                if self._shared_memory is None:
+                    self._shared_memory = shared_memory_transport.SharedMemoryRing()
+                shared_memory = self._shared_memory
+
+        codecs = None
+        if message._field_codecs:
+            codecs = self._get_channel_codecs(channel)
+
+        if batching is not None:
+            if shared_memory is None:
+                self._batcher.put(
+                    channel, message.serialize(codecs=codecs), *batching
+                )
+                return None
+            self._batcher.flush()
+
+        return self._redis.publish(
+            channel, message.serialize(shared_memory, codecs=codecs)
+        )
 
     def _reply(self, channel, request, reply):
         """
-        Send a reply to a specific request. This is done by sending a SICMessage to the same channel, where
-        the requesting thread/client is waiting for the reply.
+        Send a reply to a specific request. This is done by sending a SICMessage to the reply inbox of the requesting
+        client, or to the same channel if the request does not carry a reply channel (e.g. it was sent without
+        waiting for the reply, or by an older client), where the requesting thread/client is waiting for the reply.
         :param channel: The redis pubsub channel to communicate on.
         :param request: The SICRequest
         :param reply: The SICMessage reply to send back to the requesting client.
@@ -232,11 +1510,79 @@ class SICRedis:
         # does not want to reply to a request, so a reply is returned but its not a reply to the request
         if reply._request_id is None:
             reply._request_id = request._request_id
+
+        # publish the queued messages first, e.g. log messages about the request
+        if self._batcher is not None:
+            self._batcher.flush()
+
+        reply_channel = getattr(request, "_reply_channel", None)
+        if reply_channel:
+            channel = reply_channel
+
         self.send_message(channel, reply)
 
+    def _handle_reply(self, reply):
+        """
+        Hand a reply received on the reply inbox to the request awaiting it. Replies to requests that already timed
+        out, or that are not replies to our requests, are ignored.
+        :param reply: The SICMessage reply
+        """
+        with self._pending_requests_lock:
+            pending = self._pending_requests.get(reply._request_id, None)
+
+        if pending is not None and not pending.done.is_set():
+            pending.reply = reply
+            pending.done.set()
+
+    def _await_subscription(self, channel):
+        """
+        Get an event that is set when redis confirms the subscription to a channel. Must be called before subscribing.
+        """
+        with self._callbacks_lock:
+            return self._subscription_events.setdefault(channel, threading.Event())
+
+    def _subscribe_reply_inbox(self):
+        """
+        Subscribe to the reply inbox, once. Waits until the reader thread received the confirmation of the
+        subscription, so the reply to the first request can not arrive before we are listening.
+        :raises TimeoutError: if redis does not confirm the subscription in SUBSCRIBE_TIMEOUT seconds
+        """
+        with self._pending_requests_lock:
+            if self._reply_inbox_callback is None:
+                self._reply_inbox_subscribed = self._await_subscription(
+                    self._reply_inbox
+                )
+                # _handle_reply returns immediately, so it can run on the reader thread
+                self._reply_inbox_callback = self._register_callback(
+                    self._reply_inbox,
+                    self._handle_reply,
+                    inline=True,
+                    transport=TRANSPORT_PUBSUB,
+                )
+
+        if not self._reply_inbox_subscribed.wait(self.SUBSCRIBE_TIMEOUT):
+            raise TimeoutError(
+                "Redis did not confirm the subscription to reply inbox {}".format(
+                    self._reply_inbox
+                )
+            )
+
+    def _has_legacy_subscribers(self, channel):
+        """
+        Whether a subscriber of the channel runs an older version of the framework, which replies to requests on the
+        request channel instead of the reply inbox. Subscribers that did not register are assumed to, see
+        _get_subscribers. Always true when sending legacy messages, see message_python2.LEGACY_SERIALIZATION.
+        """
+        if message_python2.LEGACY_SERIALIZATION:
+            return True
+
+        n_subscribers, registered = self._get_subscribers(channel)
+        return n_subscribers > len(registered)
+
     def request(self, channel, request, timeout=5, block=True):
         """
-        Send a request, and wait for the reply on the same channel. If the reply takes longer than
+        Send a request, and wait for the reply on the reply inbox of this client (and on the request channel, if a
+        subscriber of the channel runs an older version of the framework). If the reply takes longer than
         `timeout` seconds to arrive, a TimeoutError is raised. If block is set to false, the reply is
         ignored and the function returns immediately.
         :param channel: The redis pubsub channel to communicate on.
@@ -251,53 +1597,72 @@ class SICRedis:
                 "Invalid request id for request {}".format(request.get_message_name())
             )
 
-        # Set up a callback to listen to the same channel, where we expect the reply.
-        # Once we have the reply the queue passes the data back to this thread and the
-        # event signals we have received the reply. Subscribe first, as to not miss it
-        # if the reply is faster than our subscription.
-        done = threading.Event()
-        q = queue.Queue(1)
-
-        def await_reply(reply):
-            # If not our own request but is a SICMessage with the right id, then it is the reply
-            # we are waiting for
-            if (
-                not is_sic_instance(reply, SICRequest)
-                and reply._request_id == request._request_id
-            ):
-                q.put(reply)
-                done.set()
+        if not block:
+            # nobody is waiting for the reply, so let it be sent on the request channel
+            request._reply_channel = None
+            self.send_message(channel, request)
+            return None
 
-        if block:
-            callback_thread = self.register_message_handler(channel, await_reply)
+        # All replies arrive on the long-lived reply inbox, where they are handed to the pending request with the
+        # same request id. Register as pending before sending, as to not miss the reply if it is faster than us.
+        self._subscribe_reply_inbox()
 
-        self.send_message(channel, request)
+        pending = _PendingRequest()
+        with self._pending_requests_lock:
+            self._pending_requests[request._request_id] = pending
 
-        if not block:
-            return None
+        # older versions of the framework reply on the request channel, so listen there as well
+        legacy_callback = None
+        if self._has_legacy_subscribers(channel):
 
-        else:
+            def await_legacy_reply(reply):
+                if not is_sic_instance(reply, SICRequest):
+                    self._handle_reply(reply)
 
-            done.wait(timeout)
+            legacy_callback = self._register_callback(
+                channel, await_legacy_reply, ignore_requests=False, inline=True
+            )
 
-            if not done.is_set():
-                raise TimeoutError(
-                    "Waiting for reply to {} to request timed out".format(
-                        request.get_message_name()
-                    )
+        try:
+            request._reply_channel = self._reply_inbox
+            self.send_message(channel, request)
+
+            pending.done.wait(timeout)
+        finally:
+            with self._pending_requests_lock:
+                del self._pending_requests[request._request_id]
+            if legacy_callback is not None:
+                self.unregister_callback(legacy_callback)
+
+        if not pending.done.is_set():
+            raise TimeoutError(
+                "Waiting for reply to {} to request timed out".format(
+                    request.get_message_name()
                 )
+            )
 
-            # cleanup by unsubscribing and stopping the subscriber thread
-            self.unregister_callback(callback_thread)
-
-            return q.get()
+        return pending.reply
 
-    def register_request_handler(self, channel, callback):
+    def register_request_handler(
+        self, channel, callback, max_concurrency=1, queue_depth=None, is_priority=None
+    ):
         """
         Register a function to listen to SICRequest's (and ignore SICMessages). Handler must return a SICMessage as a reply.
-        Will block receiving new messages until the callback is finished.
+
+        Requests are handled by `max_concurrency` worker threads, so the callback must be thread safe if this is more
+        than one. Other requests wait in a queue of at most `queue_depth` requests, and are replied to with a
+        SICBusyMessage when it is full. Requests for which `is_priority` returns true, such as pings, skip the queue
+        and are handled by a worker thread of their own, so they are never held up by long requests.
+
+        Example:
+            r.register_request_handler("gpt", on_request, max_concurrency=4,
+                                       is_priority=lambda r: is_sic_instance(r, SICControlRequest))
+
         :param channel: The redis pubsub channel to communicate on.
         :param callback: function to run upon receiving a SICRequest. Must return a SICMessage reply
+        :param max_concurrency: The maximum number of requests handled at the same time.
+        :param queue_depth: The maximum number of requests waiting to be handled, by default unlimited.
+        :param is_priority: A function returning whether a request should skip the queue.
         """
 
         def wrapped_callback(request):
@@ -313,8 +1678,20 @@ class SICRedis:
 
                 self._reply(channel, request, reply)
 
-        return self.register_message_handler(
-            channel, wrapped_callback, ignore_requests=False
+        def reply_busy(request):
+            if is_sic_instance(request, SICRequest):
+                self._reply(channel, request, SICBusyMessage())
+
+        qos = QoS(QOS_DROP_NEWEST, queue_depth) if queue_depth is not None else None
+
+        return self._register_callback(
+            channel,
+            wrapped_callback,
+            ignore_requests=False,
+            qos=qos,
+            n_workers=max_concurrency,
+            priority=is_priority,
+            on_drop=reply_busy,
         )
 
     def time(self):
@@ -322,19 +1699,59 @@ class SICRedis:
 
     def close(self):
         """
-        Cleanup function to stop listening to all callback channels and disconnect redis.
+        Cleanup function to stop listening to all callback channels and disconnect redis. Only the first call closes
+        the connection, as a component might be stopped by multiple threads at once.
         """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        if self._batcher is not None:
+            self._batcher.close()
+
         self.stopping = True
-        for c in self._running_callbacks:
-            c.pubsub.unsubscribe()
-            c.thread.stop()
+        for c in list(self._running_callbacks):
+            self._unsubscribe(c)
+
+        # wake up the reader thread, which is blocked reading from the pubsub connection, to notice the stop condition
+        if (
+            self._pubsub_thread is not None
+            and self._pubsub_thread is not threading.current_thread()
+        ):
+            try:
+                self._redis.publish(self._control_channel, b"")
+            except redis.exceptions.ConnectionError:
+                pass
+            self._pubsub_thread.join(timeout=1)
+
+        if self._stream_thread is not None:
+            if self._stream_thread is not threading.current_thread():
+                try:
+                    self._wake_stream_reader()
+                except redis.exceptions.ConnectionError:
+                    pass
+                self._stream_thread.join(timeout=1)
+            self._remove_stream_groups()
+
+        try:
+            self._pubsub.close()
+        except Exception:
+            pass
         self._redis.close()
 
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+
     def __del__(self):
         # we can no longer unregister_message_handler as python is shutting down, but we can still stop
         # any remaining threads
+        self.stopping = True
         for c in self._running_callbacks:
-            c.thread.stop()
+            if c.thread is not None:
+                c.queue.close()
+            if c.priority_queue is not None:
+                c.priority_queue.close()
 
     @staticmethod
     def parse_pubsub_message(pubsub_msg):
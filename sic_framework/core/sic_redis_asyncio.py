@@ -0,0 +1,662 @@
+"""
+An asyncio version of SICRedis, for applications that talk to many components at once. All subscriptions and
+requests of an AsyncSICRedis share the event loop and a single pubsub connection, instead of using a thread each. It
+speaks the same protocol as SICRedis, so it works with the thread based components on the other side of redis.
+Requires python 3.7+ and redis-py 4.2+ (redis.asyncio).
+
+    async with AsyncSICRedis() as r:
+        reply = await r.request("my_channel", NamedRequest("req_handling"), timeout=5)
+
+        replies = await asyncio.gather(
+            r.request("gpt_channel", GPTRequest("hi")),
+            r.request("tts_channel", TextToSpeechRequest("hello")),
+        )
+
+        async for message in r.subscribe("other_channel", qos=QoS(QOS_LATEST_ONLY)):
+            print(message)
+
+See also AsyncSICConnector.
+"""
+
+import asyncio
+import collections
+import socket
+import traceback
+
+import redis
+import redis.asyncio
+
+from sic_framework.core import message_python2, utils
+from sic_framework.core.message_python2 import SICMessage, SICRequest
+from sic_framework.core.sic_redis import (
+    QOS_BOUNDED_FIFO,
+    QOS_DROP_NEWEST,
+    STREAM_CHANNELS_KEY,
+    TRANSPORT_PUBSUB,
+    TRANSPORT_STREAM,
+    QoS,
+    SICRedis,
+    _StreamDelivery,
+    get_connection_kwargs,
+    get_hosts_key,
+    get_stream_group,
+    get_stream_key,
+)
+
+
+async def _close_client(client):
+    # aclose replaced close in redis-py 5
+    close = getattr(client, "aclose", None) or client.close
+    await close()
+
+
+class AsyncSubscription(object):
+    def __init__(self, sic_redis, channel, qos=None, transport=None):
+        """
+        The messages received on a channel, as an async iterator. Messages wait in a queue according to the QoS
+        until they are iterated over. The channel is subscribed to when iterating starts. See AsyncSICRedis.subscribe.
+        """
+        self.channel = channel
+        self.qos = qos if qos is not None else QoS()
+        self.transport = transport
+        self.received = 0
+        self.dropped = 0
+        self._sic_redis = sic_redis
+        self._messages = collections.deque()
+        self._condition = asyncio.Condition()
+        self._subscribed = False
+        self._closed = False
+        # the stream delivery of the message returned last, acknowledged when the next message is asked for
+        self._delivery = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self._done()
+
+        if not self._subscribed:
+            await self._sic_redis._subscribe(self)
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._messages or self._closed)
+
+            if not self._messages:
+                raise StopAsyncIteration
+
+            message, self._delivery = self._messages.popleft()
+            self._condition.notify_all()
+
+        return message
+
+    async def _put(self, message, delivery=None):
+        """
+        Queue a message according to the QoS. With QOS_BOUNDED_FIFO, waits until there is room in the queue.
+        """
+        async with self._condition:
+            if self._closed:
+                return
+
+            self.received += 1
+
+            depth = self.qos.depth
+            if depth is not None and len(self._messages) >= depth:
+                if self.qos.policy == QOS_BOUNDED_FIFO:
+                    await self._condition.wait_for(
+                        lambda: len(self._messages) < depth or self._closed
+                    )
+                    if self._closed:
+                        return
+                elif self.qos.policy == QOS_DROP_NEWEST:
+                    self.dropped += 1
+                    if delivery is not None:
+                        delivery.done()
+                    return
+                else:
+                    _, dropped = self._messages.popleft()
+                    self.dropped += 1
+                    if dropped is not None:
+                        dropped.done()
+
+            self._messages.append((message, delivery))
+            self._condition.notify_all()
+
+    def _done(self):
+        if self._delivery is not None:
+            self._delivery.done()
+            self._delivery = None
+
+    async def close(self):
+        """
+        Unsubscribe from the channel. Iterating ends after the messages that are still queued.
+        """
+        self._done()
+        await self._sic_redis._unsubscribe(self)
+
+        async with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class AsyncSICRedis(object):
+    """
+    The asyncio counterpart of SICRedis, see the module documentation. Only for clients: sending messages and
+    requests, and receiving messages. Large arrays are always sent through redis, and messages from senders in this
+    process arrive through redis as well.
+    """
+
+    # How long the transport of a channel is cached for by senders, in seconds
+    STREAM_CHANNELS_TTL = SICRedis.STREAM_CHANNELS_TTL
+
+    # How long the registered subscribers of a channel are cached for, and how long to wait for redis to confirm the
+    # subscription to the reply inbox, in seconds
+    SUBSCRIBERS_TTL = SICRedis.SUBSCRIBERS_TTL
+    SUBSCRIBE_TIMEOUT = SICRedis.SUBSCRIBE_TIMEOUT
+
+    def __init__(self, parent_name=None):
+        """
+        :param parent_name: The name of the module that uses this redis connection, for easier debugging. Also
+                            names the consumer group of stream channels, see SICRedis.
+        """
+        self.service_name = parent_name
+
+        # set by connect()
+        self._redis = None
+        self._pubsub = None
+        self._pubsub_task = None
+        self._closed = False
+        self._connect_lock = asyncio.Lock()
+        self._subscribe_lock = asyncio.Lock()
+
+        # the subscriptions per channel
+        self._subscriptions = dict()
+
+        self._client_id = utils.str_if_bytes(utils.random_hex())
+        self._host = "{}/{}".format(utils.get_ip_adress(), socket.gethostname())
+
+        # A long-lived channel this client receives all replies to its requests on, and the requests that are still
+        # awaiting a reply, by request id. The inbox is subscribed to on the first request.
+        self._reply_inbox = "sic:reply:{}".format(self._client_id)
+        self._reply_inbox_subscribed = None
+        self._control_channel = "sic:control:{}".format(self._client_id)
+        self._pending_requests = dict()
+
+        # The futures resolved when redis confirms a subscription, by channel, see _await_subscription. The request
+        # channels listened to for replies of older versions of the framework, with the number of requests awaiting
+        # such a reply, and whether channels have such subscribers, see _has_legacy_subscribers.
+        self._subscription_futures = dict()
+        self._legacy_reply_channels = collections.Counter()
+        self._legacy_subscribers_cache = dict()
+
+        # The stream channels and their reader, see SICRedis
+        self._stream_task = None
+        self._stream_channels = set()
+        self._stream_recover = set()
+        self._stream_group_keys = set()
+        self._stream_group = get_stream_group(parent_name, self._client_id)
+        self._stream_wake_key = "sic:wake:{}".format(self._client_id)
+        self._stream_maxlen_cache = dict()
+        self._ack_tasks = set()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def connect(self):
+        """
+        Connect to redis. Called by `async with`, and by AsyncSICConnector.
+        """
+        async with self._connect_lock:
+            if self._redis is not None:
+                return
+
+            # whether redis requires a password or TLS is tried once per process, shared with SICRedis
+            kwargs = await asyncio.get_event_loop().run_in_executor(
+                None, get_connection_kwargs
+            )
+            client = redis.asyncio.Redis(**kwargs)
+
+            # stay subscribed to the control channel, so the reader always has a channel to block on. Subscribe
+            # messages confirm subscriptions, see _await_subscription.
+            self._pubsub = client.pubsub()
+            await self._pubsub.subscribe(self._control_channel)
+            self._pubsub_task = asyncio.ensure_future(self._read_pubsub())
+            self._redis = client
+
+    async def _read_pubsub(self):
+        """
+        The reader task of the pubsub connection. Hands replies to the requests awaiting them, and other messages to
+        the subscriptions of their channel.
+        """
+        while True:
+            pubsub_msg = await self._pubsub.get_message(timeout=None)
+            if pubsub_msg is None:
+                continue
+
+            channel = utils.str_if_bytes(pubsub_msg["channel"])
+
+            if pubsub_msg["type"] == "subscribe":
+                future = self._subscription_futures.pop(channel, None)
+                if future is not None and not future.done():
+                    future.set_result(None)
+                continue
+
+            if pubsub_msg["type"] != "message":
+                continue
+
+            subscriptions = list(self._subscriptions.get(channel, []))
+            awaits_reply = (
+                channel == self._reply_inbox or channel in self._legacy_reply_channels
+            )
+
+            if not awaits_reply and not subscriptions:
+                continue
+
+            try:
+                sic_message = SICMessage.deserialize(pubsub_msg["data"])
+            except Exception:
+                traceback.print_exc()
+                continue
+
+            if awaits_reply and not utils.is_sic_instance(sic_message, SICRequest):
+                self._handle_reply(sic_message)
+
+            for s in subscriptions:
+                await s._put(sic_message)
+
+    async def _read_streams(self):
+        """
+        The reader task of the stream channels, see SICRedis._read_streams.
+        """
+        while True:
+            channels = {get_stream_key(c): c for c in self._stream_channels}
+            recover = {get_stream_key(c): "0" for c in self._stream_recover}
+            self._stream_recover.clear()
+
+            streams = {k: ">" for k in channels}
+            streams[self._stream_wake_key] = ">"
+
+            try:
+                entries = []
+                if recover:
+                    entries += (
+                        await self._redis.xreadgroup(
+                            self._stream_group, self._stream_group, recover
+                        )
+                        or []
+                    )
+                entries += (
+                    await self._redis.xreadgroup(
+                        self._stream_group, self._stream_group, streams, block=0
+                    )
+                    or []
+                )
+            except redis.exceptions.ConnectionError:
+                traceback.print_exc()
+                # read the messages that were in flight again once redis is back
+                await asyncio.sleep(1)
+                self._stream_recover.update(self._stream_channels)
+                continue
+            except redis.exceptions.ResponseError as e:
+                if "NOGROUP" not in str(e) and "UNBLOCKED" not in str(e):
+                    raise e
+                # a stream was removed, e.g. redis restarted without persistence, start over with new streams
+                for key in list(self._stream_group_keys):
+                    await self._create_stream_group(key)
+                continue
+
+            for key, messages in entries:
+                key = utils.str_if_bytes(key)
+
+                if key == self._stream_wake_key:
+                    await self._redis.xack(
+                        key, self._stream_group, *[i for i, _ in messages]
+                    )
+                    continue
+
+                for entry_id, fields in messages:
+                    await self._dispatch_stream(channels[key], key, entry_id, fields)
+
+    async def _dispatch_stream(self, channel, key, entry_id, fields):
+        subscriptions = list(self._subscriptions.get(channel, []))
+        if not subscriptions:
+            # the channel was unsubscribed from, leave the message to be read again when subscribing again
+            return
+
+        def ack():
+            task = asyncio.ensure_future(
+                self._redis.xack(key, self._stream_group, entry_id)
+            )
+            self._ack_tasks.add(task)
+            task.add_done_callback(self._ack_tasks.discard)
+
+        data = fields.get(b"data", None) if fields else None
+        if data is None:
+            ack()
+            return
+
+        try:
+            sic_message = SICMessage.deserialize(data)
+        except Exception:
+            traceback.print_exc()
+            ack()
+            return
+
+        # acknowledged once every subscription moved on to its next message, or dropped it
+        delivery = _StreamDelivery(sic_message, len(subscriptions), ack)
+        for s in subscriptions:
+            await s._put(sic_message, delivery)
+
+    async def _create_stream_group(self, key):
+        try:
+            # a new group only reads the messages added from now on, an existing group continues where it was
+            await self._redis.xgroup_create(
+                key, self._stream_group, id="$", mkstream=True
+            )
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise e
+
+        self._stream_group_keys.add(key)
+
+    async def _wake_stream_reader(self):
+        await self._redis.xadd(self._stream_wake_key, {"wake": b""}, maxlen=1)
+
+    def subscribe(self, channel, qos=None, transport=None):
+        """
+        Receive the messages on a channel, by iterating over the returned subscription:
+
+            async for message in r.subscribe("camera", qos=QoS(QOS_LATEST_ONLY)):
+                ...
+
+        :param channel: the channel to listen to
+        :param qos: How messages are queued while the application is busy, see sic_redis.QoS. With
+                    QOS_BOUNDED_FIFO, a full queue holds up all subscriptions (and requests) of this AsyncSICRedis.
+        :param transport: TRANSPORT_PUBSUB or TRANSPORT_STREAM, by default the transport set for the channel, see
+                          SICRedis.set_channel_transport. Messages on stream channels are acknowledged when the
+                          next message is asked for.
+        :return: an AsyncSubscription
+        """
+        return AsyncSubscription(
+            self, utils.str_if_bytes(channel), qos=qos, transport=transport
+        )
+
+    async def _subscribe(self, subscription):
+        async with self._subscribe_lock:
+            if subscription._subscribed:
+                return
+
+            await self.connect()
+
+            channel = subscription.channel
+            if subscription.transport is None:
+                maxlen = await self._redis.hget(STREAM_CHANNELS_KEY, channel)
+                subscription.transport = (
+                    TRANSPORT_STREAM if maxlen is not None else TRANSPORT_PUBSUB
+                )
+
+            subscriptions = self._subscriptions.setdefault(channel, [])
+            subscriptions.append(subscription)
+            subscription._subscribed = True
+
+            if len(subscriptions) > 1:
+                return
+
+            if subscription.transport == TRANSPORT_PUBSUB:
+                if channel not in self._legacy_reply_channels:
+                    await self._pubsub.subscribe(channel)
+                return
+
+            await self._create_stream_group(get_stream_key(channel))
+            self._stream_channels.add(channel)
+            self._stream_recover.add(channel)
+
+            if self._stream_task is None:
+                await self._create_stream_group(self._stream_wake_key)
+                self._stream_task = asyncio.ensure_future(self._read_streams())
+            else:
+                await self._wake_stream_reader()
+
+    async def _unsubscribe(self, subscription):
+        async with self._subscribe_lock:
+            channel = subscription.channel
+            subscriptions = self._subscriptions.get(channel, [])
+
+            if subscription not in subscriptions:
+                return
+
+            subscriptions.remove(subscription)
+            if subscriptions:
+                return
+
+            del self._subscriptions[channel]
+
+            if self._closed:
+                return
+
+            if subscription.transport == TRANSPORT_PUBSUB:
+                if channel not in self._legacy_reply_channels:
+                    await self._pubsub.unsubscribe(channel)
+            else:
+                self._stream_channels.discard(channel)
+                self._stream_recover.discard(channel)
+                await self._wake_stream_reader()
+
+    async def _get_stream_maxlen(self, channel):
+        """
+        See SICRedis._get_stream_maxlen.
+        """
+        now = asyncio.get_event_loop().time()
+        cached = self._stream_maxlen_cache.get(channel, None)
+
+        if cached is None or now - cached[0] > self.STREAM_CHANNELS_TTL:
+            maxlen = await self._redis.hget(STREAM_CHANNELS_KEY, channel)
+            cached = (now, int(maxlen) if maxlen is not None else None)
+            self._stream_maxlen_cache[channel] = cached
+
+        return cached[1]
+
+    async def send_message(self, channel, message):
+        """
+        Send a SICMessage on a channel, see SICRedis.send_message.
+        :param channel: The redis pubsub channel to communicate on.
+        :param message: The message
+        :return: The number of subscribers that received the message, or the id of the stream entry for stream
+                 channels.
+        """
+        assert isinstance(
+            message, SICMessage
+        ), "Message must inherit from SICMessage (got {})".format(type(message))
+
+        await self.connect()
+
+        maxlen = await self._get_stream_maxlen(channel)
+        if maxlen is not None:
+            return await self._redis.xadd(
+                get_stream_key(channel),
+                {"data": message.serialize()},
+                maxlen=maxlen,
+                approximate=True,
+            )
+
+        return await self._redis.publish(channel, message.serialize())
+
+    def _handle_reply(self, reply):
+        future = self._pending_requests.get(reply._request_id, None)
+        if future is not None and not future.done():
+            future.set_result(reply)
+
+    def _await_subscription(self, channel):
+        """
+        Get a future that is resolved when redis confirms the subscription to a channel. Must be called before
+        subscribing.
+        """
+        future = self._subscription_futures.get(channel, None)
+        if future is None:
+            future = asyncio.get_event_loop().create_future()
+            self._subscription_futures[channel] = future
+        return future
+
+    async def _subscribe_reply_inbox(self):
+        """
+        Subscribe to the reply inbox, once. Waits until the reader task received the confirmation of the subscription,
+        so the reply to the first request can not arrive before we are listening.
+        :raises TimeoutError: if redis does not confirm the subscription in SUBSCRIBE_TIMEOUT seconds
+        """
+        async with self._subscribe_lock:
+            if self._reply_inbox_subscribed is None:
+                self._reply_inbox_subscribed = self._await_subscription(
+                    self._reply_inbox
+                )
+                await self._pubsub.subscribe(self._reply_inbox)
+
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(self._reply_inbox_subscribed), self.SUBSCRIBE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                "Redis did not confirm the subscription to reply inbox {}".format(
+                    self._reply_inbox
+                )
+            )
+
+    async def _has_legacy_subscribers(self, channel):
+        """
+        Whether a subscriber of the channel runs an older version of the framework, see
+        SICRedis._has_legacy_subscribers. Cached for SUBSCRIBERS_TTL seconds.
+        """
+        if message_python2.LEGACY_SERIALIZATION:
+            return True
+
+        now = asyncio.get_event_loop().time()
+        cached = self._legacy_subscribers_cache.get(channel, None)
+        if cached is not None and now - cached[0] <= self.SUBSCRIBERS_TTL:
+            return cached[1]
+
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.pubsub_numsub(channel)
+        pipe.hgetall(get_hosts_key(channel))
+        ((_, n_subscribers),), hosts = await pipe.execute()
+
+        # registrations of clients that are no longer connected do not count, see SICRedis._get_subscribers
+        n_registered = 0
+        if hosts:
+            alive = await self._redis.pubsub_numsub(
+                *["sic:control:{}".format(utils.str_if_bytes(c)) for c in hosts]
+            )
+            n_registered = sum(1 for _, n_connections in alive if n_connections)
+
+        has_legacy = n_subscribers > n_registered
+        self._legacy_subscribers_cache[channel] = (now, has_legacy)
+        return has_legacy
+
+    async def _listen_for_legacy_reply(self, channel, listen):
+        """
+        Start or stop listening for replies on a request channel, for subscribers that run an older version of the
+        framework, which reply on the request channel instead of the reply inbox.
+        """
+        async with self._subscribe_lock:
+            subscribed = (
+                channel in self._legacy_reply_channels or channel in self._subscriptions
+            )
+
+            if listen:
+                self._legacy_reply_channels[channel] += 1
+                if not subscribed:
+                    await self._pubsub.subscribe(channel)
+                return
+
+            self._legacy_reply_channels[channel] -= 1
+            if self._legacy_reply_channels[channel] <= 0:
+                del self._legacy_reply_channels[channel]
+                if channel not in self._subscriptions and not self._closed:
+                    await self._pubsub.unsubscribe(channel)
+
+    async def request(self, channel, request, timeout=5, block=True):
+        """
+        Send a request, and wait for the reply, see SICRedis.request. Other tasks keep running while waiting, so
+        requests to several components can be awaited at once with asyncio.gather.
+        :param channel: The redis pubsub channel to communicate on.
+        :param request: The SICRequest
+        :param timeout: Timeout in seconds in case the reply takes too long.
+        :param block: If false, immediately returns None after sending the request.
+        :return: the SICMessage reply
+        """
+        if request._request_id is None:
+            raise ValueError(
+                "Invalid request id for request {}".format(request.get_message_name())
+            )
+
+        await self.connect()
+
+        if not block:
+            # nobody is waiting for the reply, so let it be sent on the request channel
+            request._reply_channel = None
+            await self.send_message(channel, request)
+            return None
+
+        await self._subscribe_reply_inbox()
+
+        future = asyncio.get_event_loop().create_future()
+        self._pending_requests[request._request_id] = future
+
+        # older versions of the framework reply on the request channel, so listen there as well
+        legacy = await self._has_legacy_subscribers(channel)
+        if legacy:
+            await self._listen_for_legacy_reply(channel, True)
+
+        try:
+            request._reply_channel = self._reply_inbox
+            await self.send_message(channel, request)
+
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                "Waiting for reply to {} to request timed out".format(
+                    request.get_message_name()
+                )
+            )
+        finally:
+            del self._pending_requests[request._request_id]
+            if legacy:
+                await self._listen_for_legacy_reply(channel, False)
+
+    async def close(self):
+        """
+        End all subscriptions, and disconnect from redis.
+        """
+        if self._closed or self._redis is None:
+            return
+        self._closed = True
+
+        for subscriptions in list(self._subscriptions.values()):
+            for s in list(subscriptions):
+                await s.close()
+
+        for task in [self._pubsub_task, self._stream_task]:
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+        if self._ack_tasks:
+            await asyncio.gather(*self._ack_tasks, return_exceptions=True)
+
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.delete(self._stream_wake_key)
+            for key in self._stream_group_keys:
+                if key != self._stream_wake_key:
+                    pipe.xgroup_destroy(key, self._stream_group)
+            await pipe.execute(raise_on_error=False)
+        except redis.exceptions.ConnectionError:
+            pass
+
+        await _close_client(self._pubsub)
+        await _close_client(self._redis)
@@ -115,5 +115,81 @@ def type_equal_sic(a, b):
     return type(a).__name__ == type(b).__name__
 
 
+def is_installed(module):
+    """
+    Whether a top-level module can be imported, without importing it.
+    :param module: the name of the module, e.g. "cv2"
+    """
+    if module in sys.modules:
+        return True
+
+    if six.PY3:
+        import importlib.util
+
+        return importlib.util.find_spec(module) is not None
+
+    import imp
+
+    try:
+        imp.find_module(module)
+    except ImportError:
+        return False
+    return True
+
+
+def lazy_attributes(package, attributes, star_module=None):
+    """
+    Create the module level __getattr__ and __dir__ (PEP 562, python 3.7+) of a package, so its attributes are
+    imported from their submodules when they are first used instead of when the package is imported. In the
+    __init__.py of the package:
+
+        __getattr__, __dir__ = lazy_attributes(__name__, {"Nao": ".nao", "Pepper": ".pepper"})
+
+    :param package: The name of the package (__name__).
+    :param attributes: dict of attribute name to the (relative) name of the module that defines it. If the module
+                       name ends with the attribute name, the attribute is the module itself.
+    :param star_module: Optional (relative) name of a module whose public attributes are attributes of the package as
+                        well, like `from star_module import *`.
+    :return: the __getattr__ and __dir__ functions of the package
+    """
+    import importlib
+
+    def get_star_names():
+        module = importlib.import_module(star_module, package)
+        return getattr(
+            module, "__all__", [n for n in vars(module) if not n.startswith("_")]
+        )
+
+    def __getattr__(name):
+        if name == "__all__":
+            # used by `from package import *`
+            return [n for n in __dir__() if not n.startswith("_")]
+
+        if name in attributes:
+            module_name = attributes[name]
+            if module_name.endswith("." + name):
+                value = importlib.import_module(module_name, package)
+            else:
+                value = getattr(importlib.import_module(module_name, package), name)
+        elif star_module is not None and name in get_star_names():
+            value = getattr(importlib.import_module(star_module, package), name)
+        else:
+            raise AttributeError(
+                "module {!r} has no attribute {!r}".format(package, name)
+            )
+
+        # store the attribute in the package, so __getattr__ is only called on first use
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__():
+        names = set(vars(sys.modules[package])) | set(attributes)
+        if star_module is not None:
+            names.update(get_star_names())
+        return sorted(names)
+
+    return __getattr__, __dir__
+
+
 if __name__ == "__main__":
     pass
@@ -1,2 +1,10 @@
-from .nao import Nao
-from .pepper import Pepper
+import sys
+
+if sys.version_info < (3, 7):
+    from .nao import Nao
+    from .pepper import Pepper
+else:
+    from sic_framework.core.utils import lazy_attributes
+
+    # only import the naoqi components when a Nao or Pepper is used, e.g. not when importing devices.desktop
+    __getattr__, __dir__ = lazy_attributes(__name__, {"Nao": ".nao", "Pepper": ".pepper"})
@@ -4,6 +4,7 @@ from sic_framework import SICComponentManager
 from sic_framework.core.connector import SICConnector
 from sic_framework.core.message_python2 import AudioMessage, SICConfMessage
 from sic_framework.core.sensor_python2 import SICSensor
+from sic_framework.core.sic_redis import TRANSPORT_STREAM
 
 
 class MicrophoneConf(SICConfMessage):
@@ -13,10 +14,14 @@ class MicrophoneConf(SICConfMessage):
 
 
 class DesktopMicrophoneSensor(SICSensor):
+    # every audio chunk is needed for speech recognition, so do not lose any when a subscriber is busy
+    OUTPUT_TRANSPORT = TRANSPORT_STREAM
+
     def __init__(self, *args, **kwargs):
         super(DesktopMicrophoneSensor, self).__init__(*args, **kwargs)
 
         self.audio_buffer = None
+        self.sequence_number = 0
 
         self.device = pyaudio.PyAudio()
 
@@ -45,7 +50,12 @@ class DesktopMicrophoneSensor(SICSensor):
         self.logger.debug("Reading audio")
         # read 250ms chunks
         data = self.stream.read(int(self.params.sample_rate // 4))
-        return AudioMessage(data, sample_rate=self.params.sample_rate)
+        self.sequence_number += 1
+        return AudioMessage(
+            data,
+            sample_rate=self.params.sample_rate,
+            sequence_number=self.sequence_number,
+        )
 
     def stop(self, *args):
         super(DesktopMicrophoneSensor, self).stop(*args)
@@ -4,6 +4,7 @@ from sic_framework import SICComponentManager
 from sic_framework.core.connector import SICConnector
 from sic_framework.core.message_python2 import AudioMessage, SICConfMessage
 from sic_framework.core.sensor_python2 import SICSensor
+from sic_framework.core.sic_redis import TRANSPORT_STREAM
 from sic_framework.devices.common_mini.mini_connector import MiniConnector
 
 
@@ -14,6 +15,9 @@ class MiniMicrophoneConf(SICConfMessage):
 
 
 class MiniMicrophoneSensor(SICSensor):
+    # see DesktopMicrophoneSensor
+    OUTPUT_TRANSPORT = TRANSPORT_STREAM
+
     def __init__(self, *args, **kwargs):
         super(MiniMicrophoneSensor, self).__init__(*args, **kwargs)
         self.alphamini = MiniConnector()
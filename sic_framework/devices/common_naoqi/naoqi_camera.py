@@ -6,6 +6,7 @@ from sic_framework.core.message_python2 import (
     CompressedImageMessage,
     SICConfMessage,
     SICMessage,
+    get_turbojpeg,
 )
 from sic_framework.core.sensor_python2 import SICSensor
 
@@ -16,7 +17,11 @@ if utils.PYTHON_VERSION_IS_2:
     import numpy as np
     import qi
     from naoqi import ALProxy
-    from PIL import Image
+
+
+# The colorspaces of ALVideoDevice, see http://doc.aldebaran.com/2-8/family/robots/video_robot.html
+YUV422_COLORSPACE = 9
+RGB_COLORSPACE = 11
 
 
 class NaoqiCameraConf(SICConfMessage):
@@ -42,6 +47,7 @@ class NaoqiCameraConf(SICConfMessage):
         back_light_comp=None,
         auto_focus=None,
         manual_focus_value=None,
+        jpeg_from_yuv=False,
     ):
         """
         params can be found at http://doc.aldebaran.com/2-8/family/nao_technical/video_naov6.html#naov6-video
@@ -73,6 +79,10 @@ class NaoqiCameraConf(SICConfMessage):
         back_light_comp: 1
         auto_focus: 0
         manual_focus_value: 0
+
+        jpeg_from_yuv: get the images in the native YUV422 colorspace of the camera and JPEG compress them as is,
+        instead of having NAOqi convert them to RGB first. Faster, but requires a version of PyTurboJPEG with
+        encode_from_yuv, and the received images are in BGR order (like those of the desktop camera) instead of RGB.
         """
 
         SICConfMessage.__init__(self)
@@ -80,7 +90,7 @@ class NaoqiCameraConf(SICConfMessage):
         self.port = port
         self.cam_id = cam_id
         self.res_id = res_id
-        self.color_id = 11  # RGB
+        self.color_id = RGB_COLORSPACE
         self.fps = fps
         self.brightness = brightness
         self.contrast = contrast
@@ -97,6 +107,69 @@ class NaoqiCameraConf(SICConfMessage):
         self.back_light_comp = back_light_comp
         self.auto_focus = auto_focus
         self.manual_focus_value = manual_focus_value
+        self.jpeg_from_yuv = jpeg_from_yuv
+
+
+class NaoqiFrameEncoder(object):
+    """
+    Turns the images from ALVideoDevice.getImageRemote into CompressedImageMessages, without copying the pixels
+    before they are JPEG compressed.
+    """
+
+    def __init__(self, from_yuv=False):
+        """
+        :param from_yuv: whether the images are YUV422 (YUYV) and JPEG compressed in that colorspace, see
+                         NaoqiCameraConf.jpeg_from_yuv
+        """
+        self.from_yuv = from_yuv
+        # the Y, U and V planes of the last image, reused for every image of the same size
+        self._yuv_planes = None
+
+    @staticmethod
+    def supports_yuv():
+        return hasattr(get_turbojpeg(), "encode_from_yuv")
+
+    def encode(self, nao_image):
+        """
+        :param nao_image: the image as returned by getImageRemote: [width, height, number of layers, colorspace,
+                          seconds, microseconds, pixels, ...]
+        :rtype: CompressedImageMessage
+        """
+        width, height, n_layers, pixels = (
+            nao_image[0],
+            nao_image[1],
+            nao_image[2],
+            nao_image[6],
+        )
+
+        if self.from_yuv:
+            return CompressedImageMessage.from_jpeg(
+                self._yuv422_to_jpeg(pixels, width, height)
+            )
+
+        # a read-only view on the pixels NAOqi returned, which are JPEG compressed when the message is sent
+        image = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, n_layers)
+        return CompressedImageMessage(image)
+
+    def _yuv422_to_jpeg(self, pixels, width, height):
+        from turbojpeg import TJSAMP_422
+
+        # YUYV: the luma of every pixel, with the two chroma values shared by each pair of pixels in between
+        yuyv = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width * 2)
+
+        n_pixels = width * height
+        if self._yuv_planes is None or self._yuv_planes.size != n_pixels * 2:
+            self._yuv_planes = np.empty(n_pixels * 2, dtype=np.uint8)
+
+        planes = self._yuv_planes
+        chroma_shape = (height, width // 2)
+        planes[:n_pixels].reshape(height, width)[...] = yuyv[:, 0::2]
+        planes[n_pixels : n_pixels * 3 // 2].reshape(chroma_shape)[...] = yuyv[:, 1::4]
+        planes[n_pixels * 3 // 2 :].reshape(chroma_shape)[...] = yuyv[:, 3::4]
+
+        return get_turbojpeg().encode_from_yuv(
+            planes, height, width, jpeg_subsample=TJSAMP_422
+        )
 
 
 class BaseNaoqiCameraSensor(SICSensor):
@@ -161,11 +234,19 @@ class BaseNaoqiCameraSensor(SICSensor):
             )
         self.video_service.setParameter(0, 35, 1)  # Keep Alive parameter
 
+        from_yuv = getattr(self.params, "jpeg_from_yuv", False)
+        if from_yuv and not NaoqiFrameEncoder.supports_yuv():
+            self.logger.warning(
+                "This version of TurboJPEG can not compress YUV images, using RGB images"
+            )
+            from_yuv = False
+        self.frame_encoder = NaoqiFrameEncoder(from_yuv)
+
         self.videoClient = self.video_service.subscribeCamera(
             "Camera_{}".format(random.randint(0, 100000)),
             self.params.cam_id,
             self.params.res_id,
-            self.params.color_id,
+            YUV422_COLORSPACE if from_yuv else self.params.color_id,
             self.params.fps,
         )
 
@@ -182,16 +263,9 @@ class BaseNaoqiCameraSensor(SICSensor):
         return CompressedImageMessage
 
     def execute(self):
-        # get the actual image from the NaoImage type
-        naoImage = self.video_service.getImageRemote(self.videoClient)
-        imageWidth = naoImage[0]
-        imageHeight = naoImage[1]
-        array = naoImage[6]
-        image_string = str(bytearray(array))
-
-        # Create a PIL Image from our pixel array.
-        im = Image.frombytes("RGB", (imageWidth, imageHeight), image_string)
-        return CompressedImageMessage(np.asarray(im))
+        return self.frame_encoder.encode(
+            self.video_service.getImageRemote(self.videoClient)
+        )
 
     def stop(self, *args):
         super(BaseNaoqiCameraSensor, self).stop(*args)
@@ -242,6 +316,11 @@ class NaoqiBottomCamera(SICConnector):
 
 class StereoImageMessage(SICMessage):
     _compress_images = True
+    # the images are grayscale when convert_bw is set, which JPEG compression does not apply to
+    _field_codecs = {
+        "left_image": ("zstd", "lz4", "zlib"),
+        "right_image": ("zstd", "lz4", "zlib"),
+    }
 
     def __init__(self, left, right):
         self.left_image = left
@@ -41,6 +41,7 @@ class LookAtMessage(SICMessage):
     """
 
     _compress_images = False
+    _interpolated_fields = ("x", "y")
 
     def __init__(self, x, y):
         self.x = x
@@ -74,18 +75,10 @@ class NaoqiLookAtComponent(SICComponent):
         x, y = None, None
         if message == BoundingBoxesMessage:
             # track the most confident boundingbox
-            if len(message.bboxes):
-                bbox = message.bboxes[0]
-
-                print("bbox")
-                print(bbox.x, bbox.y, bbox.confidence)
-
-                for x in message.bboxes:
-                    if bbox.confidence < x.confidence:
-                        bbox = x
-
-                x = bbox.x / self.params.camera_x_max
-                y = bbox.y / self.params.camera_y_max
+            boxes = message.top_k(1).boxes
+            if len(boxes):
+                x = float(boxes["x"][0]) / self.params.camera_x_max
+                y = float(boxes["y"][0]) / self.params.camera_y_max
 
         elif message == LookAtMessage:
             y = message.y / self.params.camera_y_max
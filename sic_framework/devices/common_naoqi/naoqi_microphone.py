@@ -4,6 +4,7 @@ from sic_framework import SICComponentManager, utils
 from sic_framework.core.connector import SICConnector
 from sic_framework.core.message_python2 import AudioMessage, SICConfMessage
 from sic_framework.core.sensor_python2 import SICSensor
+from sic_framework.core.sic_redis import TRANSPORT_STREAM
 
 if utils.PYTHON_VERSION_IS_2:
     import qi
@@ -19,6 +20,9 @@ class NaoqiMicrophoneConf(SICConfMessage):
 
 
 class NaoqiMicrophoneSensor(SICSensor):
+    # keep audio chunks for speech recognition components that fall behind
+    OUTPUT_TRANSPORT = TRANSPORT_STREAM
+
     COMPONENT_STARTUP_TIMEOUT = 4
 
     def __init__(self, *args, **kwargs):
@@ -46,6 +50,7 @@ class NaoqiMicrophoneSensor(SICSensor):
         self.audio_service.subscribe(self.module_name)
 
         self.new_sound_data_available = threading.Event()
+        self.sequence_number = 0
 
     @staticmethod
     def get_conf():
@@ -64,7 +69,12 @@ class NaoqiMicrophoneSensor(SICSensor):
         self.new_sound_data_available.wait()
         self.new_sound_data_available.clear()
 
-        return AudioMessage(self.audio_buffer, sample_rate=self.params.sample_rate)
+        self.sequence_number += 1
+        return AudioMessage(
+            self.audio_buffer,
+            sample_rate=self.params.sample_rate,
+            sequence_number=self.sequence_number,
+        )
 
     def stop(self, *args):
         self.audio_service.unsubscribe(self.module_name)
@@ -37,6 +37,8 @@ class StopStreaming(SICRequest):
 
 
 class NaoJointAngles(SICMessage):
+    _interpolated_fields = ("angles",)
+
     def __init__(self, joints, angles):
         self.joints = joints
         self.angles = angles
@@ -84,6 +86,9 @@ class NaoqiMotionStreamerService(SICComponent, NaoqiMotionTools):
 
         self.do_streaming = threading.Event()
 
+        # send the joint angles of a few ticks at once, instead of waiting for redis every tick
+        self._redis.set_channel_batching(self._output_channel)
+
         # A list of joint names (not chains)
         self.joints = self.generate_joint_list(["Body"])
 
@@ -125,12 +130,14 @@ class NaoqiMotionStreamerService(SICComponent, NaoqiMotionTools):
         # Set the stiffness value of a list of joint chain.
         # For Nao joint chains are: Head, RArm, LArm, RLeg, LLeg
         try:
+            next_sample = time.time()
 
             while not self._stop_event.is_set():
 
                 # check both do_streaming and _stop_event periodically
                 self.do_streaming.wait(1)
                 if not self.do_streaming.is_set():
+                    next_sample = time.time()
                     continue
 
                 if self.stiffness != 0:
@@ -143,7 +150,14 @@ class NaoqiMotionStreamerService(SICComponent, NaoqiMotionTools):
 
                 self.output_message(NaoJointAngles(self.joints, angles))
 
-                time.sleep(1 / float(self.samples_per_second))
+                # sample at a fixed rate, regardless of how long reading the angles took
+                next_sample += 1 / float(self.samples_per_second)
+                delay = next_sample - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # fell behind, do not try to catch up
+                    next_sample = time.time()
         except Exception as e:
             self.logger.exception(e)
             self.stop()
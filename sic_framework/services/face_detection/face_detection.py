@@ -8,6 +8,7 @@ from sic_framework.core import sic_logging
 from sic_framework.core.component_manager_python2 import SICComponentManager
 from sic_framework.core.component_python2 import SICComponent
 from sic_framework.core.connector import SICConnector
+from sic_framework.core.detection_cache import DetectionCache
 from sic_framework.core.message_python2 import (
     BoundingBox,
     BoundingBoxesMessage,
@@ -20,16 +21,32 @@ from sic_framework.core.service_python2 import SICService
 
 
 class FaceDetectionConf(SICConfMessage):
-    def __init__(self, minW=150, minH=150):
+    def __init__(
+        self,
+        minW=150,
+        minH=150,
+        skip_unchanged_frames=False,
+        unchanged_threshold=10.0,
+        max_skipped_frames=10,
+    ):
         """
-        :param minW       Minimum possible face width in pixels. Setting this too low causes detection to be slow.
-        :param minH       Minimum possible face height in pixels.
+        :param minW                     Minimum possible face width in pixels. Setting this too low causes detection
+                                        to be slow.
+        :param minH                     Minimum possible face height in pixels.
+        :param skip_unchanged_frames    Reuse the faces of the previous image of a camera if the image barely changed,
+                                        see DetectionCache
+        :param unchanged_threshold      The maximum absolute difference in gray levels (0-255) between (downsampled)
+                                        images below which an image is considered unchanged
+        :param max_skipped_frames       The maximum number of consecutive images of a camera to reuse the faces for
         """
         SICConfMessage.__init__(self)
 
         # Define min window size to be recognized as a face_img
         self.minW = minW
         self.minH = minH
+        self.skip_unchanged_frames = skip_unchanged_frames
+        self.unchanged_threshold = unchanged_threshold
+        self.max_skipped_frames = max_skipped_frames
 
 
 class FaceDetectionComponent(SICComponent):
@@ -39,6 +56,14 @@ class FaceDetectionComponent(SICComponent):
         cascadePath = str(script_dir / "haarcascade_frontalface_default.xml")
         self.faceCascade = cv2.CascadeClassifier(cascadePath)
 
+        self.detection_cache = None
+        if self.params.skip_unchanged_frames:
+            self.detection_cache = DetectionCache(
+                threshold=self.params.unchanged_threshold,
+                max_age=self.params.max_skipped_frames,
+                logger=self.logger,
+            )
+
     @staticmethod
     def get_inputs():
         return [CompressedImageMessage, CompressedImageRequest]
@@ -52,7 +77,12 @@ class FaceDetectionComponent(SICComponent):
         return BoundingBoxesMessage
 
     def on_message(self, message):
-        bboxes = self.detect(message.image)
+        if self.detection_cache is not None:
+            bboxes = self.detection_cache.detect(
+                message._previous_component_name, message.image, self.detect
+            )
+        else:
+            bboxes = self.detect(message.image)
         self.output_message(bboxes)
 
     def on_request(self, request):
@@ -70,9 +100,8 @@ class FaceDetectionComponent(SICComponent):
             minSize=(int(self.params.minW), int(self.params.minH)),
         )
 
-        faces = [BoundingBox(x, y, w, h) for (x, y, w, h) in faces]
-
-        return BoundingBoxesMessage(faces)
+        # an Nx4 array of x, y, w, h, or an empty tuple if there are no faces
+        return BoundingBoxesMessage.from_array(faces)
 
 
 class FaceDetection(SICConnector):
@@ -1,4 +1,15 @@
+from sic_framework.core.utils import lazy_attributes
+
 from .face_detection_dnn import *
-from .utils_importable.datasets import letterbox
-from .utils_importable.experimental import attempt_load
-from .utils_importable.general import non_max_suppression, scale_coords, xyxy2xywh
+
+# the YOLO utilities import torch, torchvision and matplotlib
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "letterbox": ".utils_importable.datasets",
+        "attempt_load": ".utils_importable.experimental",
+        "non_max_suppression": ".utils_importable.general",
+        "scale_coords": ".utils_importable.general",
+        "xyxy2xywh": ".utils_importable.general",
+    },
+)
@@ -1,18 +1,15 @@
 import argparse
 import os
 import pathlib
-import queue
 
-import cv2
 import numpy as np
-import torch
-import torchvision
 from numpy import array
 
 from sic_framework.core import sic_logging
 from sic_framework.core.component_manager_python2 import SICComponentManager
 from sic_framework.core.component_python2 import SICComponent
 from sic_framework.core.connector import SICConnector
+from sic_framework.core.detection_cache import DetectionCache
 from sic_framework.core.message_python2 import (
     BoundingBox,
     BoundingBoxesMessage,
@@ -23,17 +20,7 @@ from sic_framework.core.message_python2 import (
     SICRequest,
 )
 from sic_framework.core.service_python2 import SICService
-from sic_framework.services.face_detection_dnn.utils_importable.datasets import (
-    letterbox,
-)
-from sic_framework.services.face_detection_dnn.utils_importable.experimental import (
-    attempt_load,
-)
-from sic_framework.services.face_detection_dnn.utils_importable.general import (
-    non_max_suppression,
-    scale_coords,
-    xyxy2xywh,
-)
+from sic_framework.core.sic_redis import QOS_LATEST_ONLY, QoS
 
 
 class DNNFaceDetectionConf(SICConfMessage):
@@ -46,6 +33,11 @@ class DNNFaceDetectionConf(SICConfMessage):
         resize_to=None,
         augment=False,
         kpt_label=5,
+        max_batch_size=4,
+        max_batch_delay=0.01,
+        skip_unchanged_frames=False,
+        unchanged_threshold=10.0,
+        max_skipped_frames=10,
     ):
         """
         :param conf_threshold       model class confidence threshold
@@ -53,8 +45,16 @@ class DNNFaceDetectionConf(SICConfMessage):
         :param classes              filter by class [0], or [0, 2, 3]. Default=[0]
         :param agnostic_nms         class-agnostic NMS
         :param resize_to            If not None, letterbox (aspect-ratio preserving resize) to the given size. E.g. (640,480)
-        :param augment              Augment inference (with lr-flips and resizes)
+        :param augment              Augment inference (with lr-flips and resizes), only with the torch backend
         :param kpt_label            Number of keypoint NOT USED CURRENTLY (library default: 5)
+        :param max_batch_size       The maximum number of images (of all connected cameras and requests) to detect
+                                    faces in with one forward pass of the model
+        :param max_batch_delay      The maximum time in seconds to wait for more images to fill a batch
+        :param skip_unchanged_frames Reuse the faces of the previous image of a camera if the image barely changed,
+                                     see core.detection_cache.DetectionCache
+        :param unchanged_threshold  The maximum absolute difference in gray levels (0-255) between (downsampled)
+                                    images below which an image is considered unchanged
+        :param max_skipped_frames   The maximum number of consecutive images of a camera to reuse the faces for
         """
         SICConfMessage.__init__(self)
 
@@ -68,6 +68,11 @@ class DNNFaceDetectionConf(SICConfMessage):
         self.resize_to = resize_to
         self.augment = augment
         self.kpt_label = kpt_label
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.skip_unchanged_frames = skip_unchanged_frames
+        self.unchanged_threshold = unchanged_threshold
+        self.max_skipped_frames = max_skipped_frames
 
 
 """
@@ -77,14 +82,32 @@ https://github.com/derronqi/yolov7-face/tree/main
 
 
 class DNNFaceDetectionComponent(SICComponent):
-    COMPONENT_STARTUP_TIMEOUT = 10
+    """
+    Detects faces in the images of any number of cameras, and in the images of requests. The images that arrive at
+    (about) the same time are detected in one batch, see inference.BatchedInference, and every camera and request
+    gets the detections of its own image.
+    """
+
+    # converting the model to the other backends and comparing their speed takes a while on CPU
+    COMPONENT_STARTUP_TIMEOUT = 60
+    # only detect faces in the most recent image, skip images that arrived while busy
+    INPUT_QOS = QoS(QOS_LATEST_ONLY)
+    # requests are batched with each other and with the camera images, so handle several at once
+    REQUEST_CONCURRENCY = 4
     model_path = None
+    # the backend to run the model with, see inference.load_backends, and whether to quantize ONNX models to int8
+    backend = "auto"
+    quantize = False
 
     def __init__(self, *args, **kwargs):
         super(DNNFaceDetectionComponent, self).__init__(*args, **kwargs)
 
-        # Initialize face recognition data
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # torch and the YOLO utilities take seconds to import, so only import them when the component is started and
+        # not when the connector is imported
+        from sic_framework.services.face_detection_dnn.inference import (
+            BatchedInference,
+            YoloFaceDetector,
+        )
 
         if not os.path.isfile(DNNFaceDetectionComponent.model_path):
             raise FileNotFoundError(
@@ -92,19 +115,28 @@ class DNNFaceDetectionComponent(SICComponent):
             )
         else:
             model_path = DNNFaceDetectionComponent.model_path
-        self.model = attempt_load(model_path, map_location=self.device)
-
-        self.tf = torchvision.transforms.ToTensor()
-
-        self.input_message_buffer = queue.Queue()
+        self.detector = YoloFaceDetector(
+            model_path,
+            backend=DNNFaceDetectionComponent.backend,
+            quantize=DNNFaceDetectionComponent.quantize,
+            input_shape=self.params.resize_to,
+            logger=self.logger,
+        )
 
-    def start(self):
-        super().start()
+        self.inference = BatchedInference(
+            lambda images: self.detector.detect(images, self.params),
+            max_batch_size=self.params.max_batch_size,
+            max_delay=self.params.max_batch_delay,
+            name="{}_inference".format(self.get_component_name()),
+        )
 
-        while True:
-            message = self.input_message_buffer.get()
-            bboxes = self.detect(message.image)
-            self.output_message(bboxes)
+        self.detection_cache = None
+        if self.params.skip_unchanged_frames:
+            self.detection_cache = DetectionCache(
+                threshold=self.params.unchanged_threshold,
+                max_age=self.params.max_skipped_frames,
+                logger=self.logger,
+            )
 
     @staticmethod
     def get_inputs():
@@ -118,77 +150,30 @@ class DNNFaceDetectionComponent(SICComponent):
         return DNNFaceDetectionConf()
 
     def on_message(self, message):
-        try:
-            self.input_message_buffer.get_nowait()  # remove previous message if its still there
-        except queue.Empty:
-            pass
-        self.input_message_buffer.put(message)
+        if self.detection_cache is not None:
+            bboxes = self.detection_cache.detect(
+                message._previous_component_name, message.image, self.detect
+            )
+        else:
+            bboxes = self.detect(message.image)
+        # align the detections with the image they are of, which matters when multiple cameras are connected
+        bboxes._timestamp = message._timestamp
+        self.output_message(bboxes)
 
     def on_request(self, request):
         return self.detect(request.image)
 
     def detect(self, image):
+        """
+        Detect the faces in the image, together with the images submitted by other threads at the same time.
+        :param image: a HxWx3 uint8 RGB image
+        :rtype: BoundingBoxesMessage
+        """
+        return self.inference.submit(image).result()
 
-        original_shape = image.shape
-
-        if self.params.resize_to is not None:
-            image_resized = letterbox(image, self.params.resize_to)[0]
-        else:
-            image_resized = image
-
-        image_tensor = self.tf(image_resized).unsqueeze(0).to(self.device)
-
-        pred = self.model(image_tensor, augment=self.params.augment)[0]
-        # Apply NMS
-        pred = non_max_suppression(
-            pred,
-            self.params.conf_threshold,
-            self.params.iou_threshold,
-            classes=self.params.classes,
-            agnostic=self.params.agnostic_nms,
-            kpt_label=self.params.kpt_label,
-        )
-
-        faces = []
-
-        h, w, c = original_shape
-        gn = torch.tensor(original_shape)[[1, 0, 1, 0]].to(
-            self.device
-        )  # normalization gain whwh
-        gn_lks = torch.tensor(original_shape)[[1, 0, 1, 0, 1, 0, 1, 0, 1, 0]].to(
-            self.device
-        )  # normalization gain landmarks
-
-        if pred is not None:
-            # batch is be one, so squeeze
-            det = pred[0]
-            if self.params.resize_to is not None:
-                scale_coords(
-                    image_tensor.shape[2:], det[:, :4], original_shape, kpt_label=False
-                )
-                scale_coords(
-                    image_tensor.shape[2:],
-                    det[:, 6:],
-                    original_shape,
-                    kpt_label=self.params.kpt_label,
-                    step=3,
-                )
-
-            for j in range(det.size()[0]):  # for every detection in the image
-                xywh = (xyxy2xywh(det[j, :4].view(1, 4)) / gn).view(-1)
-                xywh = xywh.data.cpu().numpy()
-                conf = float(det[j, 4].cpu().numpy())
-                # TODO this indexing is incorrect
-                # landmarks = (det[j, 5:15].view(1, 10) / gn_lks).view(-1).tolist()
-                # class_num = int(det[j, 5].cpu().numpy())
-                x1 = int(xywh[0] * w - 0.5 * xywh[2] * w)
-                y1 = int(xywh[1] * h - 0.5 * xywh[3] * h)
-                w2 = int(xywh[2] * w)
-                h2 = int(xywh[3] * h)
-                bbox = BoundingBox(x1, y1, w2, h2, confidence=conf)
-                faces.append(bbox)
-
-        return BoundingBoxesMessage(faces)
+    def stop(self, *args):
+        self.inference.close()
+        super(DNNFaceDetectionComponent, self).stop(*args)
 
 
 class DNNFaceDetection(SICConnector):
@@ -203,12 +188,25 @@ def main():
         "--model",
         type=str,
         required=True,
-        help="Path to the model file (e.g., yolov7-face.pt)",
+        help="Path to the model file (e.g., yolov7-face.pt), or a TorchScript or ONNX (.onnx) export of it",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["auto", "torch", "torchscript", "onnx"],
+        default="auto",
+        help="Run the model in eager PyTorch, TorchScript or ONNX Runtime, by default the fastest",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Quantize the weights of ONNX models to int8",
     )
     args = parser.parse_args()
 
     # pass yolo model file to component
     DNNFaceDetectionComponent.model_path = args.model
+    DNNFaceDetectionComponent.backend = args.backend
+    DNNFaceDetectionComponent.quantize = args.quantize
 
     SICComponentManager([DNNFaceDetectionComponent])
 
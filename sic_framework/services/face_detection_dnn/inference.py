@@ -0,0 +1,661 @@
+"""
+Batched inference for the DNN face detection component. Frames from all connected cameras (and requests) are
+collected by BatchedInference and detected by YoloFaceDetector in one forward pass. Imports torch, so it is only
+imported when the component is started.
+
+The model runs in eager PyTorch, as TorchScript or in ONNX Runtime (see the backends below). Export a checkpoint to
+a TorchScript or ONNX artifact for a fixed input size (height width) to skip the conversion when the service starts:
+
+    python -m sic_framework.services.face_detection_dnn.inference yolov7-face.pt yolov7-face.onnx --img-size 480 640
+"""
+
+import argparse
+import concurrent.futures
+import inspect
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+import cv2
+import numpy as np
+import torch
+
+from sic_framework.core.message_python2 import BoundingBoxesMessage
+from sic_framework.services.face_detection_dnn.utils_importable.experimental import (
+    attempt_load,
+)
+from sic_framework.services.face_detection_dnn.utils_importable.general import (
+    non_max_suppression,
+)
+
+
+class BatchedInference(object):
+    """
+    Collects the items submitted by multiple threads, such as the callback threads of the channels connected to a
+    component, into batches that are processed with a single call. A batch is processed when it holds max_batch_size
+    items, or max_delay seconds after its first item arrived. Items that arrive while a batch is processed form the
+    next batch, so the batches grow with the number of streams when processing is the bottleneck.
+    """
+
+    def __init__(self, process_batch, max_batch_size=4, max_delay=0.01, name=None):
+        """
+        :param process_batch: function from a list of items to the list of their results
+        :param max_batch_size: the maximum number of items per batch
+        :param max_delay: the maximum time to wait for more items to fill a batch, in seconds
+        :param name: the name of the thread processing the batches
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name=name or "batched_inference"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        :return: a concurrent.futures.Future of the result of the item
+        """
+        future = concurrent.futures.Future()
+        if self._closed:
+            future.set_exception(RuntimeError("The batched inference is closed"))
+        else:
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+
+    def _next_batch(self):
+        """
+        :return: the next list of (item, future), or None when closed
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.time() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            try:
+                timeout = deadline - time.time()
+                if timeout > 0:
+                    entry = self._queue.get(timeout=timeout)
+                else:
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # process what was submitted before closing, then stop
+                self._queue.put(None)
+                break
+            batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+        # fail the items that were submitted while closing
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                entry[1].set_exception(RuntimeError("The batched inference is closed"))
+
+
+class TorchBackend(object):
+    """
+    The PyTorch checkpoint in eager mode, with the convolutions and batch norms fused (see attempt_load). Accepts any
+    input size that is a multiple of the model stride, and is the only backend that supports augment.
+    """
+
+    name = "torch"
+
+    def __init__(self, model):
+        self.model = model
+
+    def input_shape(self, shape):
+        """
+        :param shape: the (height, width) the images of a batch fit in
+        :return: the (height, width) to letterbox the batch to
+        """
+        return shape
+
+    def __call__(self, images, augment=False):
+        """
+        :param images: Bx3xHxW float tensor
+        :return: BxNx(6 + 3 * keypoints) tensor of the predictions
+        """
+        with torch.no_grad():
+            return self.model(images, augment=augment)[0]
+
+
+class _Predictions(torch.nn.Module):
+    """
+    The model with only the predictions as output, to trace and export.
+    """
+
+    def __init__(self, model):
+        super(_Predictions, self).__init__()
+        self.model = model
+
+    def forward(self, images):
+        return self.model(images)[0]
+
+
+class TorchScriptBackend(object):
+    """
+    The model traced to TorchScript, which runs without the python overhead of the eager model. A trace only works
+    for the input size it was traced with (the batch size may vary), so all images are letterboxed to that size.
+    """
+
+    name = "torchscript"
+
+    def __init__(self, module, shape):
+        """
+        :param module: the traced model
+        :param shape: the input (height, width) it was traced with
+        """
+        self.module = module
+        self.shape = tuple(shape)
+
+    @classmethod
+    def trace(cls, model, shape):
+        """
+        Trace the eager model for the input (height, width), which takes a few seconds on CPU.
+        """
+        shape = tuple(shape)
+        example = torch.zeros((1, 3) + shape, device=next(model.parameters()).device)
+        with torch.no_grad():
+            # run the model once to compute its grids for this input size, which are constants in the trace
+            model(example)
+            module = torch.jit.trace(_Predictions(model).eval(), example)
+        return cls(torch.jit.freeze(module), shape)
+
+    @classmethod
+    def load(cls, path, device):
+        extra_files = {"input_shape": ""}
+        module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        if not extra_files["input_shape"]:
+            raise ValueError(
+                "{} does not store its input size, export it with this module".format(
+                    path
+                )
+            )
+        return cls(module, json.loads(extra_files["input_shape"]))
+
+    def save(self, path):
+        torch.jit.save(
+            self.module, path, _extra_files={"input_shape": json.dumps(self.shape)}
+        )
+
+    def input_shape(self, shape):
+        return self.shape
+
+    def __call__(self, images, augment=False):
+        with torch.no_grad():
+            return self.module(images)
+
+
+class ONNXBackend(object):
+    """
+    The model in ONNX Runtime, usually the fastest on CPU. Optionally with dynamic int8 quantization of the weights
+    (ConvInteger), which makes the model four times smaller but is only faster on CPUs with fast int8 instructions
+    (VNNI). Like TorchScriptBackend, an exported model only works for one input size.
+    """
+
+    name = "onnx"
+
+    def __init__(self, session, shape, quantize=False):
+        """
+        :param session: the onnxruntime.InferenceSession
+        :param shape: the input (height, width) of the model, or None if the input size is dynamic
+        :param quantize: whether the model is quantized
+        """
+        self.session = session
+        self.shape = tuple(shape) if shape is not None else None
+        self.quantize = quantize
+        if quantize:
+            self.name = "onnx-int8"
+
+    @staticmethod
+    def is_available():
+        try:
+            import onnxruntime
+        except ImportError:
+            return False
+        return True
+
+    @staticmethod
+    def _session(model):
+        """
+        :param model: the path to or the bytes of an ONNX model
+        """
+        import onnxruntime
+
+        return onnxruntime.InferenceSession(
+            model, providers=onnxruntime.get_available_providers()
+        )
+
+    @classmethod
+    def load(cls, path, quantize=False):
+        if quantize:
+            with open(path, "rb") as f:
+                model = cls._quantized(f.read())
+        else:
+            model = path
+
+        session = cls._session(model)
+        shape = session.get_inputs()[0].shape[2:]
+        # named dimensions are dynamic
+        shape = shape if all(isinstance(d, int) for d in shape) else None
+        return cls(session, shape, quantize=quantize)
+
+    @classmethod
+    def from_model(cls, model, shape, quantize=False):
+        """
+        Export the eager model for the input (height, width), which takes a few seconds on CPU.
+        """
+        return cls(
+            cls._session(cls.export(model, shape, quantize)), shape, quantize=quantize
+        )
+
+    @staticmethod
+    def _quantized(model):
+        """
+        :param model: the bytes of an ONNX model
+        :return: the bytes of the model with int8 weights
+        """
+        from onnxruntime.quantization import quantize_dynamic
+
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, "model.onnx"), "wb") as f:
+                f.write(model)
+            quantize_dynamic(
+                os.path.join(directory, "model.onnx"),
+                os.path.join(directory, "model.int8.onnx"),
+            )
+            with open(os.path.join(directory, "model.int8.onnx"), "rb") as f:
+                return f.read()
+        finally:
+            shutil.rmtree(directory)
+
+    @classmethod
+    def export(cls, model, shape, quantize=False):
+        """
+        :return: the bytes of the eager model exported for this input size, with a dynamic batch size
+        """
+        example = torch.zeros(
+            (1, 3) + tuple(shape), device=next(model.parameters()).device
+        )
+        kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            # the dynamo exporter requires onnxscript
+            kwargs["dynamo"] = False
+
+        f = io.BytesIO()
+        with torch.no_grad():
+            model(example)
+            torch.onnx.export(
+                _Predictions(model).eval(),
+                example,
+                f,
+                input_names=["images"],
+                output_names=["output"],
+                opset_version=12,
+                dynamic_axes={"images": {0: "batch"}, "output": {0: "batch"}},
+                **kwargs
+            )
+        onnx_model = f.getvalue()
+        return cls._quantized(onnx_model) if quantize else onnx_model
+
+    def input_shape(self, shape):
+        return self.shape or shape
+
+    def __call__(self, images, augment=False):
+        output = self.session.run(
+            None, {self.session.get_inputs()[0].name: images.cpu().numpy()}
+        )[0]
+        return torch.from_numpy(output).to(images.device)
+
+
+BACKENDS = ("auto", TorchBackend.name, TorchScriptBackend.name, ONNXBackend.name)
+
+# the input (height, width) to convert models to if none is given
+DEFAULT_INPUT_SHAPE = (480, 640)
+
+
+def _is_torchscript(path):
+    """
+    TorchScript archives contain the code of the model, checkpoints only pickled objects.
+    """
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        return any(name.endswith("/constants.pkl") for name in archive.namelist())
+
+
+def load_backends(
+    model_path, backend="auto", quantize=False, device="cpu", input_shape=None
+):
+    """
+    Load a YOLOv7-face model as the candidate backends to run it with. Checkpoints are traced and exported for one
+    fixed input size here, and not for every new size of the images during inference, as that takes seconds.
+    :param model_path: the path to a PyTorch checkpoint, a TorchScript artifact or an ONNX (.onnx) artifact
+    :param backend: one of BACKENDS, "auto" converts a checkpoint to all backends that are available
+    :param quantize: whether to quantize ONNX models to int8, for "auto" in addition to the float model
+    :param device: the torch device
+    :param input_shape: the input (height, width) to convert a checkpoint for, rounded up to a multiple of the model
+                        stride. DEFAULT_INPUT_SHAPE if None.
+    :return: the list of backends
+    """
+    if backend not in BACKENDS:
+        raise ValueError(
+            "Unknown backend {}, choose one of {}".format(backend, ", ".join(BACKENDS))
+        )
+
+    if model_path.endswith(".onnx"):
+        if backend not in ("auto", ONNXBackend.name):
+            raise ValueError("An ONNX model can only run with the onnx backend")
+        return [ONNXBackend.load(model_path, quantize=quantize)]
+
+    if _is_torchscript(model_path):
+        if backend not in ("auto", TorchScriptBackend.name):
+            raise ValueError(
+                "A TorchScript model can only run with the torchscript backend"
+            )
+        return [TorchScriptBackend.load(model_path, device)]
+
+    model = attempt_load(model_path, map_location=device)
+    stride = int(model.stride.max())
+    shape = tuple(
+        -(-d // stride) * stride for d in input_shape or DEFAULT_INPUT_SHAPE
+    )
+
+    backends = []
+    if backend in ("auto", TorchBackend.name):
+        backends.append(TorchBackend(model))
+    if backend in ("auto", TorchScriptBackend.name):
+        backends.append(TorchScriptBackend.trace(model, shape))
+    if backend == ONNXBackend.name:
+        backends.append(ONNXBackend.from_model(model, shape, quantize=quantize))
+    elif backend == "auto" and ONNXBackend.is_available():
+        backends.append(ONNXBackend.from_model(model, shape))
+        if quantize:
+            backends.append(ONNXBackend.from_model(model, shape, quantize=True))
+    return backends
+
+
+def export_model(model_path, output_path, input_shape, quantize=False):
+    """
+    Export a checkpoint to TorchScript, or to ONNX if the output path ends with .onnx, for a fixed input size.
+    :param input_shape: the input (height, width), multiples of 32
+    """
+    model = attempt_load(model_path, map_location="cpu")
+    if output_path.endswith(".onnx"):
+        with open(output_path, "wb") as f:
+            f.write(ONNXBackend.export(model, input_shape, quantize=quantize))
+    else:
+        TorchScriptBackend.trace(model, input_shape).save(output_path)
+
+
+class YoloFaceDetector(object):
+    """
+    YOLOv7-face on batches of images of any size. The images are letterboxed (resized keeping the aspect ratio, and
+    padded) to a common size, detected in one forward pass, and the detections are scaled back to each image.
+    """
+
+    # the color images are padded with, as in training
+    PAD_COLOR = (114, 114, 114)
+    # the input size to convert the model to and compare the speed of the backends with if none is given
+    DEFAULT_INPUT_SHAPE = DEFAULT_INPUT_SHAPE
+
+    def __init__(
+        self,
+        model_path,
+        backend="auto",
+        quantize=False,
+        input_shape=None,
+        device=None,
+        logger=None,
+    ):
+        """
+        :param model_path: the path to a YOLOv7-face checkpoint (.pt), TorchScript artifact or ONNX artifact (.onnx)
+        :param backend: the backend to run the model with, see load_backends. "auto" uses the fastest.
+        :param quantize: quantize ONNX models to int8
+        :param input_shape: the (height, width) of the model input, e.g. the resize_to of the configuration, to
+                            convert a checkpoint to TorchScript and ONNX for and to compare the backends with
+        :param device: the torch device to run on, by default a GPU if available
+        :param logger: the logger to report the chosen backend to
+        """
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.logger = logger or logging.getLogger(__name__)
+
+        input_shape = input_shape or self.DEFAULT_INPUT_SHAPE
+        backends = load_backends(
+            model_path, backend, quantize, self.device, input_shape=input_shape
+        )
+        self.stride = 32
+        for candidate in backends:
+            if isinstance(candidate, TorchBackend):
+                self.stride = int(candidate.model.stride.max())
+
+        if len(backends) > 1:
+            # the converted backends only run at the (rounded up) input size they were converted for
+            input_shape = [-(-d // self.stride) * self.stride for d in input_shape]
+            self.backend = self.fastest(backends, input_shape)
+        else:
+            self.backend = backends[0]
+        self.logger.info(
+            "Running the face detection model with {}".format(self.backend.name)
+        )
+
+    def fastest(self, backends, input_shape, repeat=3):
+        """
+        :return: the backend with the lowest latency for an image of the input (height, width)
+        """
+        images = torch.zeros((1, 3) + tuple(input_shape), device=self.device)
+        latencies = []
+        for backend in backends:
+            # warm up, the first call is slower
+            backend(images)
+            start = time.time()
+            for _ in range(repeat):
+                backend(images)
+            latencies.append((time.time() - start) / repeat)
+
+        self.logger.info(
+            "Face detection latency per backend: {}".format(
+                ", ".join(
+                    "{} {:.1f}ms".format(b.name, t * 1000)
+                    for b, t in zip(backends, latencies)
+                )
+            )
+        )
+        return backends[int(np.argmin(latencies))]
+
+    def letterbox(self, images, resize_to=None):
+        """
+        Letterbox the images to the smallest common size that is a multiple of the model stride, or to the input size
+        of the backend if it is fixed (scaling down images that do not fit).
+        :param images: list of HxWx3 uint8 images
+        :param resize_to: if not None, first resize the images (keeping the aspect ratio) to fit (height, width)
+        :return: tuple of the batch tensor, and the (scale, (left padding, top padding)) of each image
+        """
+        scales = []
+        for image in images:
+            h, w = image.shape[:2]
+            if resize_to is not None:
+                scales.append(min(resize_to[0] / h, resize_to[1] / w))
+            else:
+                scales.append(1.0)
+
+        sizes = [
+            (int(round(image.shape[0] * s)), int(round(image.shape[1] * s)))
+            for image, s in zip(images, scales)
+        ]
+        batch_h = -(-max(h for h, _ in sizes) // self.stride) * self.stride
+        batch_w = -(-max(w for _, w in sizes) // self.stride) * self.stride
+
+        input_shape = tuple(self.backend.input_shape((batch_h, batch_w)))
+        if input_shape != (batch_h, batch_w):
+            batch_h, batch_w = input_shape
+            for i, (h, w) in enumerate(sizes):
+                scales[i] *= min(1.0, batch_h / h, batch_w / w)
+            sizes = [
+                (
+                    min(batch_h, int(round(image.shape[0] * s))),
+                    min(batch_w, int(round(image.shape[1] * s))),
+                )
+                for image, s in zip(images, scales)
+            ]
+
+        batch = np.empty((len(images), batch_h, batch_w, 3), dtype=np.uint8)
+        ratio_pads = []
+        for i, (image, (h, w)) in enumerate(zip(images, sizes)):
+            if image.shape[:2] != (h, w):
+                image = cv2.resize(image, (w, h), interpolation=cv2.INTER_LINEAR)
+            top, left = (batch_h - h) // 2, (batch_w - w) // 2
+            batch[i] = self.PAD_COLOR
+            batch[i, top : top + h, left : left + w] = image
+            ratio_pads.append((scales[i], (left, top)))
+
+        tensor = torch.from_numpy(batch).to(self.device).permute(0, 3, 1, 2).float()
+        return tensor / 255.0, ratio_pads
+
+    def detect(self, images, params):
+        """
+        :param images: list of HxWx3 uint8 images
+        :param params: a DNNFaceDetectionConf
+        :return: a BoundingBoxesMessage per image
+        """
+        image_tensor, ratio_pads = self.letterbox(images, params.resize_to)
+
+        pred = self.backend(image_tensor, augment=params.augment)
+
+        # Apply NMS
+        pred = non_max_suppression(
+            pred,
+            params.conf_threshold,
+            params.iou_threshold,
+            classes=params.classes,
+            agnostic=params.agnostic_nms,
+            kpt_label=params.kpt_label,
+        )
+
+        return self._to_messages(pred, images, ratio_pads, params.kpt_label or 0)
+
+    def _to_messages(self, pred, images, ratio_pads, n_keypoints):
+        """
+        Scale the detections of all images back to their image at once, and convert them to messages with a single
+        transfer from the device.
+        :param pred: the NMS output, a (N, 6 + 3 * n_keypoints) tensor of xyxy, conf, cls, keypoints per image
+        :return: a BoundingBoxesMessage per image
+        """
+        n_columns = 6 + 3 * n_keypoints
+        # images without detections have no keypoint columns
+        pred = [det if len(det) else det.new_zeros((0, n_columns)) for det in pred]
+        counts = [len(det) for det in pred]
+        det = torch.cat(pred)
+
+        # the scale, padding and size of the image of each detection
+        per_image = torch.tensor(
+            [
+                (scale, left, top, image.shape[1], image.shape[0])
+                for image, (scale, (left, top)) in zip(images, ratio_pads)
+            ],
+            dtype=det.dtype,
+            device=det.device,
+        )
+        per_detection = per_image.repeat_interleave(
+            torch.tensor(counts, device=det.device), dim=0
+        )
+        scale = per_detection[:, None, 0:1]
+        pad = per_detection[:, None, 1:3]
+        size = per_detection[:, None, 3:5]
+
+        # the two corners of the box followed by the keypoints, as (N, 2 + n_keypoints, 2) x and y
+        keypoints = det[:, 6:].view(len(det), n_keypoints, 3)
+        points = torch.cat((det[:, :4].view(len(det), 2, 2), keypoints[..., :2]), 1)
+        points = torch.min(((points - pad) / scale).clamp(min=0), size)
+
+        result = torch.cat(
+            (
+                points[:, 0].trunc(),
+                (points[:, 1] - points[:, 0]).trunc(),
+                det[:, 4:5],
+                torch.cat((points[:, 2:], keypoints[..., 2:]), 2).view(
+                    len(det), 3 * n_keypoints
+                ),
+            ),
+            1,
+        )
+        result = result.cpu().numpy()
+
+        messages = []
+        for rows in np.split(result, np.cumsum(counts)[:-1]):
+            # boxes in the padding of smaller images of the batch are empty once clipped to the image
+            rows = rows[(rows[:, 2] > 0) & (rows[:, 3] > 0)]
+            messages.append(
+                BoundingBoxesMessage.from_array(
+                    rows[:, :4],
+                    confidences=rows[:, 4],
+                    keypoints=rows[:, 5:] if n_keypoints else None,
+                )
+            )
+        return messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export a YOLOv7-face checkpoint to TorchScript, or to ONNX if "
+        "the output ends with .onnx"
+    )
+    parser.add_argument("weights", help="Path to the checkpoint (e.g., yolov7-face.pt)")
+    parser.add_argument("output", help="Path to the exported model")
+    parser.add_argument(
+        "--img-size",
+        type=int,
+        nargs=2,
+        default=list(YoloFaceDetector.DEFAULT_INPUT_SHAPE),
+        help="the input height and width, multiples of 32",
+    )
+    parser.add_argument(
+        "--quantize", action="store_true", help="quantize the ONNX model to int8"
+    )
+    args = parser.parse_args()
+
+    export_model(args.weights, args.output, args.img_size, quantize=args.quantize)
@@ -1,5 +1,7 @@
 # This file contains experimental modules
 
+import inspect
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -135,7 +137,11 @@ def attempt_load(weights, map_location=None, inplace=True):
     model = Ensemble()
     for w in weights if isinstance(weights, list) else [weights]:
         attempt_download(w)
-        ckpt = torch.load(w, map_location=map_location)  # load
+        # the checkpoint pickles the model, which torch >= 2.6 does not load by default
+        if "weights_only" in inspect.signature(torch.load).parameters:
+            ckpt = torch.load(w, map_location=map_location, weights_only=False)
+        else:
+            ckpt = torch.load(w, map_location=map_location)  # load
         model.append(
             ckpt["ema" if ckpt.get("ema") else "model"].float().fuse().eval()
         )  # FP32 model
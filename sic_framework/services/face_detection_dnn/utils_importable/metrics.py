@@ -2,7 +2,6 @@
 
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 import torch
 
@@ -165,6 +164,7 @@ class ConfusionMatrix:
 
     def plot(self, save_dir="", names=()):
         try:
+            import matplotlib.pyplot as plt
             import seaborn as sn
 
             array = self.matrix / (
@@ -203,6 +203,8 @@ class ConfusionMatrix:
 
 def plot_pr_curve(px, py, ap, save_dir="pr_curve.png", names=()):
     # Precision-recall curve
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(1, 1, figsize=(9, 6), tight_layout=True)
     py = np.stack(py, axis=1)
 
@@ -233,6 +235,8 @@ def plot_mc_curve(
     px, py, save_dir="mc_curve.png", names=(), xlabel="Confidence", ylabel="Metric"
 ):
     # Metric-confidence curve
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(1, 1, figsize=(9, 6), tight_layout=True)
 
     if 0 < len(names) < 21:  # display per-class legend if < 21 classes
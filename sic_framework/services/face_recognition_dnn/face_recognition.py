@@ -2,12 +2,8 @@ import argparse
 import collections
 import os
 
-import cv2
 import numpy as np
-import torch
-import torchvision
 from numpy import array
-from sklearn.neighbors import KNeighborsClassifier
 
 from sic_framework.core.component_manager_python2 import SICComponentManager
 from sic_framework.core.connector import SICConnector
@@ -30,6 +26,12 @@ class DNNFaceRecognitionComponent(SICService):
 
     def __init__(self, *args, **kwargs):
         super(DNNFaceRecognitionComponent, self).__init__(*args, **kwargs)
+
+        # import the heavy dependencies when the component is started, importing the connector should be fast
+        import cv2
+        import torch
+        from sklearn.neighbors import KNeighborsClassifier
+
         self.save_image = False
         self.img_timestamp = None
 
@@ -89,6 +91,9 @@ class DNNFaceRecognitionComponent(SICService):
         return self.detect(request.image)
 
     def detect(self, image):
+        import cv2
+        import torchvision
+
         id = 0
 
         img = array(image)[:, :, ::-1].astype(np.uint8)
@@ -102,7 +107,7 @@ class DNNFaceRecognitionComponent(SICService):
             minSize=(int(self.minW), int(self.minH)),
         )
 
-        faces = []
+        ids = []
 
         for x, y, w, h in face_boxes:
             face = img[y : y + h, x : x + w, :]
@@ -139,11 +144,9 @@ class DNNFaceRecognitionComponent(SICService):
             self.ids.append(id)
             self.classifier.fit(feat_hist_arr, self.ids)
 
-            face = BoundingBox(x, y, w, h, identifier=id)
-
-            faces.append(face)
+            ids.append(id)
 
-        return BoundingBoxesMessage(faces)
+        return BoundingBoxesMessage.from_array(face_boxes, identifiers=ids)
 
 
 class DNNFaceRecognition(SICConnector):
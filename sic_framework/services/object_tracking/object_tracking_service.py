@@ -38,25 +38,21 @@ class ObjectTrackingService(SICService):
     def execute(self, inputs):
         message = inputs.get(BoundingBoxesMessage)
 
-        detection_bboxes = []
+        boxes = message.boxes
+        xyxy = np.stack(
+            [boxes["x"], boxes["y"], boxes["x"] + boxes["w"], boxes["y"] + boxes["h"]],
+            axis=1,
+        )
 
-        for bbox in message.bboxes:
-            detection_bboxes.append(
-                Detection([bbox.x, bbox.y, bbox.x + bbox.w, bbox.y + bbox.h])
-            )
-
-        self.tracker.step(detection_bboxes)
+        self.tracker.step([Detection(box) for box in xyxy])
 
         tracks = self.tracker.active_tracks()
 
-        filtered_bboxes = []
-        for track in tracks:
-            xmin, ymin, xmax, ymax = track.box.astype(np.int)
-
-            bbox = BoundingBox(xmin, ymin, xmax - xmin, ymax - ymin, track.id[:8])
-            filtered_bboxes.append(bbox)
-
-        return BoundingBoxesMessage(filtered_bboxes)
+        xyxy = np.array([track.box for track in tracks]).reshape(-1, 4).astype(int)
+        return BoundingBoxesMessage.from_array(
+            np.concatenate([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]], axis=1),
+            identifiers=[track.id[:8] for track in tracks],
+        )
 
 
 if __name__ == "__main__":
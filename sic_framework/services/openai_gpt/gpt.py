@@ -72,6 +72,9 @@ class GPTComponent(SICComponent):
     Dummy SICAction
     """
 
+    # requests only wait for the OpenAI API, handle those of several clients at once
+    REQUEST_CONCURRENCY = 4
+
     def __init__(self, *args, **kwargs):
         super(GPTComponent, self).__init__(*args, **kwargs)
         self.client = OpenAI(api_key=self.params.openai_key)
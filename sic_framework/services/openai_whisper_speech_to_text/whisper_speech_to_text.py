@@ -93,6 +93,9 @@ class WhisperComponent(SICComponent):
 
         self.parameters_are_inferred = False
 
+        # the last audio chunk received, to detect lost chunks
+        self.last_audio = None
+
         self.i = 0
 
     @staticmethod
@@ -118,6 +121,15 @@ class WhisperComponent(SICComponent):
                 )
             )
 
+        missed = message.count_missed_chunks(self.last_audio)
+        if missed:
+            self.logger.warning(
+                "Lost {} audio chunk(s), the transcript might be incomplete".format(
+                    missed
+                )
+            )
+        self.last_audio = message
+
         self.source.stream.write(message.waveform)
 
     def on_request(self, request):
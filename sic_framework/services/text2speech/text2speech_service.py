@@ -69,6 +69,12 @@ class SpeechResult(AudioMessage):
     This message contains the synthesized audio using AudioMessage's format.
     """
 
+    # the WAV file is mostly PCM audio as well
+    _field_codecs = dict(
+        AudioMessage._field_codecs,
+        wav_audio=("pcm16-zstd", "pcm16-zlib", "zstd", "zlib"),
+    )
+
     def __init__(self, wav_audio):
         """
         :param wav_audio: synthesized audio
@@ -0,0 +1,68 @@
+"""
+Tests of the SICMessage types and their serialization. Do not require redis.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+import numpy as np
+
+from sic_framework.core.message_python2 import (
+    BoundingBoxesMessage,
+    SICMessage,
+    UncompressedImageMessage,
+)
+
+
+class TestSerializeCache(unittest.TestCase):
+    def test_reassigning_a_field_changed_in_place(self):
+        message = UncompressedImageMessage(np.zeros((4, 4, 3), dtype=np.uint8))
+        message.serialize()
+
+        # as documented in SICMessage.serialize, assigning the field again invalidates the cached message
+        message.image[0, 0] = 255
+        message.image = message.image
+
+        received = SICMessage.deserialize(message.serialize())
+        self.assertEqual(received.image[0, 0].tolist(), [255, 255, 255])
+
+    def test_reassigning_the_same_name_keeps_the_cache(self):
+        message = UncompressedImageMessage(np.zeros((4, 4, 3), dtype=np.uint8))
+        message._previous_component_name = "Camera"
+        data = message.serialize()
+
+        message._previous_component_name = message._previous_component_name
+        self.assertIs(message.serialize(), data)
+
+
+class TestBoundingBoxesMessage(unittest.TestCase):
+    def test_empty_detection_with_keypoints(self):
+        # a detector with 5 keypoints per box that found no faces, e.g. rows[:, 5:] of an empty detection
+        rows = np.zeros((0, 20), dtype=np.float32)
+        message = BoundingBoxesMessage.from_array(
+            rows[:, :4], confidences=rows[:, 4], keypoints=rows[:, 5:]
+        )
+
+        self.assertEqual(len(message.boxes), 0)
+        self.assertEqual(message.boxes["keypoints"].shape, (0, 5, 3))
+        self.assertEqual(message.bboxes, [])
+
+        received = SICMessage.deserialize(message.serialize())
+        self.assertEqual(len(received.boxes), 0)
+        self.assertEqual(received.bboxes, [])
+
+    def test_flat_keypoints(self):
+        rows = np.arange(2 * 20, dtype=np.float32).reshape(2, 20)
+        message = BoundingBoxesMessage.from_array(
+            rows[:, :4], confidences=rows[:, 4], keypoints=rows[:, 5:]
+        )
+
+        self.assertEqual(message.boxes["keypoints"].shape, (2, 5, 3))
+        np.testing.assert_array_equal(
+            message.bboxes[1].keypoints, rows[1, 5:].reshape(5, 3)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
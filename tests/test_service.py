@@ -0,0 +1,90 @@
+"""
+Tests of how SICService buffers and aligns the messages of its inputs. Do not require redis.
+
+    python -m unittest discover tests
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+from sic_framework.core.message_python2 import SICMessage
+from sic_framework.core.service_python2 import (
+    SYNC_LATEST_ONLY,
+    SICService,
+    TimestampBuffer,
+)
+
+
+class RobotMessage(SICMessage):
+    pass
+
+
+class DesktopMessage(SICMessage):
+    pass
+
+
+class LatestOnlyService(SICService):
+    SYNC_POLICY = SYNC_LATEST_ONLY
+
+    @staticmethod
+    def get_inputs():
+        return [RobotMessage, DesktopMessage]
+
+    def execute(self, inputs):
+        pass
+
+
+def make_service(service_class):
+    # only the input buffers, without connecting to redis
+    service = service_class.__new__(service_class)
+    service.logger = mock.MagicMock()
+    service._input_buffers = dict()
+    service._input_buffers_lock = threading.Lock()
+    service._input_condition = threading.Condition(service._input_buffers_lock)
+    service._new_data = False
+    return service
+
+
+def make_message(message_class, timestamp):
+    message = message_class()
+    message._timestamp = timestamp
+    return message
+
+
+class TestInputBuffers(unittest.TestCase):
+    def test_inputs_with_different_clocks(self):
+        # the clock of the robot lags far behind the clock of the desktop
+        service = make_service(LatestOnlyService)
+        lag = 10 * service.MAX_MESSAGE_AGE_IN_SECONDS
+
+        for i in range(5):
+            service.on_message(make_message(RobotMessage, 1000.0 + i - lag))
+            service.on_message(make_message(DesktopMessage, 1000.0 + i))
+
+        inputs, _ = service._pop_messages()
+        self.assertEqual(inputs.get(RobotMessage)._timestamp, 1004.0 - lag)
+        self.assertEqual(inputs.get(DesktopMessage)._timestamp, 1004.0)
+
+    def test_buffer_is_evicted_by_age(self):
+        service = make_service(LatestOnlyService)
+
+        for i in range(10):
+            service.on_message(make_message(RobotMessage, float(i)))
+
+        buffer = service._input_buffers[(RobotMessage.get_message_name(), "")]
+        self.assertEqual(buffer.timestamps[0], 9.0 - service.MAX_MESSAGE_AGE_IN_SECONDS)
+
+    def test_buffer_length_is_bounded(self):
+        buffer = TimestampBuffer(mock.MagicMock(), maxlen=5)
+
+        # messages with the same timestamp are never evicted by age
+        for _ in range(20):
+            buffer.insert(make_message(RobotMessage, 1.0))
+
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(buffer.dropped_messages_counter, 15)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Tests of SICRedis against a running redis server (see conf/redis/redis.conf). Skipped if redis is not reachable.
+
+    python -m unittest discover tests
+"""
+
+import threading
+import unittest
+
+import numpy as np
+
+from sic_framework.core import sic_redis
+from sic_framework.core.message_python2 import (
+    CompressedImageMessage,
+    SICMessage,
+    UncompressedImageMessage,
+)
+from sic_framework.core.sic_redis import SICRedis
+
+
+def make_frame(width=640, height=480):
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([x + 0 * y, 0 * x + y, (x + y) / 2], axis=-1)
+    return frame.astype(np.uint8)
+
+
+class TestSendMessageFanOut(unittest.TestCase):
+    """
+    A message sent to several channels is encoded once, not once per channel.
+    """
+
+    N_CHANNELS = 4
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            sic_redis.get_connection_pool()
+        except Exception as e:
+            raise unittest.SkipTest("redis is not available: {}".format(e))
+
+    def setUp(self):
+        # send through redis, as in-process subscribers and shared memory skip the encoding
+        self.in_process_delivery = sic_redis.IN_PROCESS_DELIVERY
+        self.shared_memory = sic_redis.SHARED_MEMORY
+        sic_redis.IN_PROCESS_DELIVERY = False
+        sic_redis.SHARED_MEMORY = False
+
+        self.sender = SICRedis(parent_name="test_fan_out_sender")
+        self.receiver = SICRedis(parent_name="test_fan_out_receiver")
+        self.channels = [
+            "test:fan_out:{}:{}".format(self.receiver._client_id, i)
+            for i in range(self.N_CHANNELS)
+        ]
+
+        self.received = []
+        self.all_received = threading.Event()
+
+        def on_message(message, channel):
+            self.received.append(channel)
+            if len(self.received) == self.N_CHANNELS:
+                self.all_received.set()
+
+        for channel in self.channels:
+            self.receiver.register_message_handler(
+                channel, lambda message, channel=channel: on_message(message, channel)
+            )
+
+        self.n_frames = 0
+        self.n_jpeg = 0
+        self.serialize_frame = SICMessage._serialize_frame
+        self.np2jpeg = SICMessage.np2jpeg
+
+        def counting_serialize_frame(message, *args, **kwargs):
+            self.n_frames += 1
+            return self.serialize_frame(message, *args, **kwargs)
+
+        def counting_np2jpeg(inp):
+            self.n_jpeg += 1
+            return self.np2jpeg(inp)
+
+        SICMessage._serialize_frame = counting_serialize_frame
+        SICMessage.np2jpeg = staticmethod(counting_np2jpeg)
+
+    def tearDown(self):
+        SICMessage._serialize_frame = self.serialize_frame
+        SICMessage.np2jpeg = staticmethod(self.np2jpeg)
+        self.sender.close()
+        self.receiver.close()
+        sic_redis.IN_PROCESS_DELIVERY = self.in_process_delivery
+        sic_redis.SHARED_MEMORY = self.shared_memory
+
+    def send_to_all(self, message):
+        for channel in self.channels:
+            self.assertEqual(self.sender.send_message(channel, message), 1)
+
+        self.assertTrue(self.all_received.wait(10))
+        self.assertEqual(sorted(self.received), sorted(self.channels))
+
+    def test_compressed_image_is_encoded_once(self):
+        self.send_to_all(CompressedImageMessage(make_frame()))
+
+        self.assertEqual(self.n_frames, 1)
+        self.assertEqual(self.n_jpeg, 1)
+
+    def test_compressed_fields_are_encoded_once(self):
+        # the fields listed in _field_codecs are compressed with the codecs of the subscribers of each channel
+        self.send_to_all(UncompressedImageMessage(make_frame()))
+
+        self.assertEqual(self.n_frames, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()